@@ -1,2 +1,9 @@
 """Police Academy backend package."""
 
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# 自动加载项目根目录下的 .env（方便本地运行时无需手动导出环境变量）。放在包初始化里，
+# uvicorn 与 ``python -m app.seed`` 等命令行入口都会在读取配置的模块之前执行到这里
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / ".env")
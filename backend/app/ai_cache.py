@@ -0,0 +1,151 @@
+"""Context / answer caches for the AI assistant.
+
+两级缓存，均为进程内 LRU + TTL：
+
+- 上下文缓存：``weekly_report`` / ``risk_courses`` 的结构化快照，按
+  (任务, 参数, 数据版本) 缓存。数据版本是 ``dashboard_counters`` 里的
+  ``ai:data`` 行，成绩、考试的写接口在同一事务内递增，多 worker 下同样失效；
+  TTL 兜底其它不走版本号的数据（学生数、课程数等计数）。
+- 答案缓存：键为 sha256(system prompt, 上下文, 用户问题, 模型)。上下文里已包含
+  快照数据，数据变化后键自然不同。
+
+请求带 ``no_cache`` 时跳过读取，但仍用新结果回填缓存。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import counters
+
+AI_CONTEXT_CACHE_SIZE = int(os.getenv("AI_CONTEXT_CACHE_SIZE", "256"))
+AI_CONTEXT_CACHE_TTL = float(os.getenv("AI_CONTEXT_CACHE_TTL", "300"))
+AI_ANSWER_CACHE_SIZE = int(os.getenv("AI_ANSWER_CACHE_SIZE", "512"))
+AI_ANSWER_CACHE_TTL = float(os.getenv("AI_ANSWER_CACHE_TTL", "1800"))
+VERSION = "ai:data"
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU with per-entry TTL; ``ttl <= 0`` or ``max_size <= 0`` disables caching."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, key: Hashable) -> Any:
+        """未命中返回 ``_MISSING``（缓存值本身可能是 None / 空列表）。"""
+        if not self.enabled:
+            return _MISSING
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+class AIAssistantCache:
+    def __init__(self):
+        self.contexts = TTLCache(AI_CONTEXT_CACHE_SIZE, AI_CONTEXT_CACHE_TTL)
+        self.answers = TTLCache(AI_ANSWER_CACHE_SIZE, AI_ANSWER_CACHE_TTL)
+        self.bypassed = 0
+
+    # -- 上下文 -------------------------------------------------------------
+    def context(
+        self,
+        db: Session,
+        task: str,
+        params: Optional[Dict[str, Any]],
+        build: Callable[[], Any],
+        bypass: bool = False,
+    ) -> Tuple[Any, bool]:
+        """返回 (快照, 是否命中缓存)。"""
+        params = tuple(sorted((k, str(v)) for k, v in (params or {}).items() if v is not None))
+        key = (task, params, counters.read(db, VERSION))
+        if not bypass:
+            value = self.contexts.get(key)
+            if value is not _MISSING:
+                return value, True
+        value = build()
+        self.contexts.put(key, value)
+        return value, False
+
+    @staticmethod
+    def touch(db: Session) -> None:
+        """成绩 / 考试写入时在调用方事务内调用。"""
+        counters.bump(db, VERSION)
+
+    # -- 答案 ---------------------------------------------------------------
+    @staticmethod
+    def answer_key(messages: List[Dict[str, Any]], model: str) -> str:
+        payload = json.dumps(
+            [model, [(m["role"], m["content"]) for m in messages]], ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_answer(self, key: str, bypass: bool = False) -> Optional[str]:
+        if bypass:
+            self.bypassed += 1
+            return None
+        value = self.answers.get(key)
+        return None if value is _MISSING else value
+
+    def put_answer(self, key: str, answer: str) -> None:
+        if answer:
+            self.answers.put(key, answer)
+
+    def stats(self) -> dict:
+        return {"context": self.contexts.stats(), "answer": self.answers.stats(), "bypassed": self.bypassed}
+
+
+ai_cache = AIAssistantCache()
@@ -1,23 +1,193 @@
+"""Async client for the OpenAI-compatible AI backend.
+
+进程内只保留一个 ``AsyncOpenAI``（底层 httpx 连接池开启 keep-alive），请求不再占用
+线程池 worker。并发上限由信号量控制，排队超过 ``AI_QUEUE_TIMEOUT`` 秒返回 503；
+超时、连接错误、429 和 5xx 视为可重试错误，按指数退避 + 全抖动重试。
+
+``AI_BASE_URL`` 可以指向任何 OpenAI 兼容服务（本地调试可用 ``bench.ai_stub``）。
+``openai`` / ``httpx`` 在第一次调用时才导入，不拖慢进程启动。
+"""
+
+import asyncio
 import os
-from typing import List, Dict, Any
+import random
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
 
 from fastapi import HTTPException, status
-from openai import OpenAI
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+AI_BASE_URL = os.getenv("AI_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
+AI_MODEL = os.getenv("AI_MODEL", "doubao-seed-code-preview-251028")
+AI_CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", "5"))
+AI_READ_TIMEOUT = float(os.getenv("AI_READ_TIMEOUT", "60"))
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", "10"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+AI_RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", "0.5"))
+AI_RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", "8"))
+
+
+def is_transient(exc: Exception) -> bool:
+    from openai import APIConnectionError, APIStatusError, APITimeoutError, InternalServerError, RateLimitError
+
+    if isinstance(exc, (APITimeoutError, APIConnectionError, RateLimitError, InternalServerError)):
+        return True
+    return isinstance(exc, APIStatusError) and (exc.status_code == 429 or exc.status_code >= 500)
+
+
+def retry_delay(attempt: int, exc: Optional[Exception] = None) -> float:
+    """全抖动退避；服务端给了 Retry-After 时以它为下限。"""
+    delay = random.uniform(0, min(AI_RETRY_MAX_DELAY, AI_RETRY_BASE_DELAY * (2**attempt)))
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), AI_RETRY_MAX_DELAY))
+        except ValueError:
+            pass
+    return delay
+
+
+class AIClient:
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        max_concurrency: int = AI_MAX_CONCURRENCY,
+        http_client: Optional["httpx.AsyncClient"] = None,
+    ):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self._http_client = http_client
+        self._client: Optional["AsyncOpenAI"] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.retries = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    def _get_client(self) -> "AsyncOpenAI":
+        if self._client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            api_key = self.api_key or os.getenv("ARK_API_KEY")
+            if not api_key:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Missing ARK_API_KEY for AI assistant",
+                )
+            timeout = httpx.Timeout(AI_READ_TIMEOUT, connect=AI_CONNECT_TIMEOUT)
+            http_client = self._http_client or httpx.AsyncClient(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=60,
+                ),
+            )
+            self._client = AsyncOpenAI(
+                base_url=self.base_url or os.getenv("AI_BASE_URL", AI_BASE_URL),
+                api_key=api_key,
+                timeout=timeout,
+                max_retries=0,
+                http_client=http_client,
+            )
+        return self._client
+
+    @staticmethod
+    def model_id(model: Optional[str] = None) -> str:
+        return model or os.getenv("AI_MODEL", AI_MODEL)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _acquire(self) -> asyncio.Semaphore:
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=AI_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="AI assistant is busy, please retry later"
+            ) from None
+        return semaphore
+
+    async def _create(self, client: "AsyncOpenAI", **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return await client.chat.completions.create(**kwargs)
+            except Exception as exc:  # noqa: BLE001
+                if attempt < AI_MAX_RETRIES and is_transient(exc):
+                    await asyncio.sleep(retry_delay(attempt, exc))
+                    attempt += 1
+                    self.retries += 1
+                    continue
+                raise HTTPException(
+                    status_code=status.HTTP_502_BAD_GATEWAY, detail=f"AI request failed: {exc}"
+                ) from exc
+
+    async def chat(self, messages: List[Dict[str, Any]], model: Optional[str] = None) -> str:
+        client = self._get_client()
+        model_id = self.model_id(model)
+        semaphore = await self._acquire()
+        self.in_flight += 1
+        try:
+            resp = await self._create(client, model=model_id, messages=messages)
+            return resp.choices[0].message.content or ""
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    async def stream(self, messages: List[Dict[str, Any]], model: Optional[str] = None) -> AsyncIterator[str]:
+        """逐段产出模型输出。只在拿到首个分片前重试；调用方取消时关闭上游连接。"""
+        client = self._get_client()
+        model_id = self.model_id(model)
+        semaphore = await self._acquire()
+        self.in_flight += 1
+        upstream = None
+        try:
+            upstream = await self._create(client, model=model_id, messages=messages, stream=True)
+            async for chunk in upstream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled += 1
+            raise
+        except HTTPException:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"AI stream failed: {exc}") from exc
+        finally:
+            if upstream is not None:
+                await upstream.close()
+            self.in_flight -= 1
+            semaphore.release()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+        }
 
 
-def _get_client() -> OpenAI:
-    api_key = os.getenv("ARK_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Missing ARK_API_KEY for AI assistant")
-    base_url = os.getenv("AI_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
-    return OpenAI(base_url=base_url, api_key=api_key)
+ai_client = AIClient()
 
 
-def chat(messages: List[Dict[str, Any]], model: str | None = None) -> str:
-    client = _get_client()
-    model_id = model or os.getenv("AI_MODEL", "doubao-seed-code-preview-251028")
-    try:
-        resp = client.chat.completions.create(model=model_id, messages=messages)
-        return resp.choices[0].message.content or ""
-    except Exception as exc:  # noqa: BLE001
-        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"AI request failed: {exc}") from exc
+async def chat(messages: List[Dict[str, Any]], model: Optional[str] = None) -> str:
+    return await ai_client.chat(messages, model=model)
@@ -0,0 +1,73 @@
+"""Set-based teaching analytics queries shared by the API and the AI assistant."""
+
+from typing import Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app import models
+
+FAIL_SCORE = 60
+
+
+def course_risk(
+    db: Session,
+    term_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    major_id: Optional[int] = None,
+    class_keyword: Optional[str] = None,
+    limit: int = 5,
+) -> list[dict]:
+    """按课程统计挂科风险（不及格率），一次分组聚合 + ORDER BY ... LIMIT。
+
+    成绩取 total_score，缺失时回退 final_score；两者都为空的记录计入总数但不计入均分。
+    """
+    score = func.coalesce(models.Grade.total_score, models.Grade.final_score)
+    total = func.count(models.Grade.id)
+    fail_count = func.sum(case((score < FAIL_SCORE, 1), else_=0))
+    fail_ratio = fail_count * 100.0 / total
+    query = (
+        db.query(
+            models.Course.name,
+            models.Course.code,
+            models.Class.name,
+            models.Term.name,
+            func.avg(score),
+            fail_ratio.label("fail_ratio"),
+            fail_count,
+            total,
+        )
+        .join(models.Class, models.Course.class_id == models.Class.id)
+        .join(models.Term, models.Course.term_id == models.Term.id)
+        .join(models.Grade, models.Grade.course_id == models.Course.id)
+    )
+    if term_id:
+        query = query.filter(models.Course.term_id == term_id)
+    if class_id:
+        query = query.filter(models.Course.class_id == class_id)
+    if major_id:
+        query = query.filter(models.Course.major_id == major_id)
+    if class_keyword:
+        like_pattern = f"%{class_keyword}%"
+        query = query.filter(models.Class.name.like(like_pattern) | models.Class.code.like(like_pattern))
+    rows = (
+        query.group_by(
+            models.Course.id, models.Course.name, models.Course.code, models.Class.name, models.Term.name
+        )
+        .order_by(fail_ratio.desc(), models.Course.id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "course": course_name,
+            "course_code": course_code,
+            "class": class_name,
+            "term": term_name,
+            "avg_score": round(float(avg), 2) if avg is not None else None,
+            "fail_ratio": round(float(ratio), 2),
+            "fail_count": int(fails or 0),
+            "total": int(cnt),
+        }
+        for course_name, course_code, class_name, term_name, avg, ratio, fails, cnt in rows
+    ]
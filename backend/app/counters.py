@@ -0,0 +1,205 @@
+"""Materialized dashboard counters.
+
+计数保存在 ``dashboard_counters`` 表中，由创建/删除接口在同一事务内增量维护；
+读取时若距上次全量校准超过 ``COUNTER_RECONCILE_SECONDS``，则用真实 COUNT 重新校准；
+同一时刻只有抢到 ``counters_reconcile`` 行的一个调用方执行，其余直接返回现有计数。
+考试数按日期分桶（``exams_on:YYYY-MM-DD``），“未来 14 天考试数”只需汇总 15 个桶。
+其余行（如 ``schedule_revision``）用作跨进程的数据版本号。
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.db import write_bind
+
+RECONCILE_SECONDS = int(os.getenv("COUNTER_RECONCILE_SECONDS", "300"))
+EXAM_BUCKET_PREFIX = "exams_on:"
+# 校准抢占行：reconciled_at 记录最近一次被抢到的时间
+RECONCILE_CLAIM = "counters_reconcile"
+
+STUDENTS = "students"
+TEACHERS = "teachers"
+COURSES = "courses"
+CLASSES = "classes"
+PUBLISHED_GRADES = "published_grades"
+
+_SOURCES = {
+    STUDENTS: lambda db: db.query(func.count(models.Student.id)).scalar(),
+    TEACHERS: lambda db: db.query(func.count(models.Teacher.id)).scalar(),
+    COURSES: lambda db: db.query(func.count(models.Course.id)).scalar(),
+    CLASSES: lambda db: db.query(func.count(models.Class.id)).scalar(),
+    PUBLISHED_GRADES: lambda db: db.query(func.count(models.Grade.id))
+    .filter(models.Grade.status == "published")
+    .scalar(),
+}
+BASE_COUNTERS = tuple(_SOURCES)
+
+
+def exam_bucket(exam_date: Optional[date]) -> Optional[str]:
+    if exam_date is None:
+        return None
+    if isinstance(exam_date, str):
+        exam_date = date.fromisoformat(exam_date)
+    return f"{EXAM_BUCKET_PREFIX}{exam_date.isoformat()}"
+
+
+def bump(db: Session, name: Optional[str], delta: int = 1) -> None:
+    """在调用方事务中增量更新计数（随调用方一起提交）。"""
+    if not name or not delta:
+        return
+    result = db.execute(
+        update(models.DashboardCounter)
+        .where(models.DashboardCounter.name == name)
+        .values(value=models.DashboardCounter.value + delta, updated_at=datetime.utcnow())
+    )
+    if result.rowcount or name in BASE_COUNTERS:
+        # 基础计数行缺失说明尚未校准，交给下一次 reconcile；其余（分桶、版本号）按需建行
+        return
+    try:
+        with db.begin_nested():
+            db.add(models.DashboardCounter(name=name, value=delta, updated_at=datetime.utcnow()))
+    except IntegrityError:
+        db.execute(
+            update(models.DashboardCounter)
+            .where(models.DashboardCounter.name == name)
+            .values(value=models.DashboardCounter.value + delta)
+        )
+
+
+def read(db: Session, name: str) -> int:
+    value = (
+        db.query(models.DashboardCounter.value)
+        .filter(models.DashboardCounter.name == name)
+        .scalar()
+    )
+    return int(value or 0)
+
+
+def read_many(db: Session, names: Iterable[str]) -> dict:
+    names = list(names)
+    rows = (
+        db.query(models.DashboardCounter.name, models.DashboardCounter.value)
+        .filter(models.DashboardCounter.name.in_(names))
+        .all()
+    )
+    values = dict.fromkeys(names, 0)
+    values.update({name: int(value or 0) for name, value in rows})
+    return values
+
+
+def refresh(db: Session, names: Iterable[str]) -> dict:
+    """按真实 COUNT 重算指定的基础计数（批量写入路径使用）；返回重算后的值。"""
+    now = datetime.utcnow()
+    values = {}
+    for name in names:
+        value = _SOURCES[name](db) or 0
+        row = db.get(models.DashboardCounter, name)
+        if row is None:
+            db.add(models.DashboardCounter(name=name, value=value, reconciled_at=now, updated_at=now))
+        else:
+            row.value = value
+            row.updated_at = now
+        values[name] = value
+    return values
+
+
+def reconcile(db: Session) -> dict:
+    """全量校准：重算全部基础计数并重建考试日期分桶；返回基础计数和 ``reconciled_at``。"""
+    now = datetime.utcnow()
+    values = refresh(db, BASE_COUNTERS)
+    db.query(models.DashboardCounter).filter(
+        models.DashboardCounter.name.like(f"{EXAM_BUCKET_PREFIX}%")
+    ).delete(synchronize_session=False)
+    exam_days = (
+        db.query(models.Exam.exam_date, func.count(models.Exam.id))
+        .filter(models.Exam.exam_date != None)  # noqa: E711
+        .group_by(models.Exam.exam_date)
+        .all()
+    )
+    for day, cnt in exam_days:
+        db.add(models.DashboardCounter(name=exam_bucket(day), value=cnt, reconciled_at=now, updated_at=now))
+    db.query(models.DashboardCounter).filter(
+        models.DashboardCounter.name.in_(BASE_COUNTERS)
+    ).update({models.DashboardCounter.reconciled_at: now}, synchronize_session=False)
+    db.commit()
+    return {**values, "reconciled_at": now}
+
+
+def _base_rows(db: Session) -> dict:
+    rows = (
+        db.query(models.DashboardCounter)
+        .filter(models.DashboardCounter.name.in_(BASE_COUNTERS))
+        .all()
+    )
+    return {row.name: row for row in rows}
+
+
+def _claim_reconcile(bind) -> bool:
+    """抢本轮校准：条件 UPDATE 抢占行，只有一个调用方（跨 worker）返回 True。
+
+    抢占在独立的短事务里提交，其余调用方不等校准完成，直接返回已有计数。
+    """
+    now = datetime.utcnow()
+    with Session(bind=bind) as own:
+        claimed = own.execute(
+            update(models.DashboardCounter)
+            .where(
+                models.DashboardCounter.name == RECONCILE_CLAIM,
+                or_(
+                    models.DashboardCounter.reconciled_at == None,  # noqa: E711
+                    models.DashboardCounter.reconciled_at < now - timedelta(seconds=RECONCILE_SECONDS),
+                ),
+            )
+            .values(reconciled_at=now, updated_at=now)
+        ).rowcount
+        if claimed:
+            own.commit()
+            return True
+        if own.get(models.DashboardCounter, RECONCILE_CLAIM) is not None:
+            own.rollback()
+            return False
+        try:
+            own.add(models.DashboardCounter(name=RECONCILE_CLAIM, value=0, reconciled_at=now, updated_at=now))
+            own.commit()
+        except IntegrityError:
+            own.rollback()
+            return False
+        return True
+
+
+def snapshot(db: Session) -> dict:
+    """读取基础计数；过期时由抢到校准的一个调用方在独立 Session 中（主库上）校准。"""
+    rows = _base_rows(db)
+    reconciled_at = min((r.reconciled_at for r in rows.values() if r.reconciled_at), default=None)
+    stale = (
+        len(rows) < len(BASE_COUNTERS)
+        or reconciled_at is None
+        or datetime.utcnow() - reconciled_at > timedelta(seconds=RECONCILE_SECONDS)
+    )
+    if stale and _claim_reconcile(write_bind(db)):
+        with Session(bind=write_bind(db)) as own:
+            values = reconcile(own)
+        # 调用方的读事务（SQLite WAL 快照 / 可重复读）早于这次校准，结束它，
+        # 本请求后续读取（如考试分桶）才能看到新值
+        db.rollback()
+        return values
+    values = {name: rows[name].value if name in rows else 0 for name in BASE_COUNTERS}
+    values["reconciled_at"] = reconciled_at
+    return values
+
+
+def upcoming_exams(db: Session, days: int = 14, today: Optional[date] = None) -> int:
+    today = today or date.today()
+    names = [exam_bucket(today + timedelta(days=i)) for i in range(days + 1)]
+    total = (
+        db.query(func.sum(models.DashboardCounter.value))
+        .filter(models.DashboardCounter.name.in_(names))
+        .scalar()
+    )
+    return int(total or 0)
@@ -0,0 +1,428 @@
+"""Exam room and invigilator allocation.
+
+把一个学期的考试按 (日期, 开始时间, 时长) 换算成当天的分钟区间，教室、监考教师、
+班级各自维护一份按日期分桶的有序不相交区间表（``IntervalSet``），冲突判断是
+一次二分查找，而不是与所有考试两两比较。
+
+- 教室：容量不小于班级人数、当段空闲，取容量最小的（best fit）；
+- 监考：当段没有其它监考、也没有上课（``ScheduleEntry`` 按 ``EXAM_SLOT_TIMES``
+  换算成时间），优先选已分配场次最少的教师，使监考负担均衡。
+
+不在本次分配范围内的考试（其它学期、或保留原安排的）视为固定占用。
+"""
+
+import bisect
+import os
+import re
+import sys
+import time as clock
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app import models
+
+# 第 N 节课的起止时间，用于把周课表换算成考试当天的占用区间
+EXAM_SLOT_TIMES = os.getenv(
+    "EXAM_SLOT_TIMES",
+    "08:00-08:45,08:55-09:40,10:00-10:45,10:55-11:40,14:30-15:15,15:25-16:10,16:20-17:05,17:15-18:00,"
+    "19:00-19:45,19:55-20:40",
+)
+EXAM_INVIGILATORS_PER_EXAM = int(os.getenv("EXAM_INVIGILATORS_PER_EXAM", "2"))
+# 每多少名考生加配一名监考
+EXAM_STUDENTS_PER_INVIGILATOR = int(os.getenv("EXAM_STUDENTS_PER_INVIGILATOR", "40"))
+INVIGILATOR_SEPARATOR = "、"
+
+NO_TIME = "exam date / start time not set"
+NO_ROOM = "no free room with enough capacity"
+UNLIMITED_CAPACITY = sys.maxsize
+NO_INVIGILATOR = "not enough free invigilators"
+_NAME_SPLIT = re.compile(r"[,，、;；/\s]+")
+
+
+def _minutes(value: time) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _parse_slot_times(spec: str) -> dict[int, tuple[int, int]]:
+    slots = {}
+    for number, part in enumerate(p.strip() for p in spec.split(",") if p.strip()):
+        start, end = part.split("-")
+        slots[number + 1] = (_minutes(time.fromisoformat(start)), _minutes(time.fromisoformat(end)))
+    return slots
+
+
+SLOT_TIMES = _parse_slot_times(EXAM_SLOT_TIMES)
+
+
+class IntervalSet:
+    """有序、互不相交的半开区间 [start, end)；相交的区间在插入时合并。"""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self):
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+
+    def overlaps(self, start: int, end: int) -> bool:
+        i = bisect.bisect_left(self.starts, end)
+        # 唯一可能相交的是起点在 end 之前的最后一个区间
+        return i > 0 and self.ends[i - 1] > start
+
+    def add(self, start: int, end: int) -> None:
+        lo = bisect.bisect_left(self.ends, start)
+        hi = bisect.bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+class IntervalIndex:
+    """(kind, id, 日期) -> IntervalSet。"""
+
+    def __init__(self):
+        self._sets: dict[tuple, IntervalSet] = {}
+
+    def busy(self, key: tuple, start: int, end: int) -> bool:
+        intervals = self._sets.get(key)
+        return intervals is not None and intervals.overlaps(start, end)
+
+    def add(self, key: tuple, start: int, end: int) -> None:
+        self._sets.setdefault(key, IntervalSet()).add(start, end)
+
+
+@dataclass
+class ExamSlot:
+    exam_id: int
+    course_id: int
+    class_id: Optional[int]
+    exam_date: Optional[date]
+    start: Optional[int]
+    end: Optional[int]
+    size: int
+    label: str
+
+    @property
+    def timed(self) -> bool:
+        return self.exam_date is not None and self.start is not None
+
+
+@dataclass
+class Allocation:
+    exam_id: int
+    room_id: Optional[int] = None
+    invigilator_ids: List[int] = field(default_factory=list)
+    reason: Optional[str] = None
+
+
+def _exam_slot(exam: models.Exam, sizes: dict, label: str) -> ExamSlot:
+    exam_date = exam.exam_date
+    if isinstance(exam_date, str):
+        exam_date = date.fromisoformat(exam_date)
+    start_time = exam.start_time
+    if isinstance(start_time, str):
+        start_time = time.fromisoformat(start_time)
+    start = _minutes(start_time) if start_time else None
+    end = start + (exam.duration_minutes or 90) if start is not None else None
+    return ExamSlot(
+        exam_id=exam.id,
+        course_id=exam.course_id,
+        class_id=exam.class_id,
+        exam_date=exam_date,
+        start=start,
+        end=end,
+        size=sizes.get(exam.class_id, 0),
+        label=label,
+    )
+
+
+def required_invigilators(size: int, per_exam: int, students_per_invigilator: int) -> int:
+    extra = (size - 1) // students_per_invigilator if students_per_invigilator > 0 and size > 0 else 0
+    return max(per_exam, 1 + extra) if per_exam > 0 else 0
+
+
+class ExamAllocator:
+    def __init__(
+        self,
+        rooms: Sequence[tuple[int, Optional[int]]],
+        teachers: Sequence[int],
+        per_exam: int = EXAM_INVIGILATORS_PER_EXAM,
+        students_per_invigilator: int = EXAM_STUDENTS_PER_INVIGILATOR,
+    ):
+        # (room_id, capacity)，按容量升序；容量未填视为不限（与排课求解器一致），排在最后
+        self.rooms = sorted(
+            ((room_id, UNLIMITED_CAPACITY if capacity is None else capacity) for room_id, capacity in rooms),
+            key=lambda r: (r[1], r[0]),
+        )
+        self.room_capacities = [capacity for _, capacity in self.rooms]
+        self.teachers = list(teachers)
+        self.per_exam = per_exam
+        self.students_per_invigilator = students_per_invigilator
+        self.index = IntervalIndex()
+        self.load: dict[int, int] = {t: 0 for t in self.teachers}
+        self.class_clashes: list[tuple[int, int]] = []
+        self._class_owner: dict[tuple, list[tuple[int, int, int]]] = {}
+
+    # -- 固定占用 -----------------------------------------------------------
+    def block_room(self, room_id: int, day: date, start: int, end: int) -> None:
+        self.index.add(("room", room_id, day), start, end)
+
+    def block_teacher(self, teacher_id: int, day: date, start: int, end: int, exam: bool = False) -> None:
+        self.index.add(("teacher", teacher_id, day), start, end)
+        if exam and teacher_id in self.load:
+            self.load[teacher_id] += 1
+
+    def block_teaching(self, entries: Iterable, days: Iterable[date]) -> None:
+        """把周课表展开到考试涉及的日期上。"""
+        by_weekday: dict[int, list[date]] = {}
+        for day in days:
+            by_weekday.setdefault(day.isoweekday(), []).append(day)
+        for teacher_id, weekday, start_slot, end_slot in entries:
+            if not teacher_id or weekday not in by_weekday:
+                continue
+            first, last = SLOT_TIMES.get(start_slot), SLOT_TIMES.get(end_slot)
+            if not first or not last:
+                continue
+            for day in by_weekday[weekday]:
+                self.block_teacher(teacher_id, day, first[0], last[1])
+
+    def note_class(self, slot: ExamSlot) -> None:
+        """同一班级考试时间重叠无法靠分配解决，只记录下来提示人工调整。"""
+        if not slot.class_id or not slot.timed:
+            return
+        key = (slot.class_id, slot.exam_date)
+        for other_id, start, end in self._class_owner.get(key, []):
+            if start < slot.end and slot.start < end:
+                self.class_clashes.append((other_id, slot.exam_id))
+        self._class_owner.setdefault(key, []).append((slot.exam_id, slot.start, slot.end))
+
+    # -- 分配 ---------------------------------------------------------------
+    def pick_room(self, slot: ExamSlot) -> Optional[int]:
+        first = bisect.bisect_left(self.room_capacities, slot.size)
+        for room_id, _ in self.rooms[first:]:
+            if not self.index.busy(("room", room_id, slot.exam_date), slot.start, slot.end):
+                return room_id
+        return None
+
+    def pick_invigilators(self, slot: ExamSlot) -> list[int]:
+        need = required_invigilators(slot.size, self.per_exam, self.students_per_invigilator)
+        free = [
+            t for t in self.teachers if not self.index.busy(("teacher", t, slot.exam_date), slot.start, slot.end)
+        ]
+        free.sort(key=lambda t: (self.load[t], t))
+        return free[:need] if len(free) >= need else []
+
+    def allocate(self, slot: ExamSlot) -> Allocation:
+        if not slot.timed:
+            return Allocation(exam_id=slot.exam_id, reason=NO_TIME)
+        self.note_class(slot)
+        room_id = self.pick_room(slot) if self.rooms else None
+        if self.rooms and room_id is None:
+            return Allocation(exam_id=slot.exam_id, reason=NO_ROOM)
+        invigilators = self.pick_invigilators(slot)
+        if self.per_exam > 0 and not invigilators:
+            return Allocation(exam_id=slot.exam_id, room_id=room_id, reason=NO_INVIGILATOR)
+        self.commit(slot, room_id, invigilators)
+        return Allocation(exam_id=slot.exam_id, room_id=room_id, invigilator_ids=invigilators)
+
+    def commit(self, slot: ExamSlot, room_id: Optional[int], invigilators: Iterable[int]) -> None:
+        if room_id is not None:
+            self.block_room(room_id, slot.exam_date, slot.start, slot.end)
+        for teacher_id in invigilators:
+            self.block_teacher(teacher_id, slot.exam_date, slot.start, slot.end, exam=True)
+
+    def check(self, slot: ExamSlot, room_id: Optional[int], invigilators: Sequence[int], capacity: Optional[int]) -> list[str]:
+        """校验一条人工/预览方案，返回问题列表（空表示可写入）。"""
+        if not slot.timed:
+            return [NO_TIME]
+        problems = []
+        if room_id is not None:
+            if capacity is not None and capacity < slot.size:
+                problems.append(f"room {room_id} capacity {capacity} < {slot.size} students")
+            if self.index.busy(("room", room_id, slot.exam_date), slot.start, slot.end):
+                problems.append(f"room {room_id} is double-booked")
+        for teacher_id in invigilators:
+            if self.index.busy(("teacher", teacher_id, slot.exam_date), slot.start, slot.end):
+                problems.append(f"invigilator {teacher_id} is teaching or invigilating at that time")
+        return problems
+
+
+# -- 从数据库构建 ------------------------------------------------------------
+@dataclass
+class Context:
+    allocator: ExamAllocator
+    slots: List[ExamSlot]
+    rooms: Dict[int, models.Room]
+    teacher_names: Dict[int, str]
+
+
+def _names_to_ids(value: Optional[str], ids_by_name: dict) -> list[int]:
+    if not value:
+        return []
+    return [ids_by_name[n] for n in _NAME_SPLIT.split(value) if n in ids_by_name]
+
+
+def build_context(
+    db: Session,
+    term_id: int,
+    exam_ids: Optional[Sequence[int]] = None,
+    teacher_ids: Optional[Sequence[int]] = None,
+    keep_existing: bool = False,
+    per_exam: int = EXAM_INVIGILATORS_PER_EXAM,
+    students_per_invigilator: int = EXAM_STUDENTS_PER_INVIGILATOR,
+) -> Context:
+    """``exam_ids`` 为空时分配整个学期；``keep_existing`` 时已有教室和监考的考试保持不动。"""
+    rooms = {
+        r.id: r
+        for r in db.query(models.Room).filter(models.Room.active == True)  # noqa: E712
+    }
+    room_labels = {}
+    for room in rooms.values():
+        room_labels[room.name] = room.id
+        room_labels[room.code] = room.id
+    teachers = (
+        db.query(models.Teacher.id, models.User.full_name)
+        .join(models.User, models.User.id == models.Teacher.user_id)
+        .filter(models.User.active == True)  # noqa: E712
+        .all()
+    )
+    teacher_names = {tid: name for tid, name in teachers}
+    ids_by_name = {name: tid for tid, name in teachers}
+    pool = [tid for tid, _ in teachers if not teacher_ids or tid in set(teacher_ids)]
+
+    # 本学期的考试 + 其它学期同日的考试（后者只用于占用教室 / 监考）
+    term_dates = [
+        d
+        for (d,) in db.query(models.Exam.exam_date)
+        .filter(models.Exam.term_id == term_id, models.Exam.exam_date.isnot(None))
+        .distinct()
+    ]
+    exam_filter = models.Exam.term_id == term_id
+    if term_dates:
+        exam_filter = or_(exam_filter, models.Exam.exam_date.in_(term_dates))
+    exams = db.query(models.Exam).filter(exam_filter).all()
+    sizes = dict(
+        db.query(models.Student.class_id, func.count(models.Student.id))
+        .filter(models.Student.class_id.isnot(None))
+        .group_by(models.Student.class_id)
+        .all()
+    )
+    course_ids = {exam.course_id for exam in exams}
+    courses = (
+        dict(db.query(models.Course.id, models.Course.name).filter(models.Course.id.in_(course_ids)))
+        if course_ids
+        else {}
+    )
+    wanted = set(exam_ids or [])
+    targets, fixed = [], []
+    for exam in exams:
+        slot = _exam_slot(exam, sizes, courses.get(exam.course_id, ""))
+        in_scope = exam.term_id == term_id and (not wanted or exam.id in wanted)
+        if in_scope and keep_existing and (exam.room_id or exam.location) and exam.invigilators:
+            in_scope = False
+        (targets if in_scope else fixed).append((exam, slot))
+
+    allocator = ExamAllocator(
+        [(r.id, r.capacity) for r in rooms.values()],
+        pool,
+        per_exam=per_exam,
+        students_per_invigilator=students_per_invigilator,
+    )
+    for exam, slot in fixed:
+        if not slot.timed:
+            continue
+        room_id = exam.room_id or room_labels.get(exam.location)
+        if room_id:
+            allocator.block_room(room_id, slot.exam_date, slot.start, slot.end)
+        for teacher_id in _names_to_ids(exam.invigilators, ids_by_name):
+            allocator.block_teacher(teacher_id, slot.exam_date, slot.start, slot.end, exam=True)
+        if exam.term_id == term_id:
+            allocator.note_class(slot)
+
+    # 只有本学期课程的周课表会与本学期考试冲突
+    days = {slot.exam_date for _, slot in targets if slot.timed}
+    if days:
+        allocator.block_teaching(
+            db.query(
+                models.ScheduleEntry.teacher_id,
+                models.ScheduleEntry.weekday,
+                models.ScheduleEntry.start_slot,
+                models.ScheduleEntry.end_slot,
+            )
+            .join(models.Course, models.Course.id == models.ScheduleEntry.course_id)
+            .filter(models.Course.term_id == term_id, models.ScheduleEntry.teacher_id.isnot(None)),
+            days,
+        )
+    return Context(
+        allocator=allocator,
+        slots=[slot for _, slot in targets],
+        rooms=rooms,
+        teacher_names=teacher_names,
+    )
+
+
+def _clock(minutes: Optional[int]) -> Optional[str]:
+    if minutes is None:
+        return None
+    return (datetime.min + timedelta(minutes=minutes)).strftime("%H:%M")
+
+
+def allocate(context: Context) -> dict:
+    """整批分配：先排时间早的，同一时间段内人数多的考试优先挑教室。"""
+    started = clock.perf_counter()
+    slots = sorted(
+        context.slots,
+        key=lambda s: (not s.timed, s.exam_date or date.max, s.start or 0, -s.size, s.exam_id),
+    )
+    assignments, unallocated = [], []
+    for slot in slots:
+        result = context.allocator.allocate(slot)
+        row = {
+            "exam_id": slot.exam_id,
+            "course_id": slot.course_id,
+            "course_name": slot.label,
+            "class_id": slot.class_id,
+            "exam_date": slot.exam_date,
+            "start_time": _clock(slot.start),
+            "end_time": _clock(slot.end),
+            "students": slot.size,
+        }
+        if result.reason:
+            unallocated.append({**row, "reason": result.reason})
+            continue
+        room = context.rooms.get(result.room_id)
+        assignments.append(
+            {
+                **row,
+                "room_id": result.room_id,
+                "room_name": room.name if room else None,
+                "capacity": room.capacity if room else None,
+                "invigilator_ids": result.invigilator_ids,
+                "invigilators": INVIGILATOR_SEPARATOR.join(
+                    context.teacher_names[t] for t in result.invigilator_ids
+                ),
+            }
+        )
+    loads = [v for v in context.allocator.load.values()]
+    return {
+        "assignments": assignments,
+        "unallocated": unallocated,
+        "class_clashes": [{"exam_id": a, "other_exam_id": b} for a, b in context.allocator.class_clashes],
+        "stats": {
+            "exams": len(slots),
+            "allocated": len(assignments),
+            "rooms_used": len({a["room_id"] for a in assignments if a["room_id"]}),
+            "invigilators": len(context.allocator.teachers),
+            "max_invigilator_load": max(loads, default=0),
+            "min_invigilator_load": min(loads, default=0),
+            "elapsed_ms": int((clock.perf_counter() - started) * 1000),
+        },
+    }
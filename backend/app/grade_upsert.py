@@ -0,0 +1,151 @@
+"""Native bulk upsert for grades keyed by (student_id, course_id).
+
+每个分块只发一条 upsert 语句（MySQL 另加一次加锁读），同时得到插入/更新数：
+
+- PostgreSQL：``ON CONFLICT ... RETURNING (xmax = 0)``
+- SQLite ≥ 3.35：``ON CONFLICT ... DO UPDATE RETURNING created_at``，新行的 created_at
+  写入本块独有的时间戳（带微秒），冲突更新不改 created_at，返回值等于它的就是插入
+- MySQL：``ON DUPLICATE KEY UPDATE``；受影响行数分不清插入与值未变的更新，
+  先在同一事务里以加锁读（``FOR UPDATE``）查出本块已存在的键，并发事务无法在
+  查询与 upsert 之间插入这些键，计数是精确的
+- 其他方言（含不支持 RETURNING 的旧 SQLite）：按唯一键查出已有行，
+  新行批量 INSERT、已有行按主键批量 UPDATE
+"""
+
+import os
+from datetime import datetime
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import bindparam, insert, literal_column, select, tuple_, update
+from sqlalchemy.engine import Dialect
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import models
+
+GRADE_UPSERT_CHUNK_SIZE = int(os.getenv("GRADE_UPSERT_CHUNK_SIZE", "500"))
+# 已存在的成绩保留原 term_id（与原逐条写入逻辑一致）
+UPDATE_COLUMNS = ("usual_score", "final_score", "total_score", "status")
+
+
+def total_score(usual_score: float, final_score: float) -> float:
+    return round(usual_score * 0.4 + final_score * 0.6, 2)
+
+
+def _rows(items: Iterable) -> list[dict]:
+    # 同一 (student_id, course_id) 多次出现时以最后一条为准（与逐条写入语义一致）
+    rows: dict[tuple, dict] = {}
+    for item in items:
+        rows[(item.student_id, item.course_id)] = {
+            "student_id": item.student_id,
+            "course_id": item.course_id,
+            "term_id": item.term_id,
+            "usual_score": item.usual_score,
+            "final_score": item.final_score,
+            "total_score": total_score(item.usual_score, item.final_score),
+            "status": item.status or "draft",
+        }
+    return list(rows.values())
+
+
+def _upsert_statement(dialect: Dialect, rows: Sequence[dict]):
+    """方言原生的 upsert 语句；不支持的方言返回 None，走 ``_upsert_generic``。"""
+    table = models.Grade.__table__
+    if dialect.name == "mysql":
+        stmt = mysql.insert(table).values(rows)
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in UPDATE_COLUMNS})
+    if dialect.name == "postgresql":
+        stmt = postgresql.insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["student_id", "course_id"],
+            set_={c: stmt.excluded[c] for c in UPDATE_COLUMNS},
+        )
+        return stmt.returning(literal_column("xmax = 0"))
+    if dialect.name == "sqlite" and dialect.insert_returning:
+        stmt = sqlite.insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["student_id", "course_id"],
+            set_={c: stmt.excluded[c] for c in UPDATE_COLUMNS},
+        )
+        return stmt.returning(table.c.created_at)
+    return None
+
+
+def _insert_marker() -> datetime:
+    # server_default 的 CURRENT_TIMESTAMP 只到秒，微秒非零的时间戳不会与已有行相同
+    now = datetime.utcnow()
+    return now if now.microsecond else now.replace(microsecond=1)
+
+
+def _locked_existing_keys(db: Session, rows: Sequence[dict]) -> set:
+    table = models.Grade.__table__
+    keys = [(r["student_id"], r["course_id"]) for r in rows]
+    found = db.execute(
+        select(table.c.student_id, table.c.course_id)
+        .where(tuple_(table.c.student_id, table.c.course_id).in_(keys))
+        .with_for_update()
+    ).all()
+    return {tuple(key) for key in found}
+
+
+def _upsert_generic(db: Session, rows: Sequence[dict]) -> int:
+    """通用写法：先按唯一键查出已有行，再分别批量插入 / 更新；返回插入数。
+
+    查询与写入之间若有并发插入同一键，唯一索引会让本次写入报 IntegrityError（整块回滚）。
+    """
+    table = models.Grade.__table__
+    keys = [(r["student_id"], r["course_id"]) for r in rows]
+    existing = {
+        (student_id, course_id): grade_id
+        for grade_id, student_id, course_id in db.execute(
+            select(table.c.id, table.c.student_id, table.c.course_id).where(
+                tuple_(table.c.student_id, table.c.course_id).in_(keys)
+            )
+        )
+    }
+    new_rows = [r for r in rows if (r["student_id"], r["course_id"]) not in existing]
+    changed = [
+        {"grade_id": existing[(r["student_id"], r["course_id"])], **{c: r[c] for c in UPDATE_COLUMNS}}
+        for r in rows
+        if (r["student_id"], r["course_id"]) in existing
+    ]
+    if new_rows:
+        db.execute(insert(table), new_rows)
+    if changed:
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("grade_id"))
+            .values({c: bindparam(c) for c in UPDATE_COLUMNS}),
+            changed,
+        )
+    return len(new_rows)
+
+
+def bulk_upsert(
+    db: Session, items: Iterable, chunk_size: Optional[int] = None
+) -> tuple[int, int]:
+    """在调用方事务中批量写入成绩，返回 (inserted, updated)；由调用方提交。"""
+    rows = _rows(items)
+    dialect = db.get_bind().dialect
+    size = chunk_size or GRADE_UPSERT_CHUNK_SIZE
+    inserted = updated = 0
+    for start in range(0, len(rows), size):
+        chunk = rows[start : start + size]
+        marker = None
+        if dialect.name == "sqlite" and dialect.insert_returning:
+            marker = _insert_marker()
+            chunk = [{**row, "created_at": marker} for row in chunk]
+        stmt = _upsert_statement(dialect, chunk)
+        if stmt is None:
+            chunk_inserted = _upsert_generic(db, chunk)
+        elif dialect.name == "postgresql":
+            chunk_inserted = sum(1 for flag in db.execute(stmt).scalars() if flag)
+        elif marker is not None:
+            chunk_inserted = sum(1 for created_at in db.execute(stmt).scalars() if created_at == marker)
+        else:
+            existing = _locked_existing_keys(db, chunk)
+            db.execute(stmt)
+            chunk_inserted = len(chunk) - len(existing)
+        inserted += chunk_inserted
+        updated += len(chunk) - chunk_inserted
+    return inserted, updated
@@ -0,0 +1,31 @@
+"""Conditional GET helpers (ETag / If-None-Match)."""
+
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 弱比较：忽略 W/ 前缀
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+
+def cached_response(
+    request: Request, body: bytes, etag: str, max_age: int = 0, headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """命中 If-None-Match 时返回 304，否则直接返回预先序列化好的 JSON。"""
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": f"private, max-age={max_age}, must-revalidate"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,167 @@
+"""Bulk student import: prefetch, in-memory validation, chunked bulk inserts."""
+
+import os
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import counters, models, refdata, schemas
+from app.passwords import password_hasher
+from app.refdata import refdata_cache
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+# IN (...) 参数个数上限，兼顾 SQLite 变量数限制
+LOOKUP_BATCH = 900
+
+
+def _chunks(items: Sequence, size: int) -> Iterable[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _existing(db: Session, column, values: Iterable) -> set:
+    values = list({v for v in values if v is not None})
+    found = set()
+    for batch in _chunks(values, LOOKUP_BATCH):
+        found.update(db.execute(select(column).where(column.in_(batch))).scalars())
+    return found
+
+
+def _student_role_id(db: Session) -> int:
+    role_id = db.execute(select(models.Role.id).where(models.Role.code == "STUDENT")).scalar()
+    if role_id is None:
+        role = models.Role(code="STUDENT", name="Student")
+        db.add(role)
+        db.flush()
+        refdata_cache.bump(db, refdata.ROLES)
+        role_id = role.id
+    return role_id
+
+
+def validate_students(
+    db: Session, items: Sequence[schemas.StudentCreate]
+) -> tuple[list[tuple[int, schemas.StudentCreate, Optional[int]]], list[schemas.ImportRowError]]:
+    """返回 (可导入行, 错误行)；可导入行附带班级所属机构 id。"""
+    taken_usernames = _existing(db, models.User.username, (i.username for i in items))
+    taken_student_nos = _existing(db, models.Student.student_no, (i.student_no for i in items))
+    class_ids = list({i.class_id for i in items})
+    class_orgs: dict[int, Optional[int]] = {}
+    for batch in _chunks(class_ids, LOOKUP_BATCH):
+        rows = db.execute(
+            select(models.Class.id, models.Major.org_unit_id)
+            .outerjoin(models.Major, models.Major.id == models.Class.major_id)
+            .where(models.Class.id.in_(batch))
+        )
+        class_orgs.update({cid: org_id for cid, org_id in rows})
+
+    accepted = []
+    errors = []
+    seen_usernames: set[str] = set()
+    seen_student_nos: set[str] = set()
+    for row_no, item in enumerate(items, start=1):
+        problems = []
+        if not item.username.strip():
+            problems.append("username is empty")
+        elif item.username in taken_usernames:
+            problems.append("username already exists")
+        elif item.username in seen_usernames:
+            problems.append("duplicate username in file")
+        if not item.password:
+            problems.append("password is empty")
+        if not item.student_no.strip():
+            problems.append("student_no is empty")
+        elif item.student_no in taken_student_nos:
+            problems.append("student_no already exists")
+        elif item.student_no in seen_student_nos:
+            problems.append("duplicate student_no in file")
+        if item.class_id not in class_orgs:
+            problems.append(f"class {item.class_id} not found")
+        if problems:
+            errors.append(
+                schemas.ImportRowError(
+                    row=row_no, username=item.username, student_no=item.student_no, errors=problems
+                )
+            )
+            continue
+        seen_usernames.add(item.username)
+        seen_student_nos.add(item.student_no)
+        accepted.append((row_no, item, class_orgs[item.class_id]))
+    return accepted, errors
+
+
+def _insert_chunk(db: Session, chunk: Sequence, role_id: int) -> None:
+    hashes = password_hasher.hash_many(item.password for _, item, _ in chunk)
+    db.execute(
+        insert(models.User),
+        [
+            {
+                "username": item.username,
+                "password_hash": password_hash,
+                "full_name": item.full_name,
+                "email": item.email,
+                "org_unit_id": org_unit_id,
+            }
+            for (_, item, org_unit_id), password_hash in zip(chunk, hashes)
+        ],
+    )
+    # 不依赖 RETURNING（MySQL 不支持），按用户名回查 id
+    user_ids = dict(
+        db.execute(
+            select(models.User.username, models.User.id).where(
+                models.User.username.in_([item.username for _, item, _ in chunk])
+            )
+        ).all()
+    )
+    db.execute(
+        insert(models.UserRole),
+        [{"user_id": user_ids[item.username], "role_id": role_id} for _, item, _ in chunk],
+    )
+    db.execute(
+        insert(models.Student),
+        [
+            {
+                "user_id": user_ids[item.username],
+                "class_id": item.class_id,
+                "student_no": item.student_no,
+            }
+            for _, item, _ in chunk
+        ],
+    )
+    counters.bump(db, counters.STUDENTS, len(chunk))
+
+
+def import_students(
+    db: Session, items: Sequence[schemas.StudentCreate], chunk_size: Optional[int] = None
+) -> schemas.StudentImportResult:
+    """按批导入，每批单独提交。
+
+    校验之后才写入，期间别的请求可能建了同名用户 / 同学号：该批违反唯一约束时
+    只回滚这一批，批内各行记入 ``errors``（与校验错误同一格式），其余批次照常导入。
+    ``created`` 是已提交的行数，``skipped`` 是未导入的行数。
+    """
+    accepted, errors = validate_students(db, items)
+    role_id = _student_role_id(db) if accepted else None
+    # 校验阶段的事务先结束，后面每批都是“算哈希 → 短写事务”
+    db.commit()
+    created = 0
+    for chunk in _chunks(accepted, chunk_size or IMPORT_CHUNK_SIZE):
+        try:
+            _insert_chunk(db, chunk, role_id)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            errors.extend(
+                schemas.ImportRowError(
+                    row=row_no,
+                    username=item.username,
+                    student_no=item.student_no,
+                    errors=["batch rolled back: a username or student_no in it was taken by a concurrent write"],
+                )
+                for row_no, item, _ in chunk
+            )
+            continue
+        created += len(chunk)
+    errors.sort(key=lambda error: error.row)
+    return schemas.StudentImportResult(created=created, skipped=len(errors), errors=errors)
@@ -1,13 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-from pathlib import Path
 
+from app.ai_client import ai_client
+from app.db import engine, read_engine
+from app.metrics import METRICS_ENABLED, MetricsMiddleware, metrics
+from app.migrations import ensure_schema
+from app.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+from app.passwords import password_hasher
 from app.routers import api, auth, health
-from app.seed import init_db_with_sample_data
-
-# 自动加载项目根目录下的 .env（方便本地运行时无需手动导出环境变量）
-load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / ".env")
+from app.slow_query import slow_queries
+from app.timetable_solver import timetable_solver
 
 app = FastAPI(title="Police Academy Backend", version="0.1.0")
 
@@ -17,7 +19,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER],
 )
+if METRICS_ENABLED:
+    # 最后添加的中间件在最外层，延迟包含 CORS 等全部处理
+    app.add_middleware(MetricsMiddleware)
+    metrics.instrument(engine, read_engine)
 
 app.include_router(health.router)
 app.include_router(auth.router)
@@ -26,7 +33,17 @@ app.include_router(api.router)
 
 @app.on_event("startup")
 def startup():
-    init_db_with_sample_data()
+    # 库结构已是当前版本时只有一次 SELECT；演示数据改由 ``python -m app.seed`` 导入。
+    # 计数校准、排课索引、权限位表都在首次使用时按需加载
+    ensure_schema(engine)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    password_hasher.shutdown()
+    timetable_solver.shutdown()
+    slow_queries.shutdown()
+    await ai_client.aclose()
 
 
 @app.get("/", tags=["health"])
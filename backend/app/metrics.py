@@ -0,0 +1,293 @@
+"""Request metrics: per-route latency, in-flight, SQL count / DB time and an N+1 detector.
+
+``MetricsMiddleware`` 是纯 ASGI 中间件（不经 ``BaseHTTPMiddleware``，不缓冲响应），
+按 (方法, 路由模板) 聚合：
+
+- 请求数（按状态码）、延迟直方图、进行中的请求数；
+- 每请求 SQL 条数直方图与 DB 耗时累计：引擎上挂 ``before/after_cursor_execute``，
+  通过 contextvar 归到当前请求（线程池里的同步接口同样生效）；
+- N+1 检测：同一请求内完全相同的语句（参数已绑定为占位符）执行次数达到
+  ``METRICS_N_PLUS_ONE_THRESHOLD`` 即计一次，并保留最近的样例。
+
+``/metrics`` 以 Prometheus 文本格式输出，附带连接池与 SQLite 写通道的状态；
+``/api/admin/n-plus-one``（仅管理员，样例含 SQL 文本）返回最近的 N+1 样例。
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+from app.db import WAIT_BUCKETS, pool_status
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "False", "")
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.getenv("METRICS_N_PLUS_ONE_THRESHOLD", "10"))
+METRICS_N_PLUS_ONE_SAMPLES = int(os.getenv("METRICS_N_PLUS_ONE_SAMPLES", "50"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+UNMATCHED = "unmatched"
+
+_STARTED = "metrics_statement_started"
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        running, result = 0, []
+        for bound, count in zip([*map(_format_bound, self.bounds), "+Inf"], self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+
+class RequestSQL:
+    __slots__ = ("statements", "seconds", "shapes")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes: dict[str, int] = {}
+
+
+_current_sql: ContextVar[Optional[RequestSQL]] = ContextVar("metrics_request_sql", default=None)
+_current_route: ContextVar[Optional[str]] = ContextVar("metrics_request_route", default=None)
+
+
+def current_route() -> Optional[str]:
+    """当前请求的 "方法 路由模板"；请求之外（或未启用中间件）为 None。"""
+    return _current_route.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_sql.get() is not None:
+        conn.info[_STARTED] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    sql = _current_sql.get()
+    started = conn.info.pop(_STARTED, None)
+    if sql is None or started is None:
+        return
+    sql.statements += 1
+    sql.seconds += time.perf_counter() - started
+    sql.shapes[statement] = sql.shapes.get(statement, 0) + 1
+
+
+def _format_bound(value: float) -> str:
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self, n_plus_one_threshold: int = METRICS_N_PLUS_ONE_THRESHOLD):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self._engines: set[int] = set()
+        self.requests: dict[tuple, int] = {}
+        self.latency: dict[tuple, Histogram] = {}
+        self.sql_statements: dict[tuple, Histogram] = {}
+        self.db_seconds: dict[tuple, float] = {}
+        self.in_flight: dict[tuple, int] = {}
+        self.n_plus_one: dict[tuple, int] = {}
+        self.n_plus_one_samples: deque = deque(maxlen=METRICS_N_PLUS_ONE_SAMPLES)
+
+    def instrument(self, *engines: Engine) -> None:
+        for engine in engines:
+            if id(engine) in self._engines:
+                continue
+            self._engines.add(id(engine))
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    def started(self, key: tuple) -> None:
+        with self._lock:
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def finished(self, key: tuple, status_code: int, elapsed: float, sql: RequestSQL) -> None:
+        statement, repeats = max(sql.shapes.items(), key=lambda item: item[1], default=("", 0))
+        suspect = repeats >= self.n_plus_one_threshold > 0
+        with self._lock:
+            self.in_flight[key] -= 1
+            status_key = (*key, status_code)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.sql_statements.setdefault(key, Histogram(SQL_BUCKETS)).observe(sql.statements)
+            self.db_seconds[key] = self.db_seconds.get(key, 0.0) + sql.seconds
+            if suspect:
+                self.n_plus_one[key] = self.n_plus_one.get(key, 0) + 1
+                self.n_plus_one_samples.append(
+                    {
+                        "method": key[0],
+                        "route": key[1],
+                        "statement": " ".join(statement.split())[:500],
+                        "repeats": repeats,
+                        "statements": sql.statements,
+                        "at": datetime.utcnow().isoformat(timespec="seconds"),
+                    }
+                )
+
+    def n_plus_one_stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold": self.n_plus_one_threshold,
+                "routes": {f"{method} {route}": count for (method, route), count in sorted(self.n_plus_one.items())},
+                "recent": list(self.n_plus_one_samples),
+            }
+
+    def render(self) -> str:
+        lines: list[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name: str, labels: dict, hist: Histogram) -> None:
+            for bound, count in hist.cumulative():
+                lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+            lines.append(f"{name}_sum{_labels(**labels)} {hist.total}")
+            lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+
+        with self._lock:
+            family("http_requests_total", "counter", "Requests by method, route template and status code.")
+            for (method, route, code), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{_labels(method=method, route=route, status=code)} {count}")
+            family("http_requests_in_flight", "gauge", "Requests currently being served.")
+            for (method, route), count in sorted(self.in_flight.items()):
+                lines.append(f"http_requests_in_flight{_labels(method=method, route=route)} {count}")
+            family("http_request_duration_seconds", "histogram", "Request latency.")
+            for (method, route), hist in sorted(self.latency.items()):
+                histogram("http_request_duration_seconds", {"method": method, "route": route}, hist)
+            family("http_request_sql_statements", "histogram", "SQL statements executed per request.")
+            for (method, route), hist in sorted(self.sql_statements.items()):
+                histogram("http_request_sql_statements", {"method": method, "route": route}, hist)
+            family("http_request_db_seconds_total", "counter", "Time spent in SQL statements.")
+            for (method, route), seconds in sorted(self.db_seconds.items()):
+                lines.append(f"http_request_db_seconds_total{_labels(method=method, route=route)} {seconds}")
+            family(
+                "http_request_n_plus_one_total",
+                "counter",
+                f"Requests that ran one identical statement at least {self.n_plus_one_threshold} times.",
+            )
+            for (method, route), count in sorted(self.n_plus_one.items()):
+                lines.append(f"http_request_n_plus_one_total{_labels(method=method, route=route)} {count}")
+
+        status = pool_status()
+        family("db_pool_checked_out", "gauge", "Connections currently checked out of the pool.")
+        for name, info in status["engines"].items():
+            if "checked_out" in info:
+                lines.append(f"db_pool_checked_out{_labels(engine=name)} {info['checked_out']}")
+        family("db_pool_checkout_timeouts_total", "counter", "Checkouts that timed out waiting for a connection.")
+        for name, info in status["engines"].items():
+            if info.get("wait"):
+                lines.append(f"db_pool_checkout_timeouts_total{_labels(engine=name)} {info['wait']['timeouts']}")
+        family("db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a pooled connection.")
+        for name, info in status["engines"].items():
+            wait = info.get("wait")
+            if not wait:
+                continue
+            hist = Histogram(WAIT_BUCKETS)
+            hist.counts = list(wait["buckets"].values())
+            hist.total = wait["wait_seconds_total"]
+            hist.count = sum(hist.counts)
+            histogram("db_pool_checkout_wait_seconds", {"engine": name}, hist)
+        lane = status["sqlite_write_lane"]
+        if lane:
+            family("sqlite_write_lane_transactions_total", "counter", "Write transactions that took the lane.")
+            lines.append(f"sqlite_write_lane_transactions_total {lane['transactions']}")
+            family("sqlite_write_lane_timeouts_total", "counter", "Write transactions rejected after waiting.")
+            lines.append(f"sqlite_write_lane_timeouts_total {lane['timeouts']}")
+            family("sqlite_write_lane_waiting", "gauge", "Write transactions waiting for the lane.")
+            lines.append(f"sqlite_write_lane_waiting {lane['waiting']}")
+            family("sqlite_write_lane_wait_seconds_total", "counter", "Total time spent waiting for the lane.")
+            lines.append(f"sqlite_write_lane_wait_seconds_total {lane['wait_seconds_total']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+ROUTE_CACHE_SIZE = 4096
+_route_cache: dict[tuple, str] = {}
+
+
+def _route_template(scope) -> str:
+    key = (scope["method"], scope["path"])
+    template = _route_cache.get(key)
+    if template is not None:
+        return template
+    # 与 Starlette 路由相同的匹配顺序：先找完全匹配，否则取仅方法不符的路由（405）
+    app = scope.get("app")
+    partial = None
+    for route in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            template = route.path
+            break
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    else:
+        template = partial or UNMATCHED
+    if len(_route_cache) >= ROUTE_CACHE_SIZE:
+        # 带 id 的路径会不断出现新键，满了整体清空即可
+        _route_cache.clear()
+    _route_cache[key] = template
+    return template
+
+
+class MetricsMiddleware:
+    def __init__(self, app, registry: MetricsRegistry = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        key = (scope["method"], _route_template(scope))
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        sql = RequestSQL()
+        token = _current_sql.set(sql)
+        route_token = _current_route.set(f"{key[0]} {key[1]}")
+        self.registry.started(key)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current_route.reset(route_token)
+            _current_sql.reset(token)
+            self.registry.finished(key, status_code, time.perf_counter() - started, sql)
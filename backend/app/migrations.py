@@ -0,0 +1,214 @@
+"""Idempotent schema upgrades for deployments created before a model change.
+
+``Base.metadata.create_all`` 只会建新表，不会给已有表补约束/索引，这里补齐。
+
+库里记录一个结构版本号（``dashboard_counters`` 中的 ``schema_version`` 行）。
+启动时 ``ensure_schema`` 只读这一行，已是 ``SCHEMA_VERSION`` 就直接返回；否则执行
+建表、补约束/索引、写入必需的权限数据，最后更新版本号。修改模型、索引或
+``DEFAULT_PERMISSIONS`` 时把 ``SCHEMA_VERSION`` 加一。
+
+启动时的升级不删任何数据：grades 有重复键时直接报错并列出这些键，
+需要人工确认后用下面的命令合并（会打印删除的成绩 id）。
+
+多 worker 部署建议在发布时先单独执行一次（大表建索引耗时较长）::
+
+    python -m app.migrations
+"""
+
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, inspect, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.db import Base
+from app.seed import ensure_permissions_seed
+
+# 1: grades(student_id, course_id) 唯一索引；2: 热点查询二级索引
+SCHEMA_VERSION = 2
+VERSION_ROW = "schema_version"
+
+GRADE_UNIQUE_NAME = "uq_grades_student_course"
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateGradesError(RuntimeError):
+    """grades 里存在同一 (student_id, course_id) 的多条记录，唯一索引建不起来。"""
+
+    def __init__(self, keys: list[tuple]):
+        self.keys = keys
+        shown = ", ".join(f"(student_id={s}, course_id={c}, rows={n})" for s, c, n in keys[:20])
+        more = f" ... and {len(keys) - 20} more" if len(keys) > 20 else ""
+        super().__init__(
+            f"{len(keys)} duplicate grade keys block {GRADE_UNIQUE_NAME}: {shown}{more}. "
+            "Review them, then run `python -m app.migrations` to merge (see ensure_grade_unique_index)."
+        )
+
+
+def _has_grade_unique_index(engine: Engine) -> Optional[bool]:
+    """grades 表不存在时返回 None。"""
+    inspector = inspect(engine)
+    if "grades" not in inspector.get_table_names():
+        return None
+    existing = {ix["name"] for ix in inspector.get_indexes("grades")}
+    existing |= {uc["name"] for uc in inspector.get_unique_constraints("grades")}
+    return GRADE_UNIQUE_NAME in existing
+
+
+def find_duplicate_grades(db: Session) -> list[tuple]:
+    """重复的成绩键，返回 ``[(student_id, course_id, 行数), ...]``。"""
+    return [
+        tuple(row)
+        for row in db.execute(
+            select(models.Grade.student_id, models.Grade.course_id, func.count(models.Grade.id))
+            .group_by(models.Grade.student_id, models.Grade.course_id)
+            .having(func.count(models.Grade.id) > 1)
+            .order_by(models.Grade.student_id, models.Grade.course_id)
+        ).all()
+    ]
+
+
+def _merge_duplicate_grades(db: Session, keys: list[tuple]) -> list[dict]:
+    """每组只保留最近写过的一条，其余删除，审核记录迁移到保留行。
+
+    grades 没有 updated_at，"最近写过" 取该行最后一条审核记录的时间（提交 / 审核 /
+    发布都会留审核记录），没有审核记录时取 created_at；时间相同再取 id 较大者。
+    """
+    last_audit = (
+        select(models.GradeAudit.grade_id, func.max(models.GradeAudit.created_at).label("at"))
+        .group_by(models.GradeAudit.grade_id)
+        .subquery()
+    )
+    merged = []
+    for student_id, course_id, _ in keys:
+        rows = db.execute(
+            select(models.Grade.id, models.Grade.created_at, last_audit.c.at)
+            .outerjoin(last_audit, last_audit.c.grade_id == models.Grade.id)
+            .where(models.Grade.student_id == student_id, models.Grade.course_id == course_id)
+        ).all()
+        ranked = sorted(rows, key=lambda row: (max(filter(None, (row[1], row[2])), default=datetime.min), row[0]))
+        keep_id = ranked[-1][0]
+        stale_ids = sorted(row[0] for row in ranked[:-1])
+        db.execute(
+            update(models.GradeAudit).where(models.GradeAudit.grade_id.in_(stale_ids)).values(grade_id=keep_id)
+        )
+        db.query(models.Grade).filter(models.Grade.id.in_(stale_ids)).delete(synchronize_session=False)
+        logger.warning(
+            "merged duplicate grades student_id=%s course_id=%s: kept id %s, removed ids %s",
+            student_id,
+            course_id,
+            keep_id,
+            stale_ids,
+        )
+        merged.append({"student_id": student_id, "course_id": course_id, "kept": keep_id, "removed": stale_ids})
+    return merged
+
+
+def ensure_grade_unique_index(engine: Engine, merge_duplicates: bool = False) -> list[dict]:
+    """给 grades(student_id, course_id) 补唯一索引；返回合并掉的重复成绩。
+
+    已有重复数据时默认抛 ``DuplicateGradesError``（列出重复键），不在服务启动时删数据；
+    只有显式执行 ``python -m app.migrations`` 才传 ``merge_duplicates=True`` 合并，
+    规则见 ``_merge_duplicate_grades``。
+    """
+    if _has_grade_unique_index(engine) is not False:
+        return []
+    merged: list[dict] = []
+    with Session(bind=engine) as db:
+        keys = find_duplicate_grades(db)
+        if keys and not merge_duplicates:
+            raise DuplicateGradesError(keys)
+        if keys:
+            merged = _merge_duplicate_grades(db, keys)
+            db.commit()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            f"CREATE UNIQUE INDEX {GRADE_UNIQUE_NAME} ON grades (student_id, course_id)"
+        )
+    return merged
+
+
+def ensure_indexes(engine: Engine) -> list[str]:
+    """按模型 ``__table_args__`` 声明补建缺失的二级索引（只按名称比对）；返回新建的索引名。"""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables or not table.indexes:
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name in existing:
+                continue
+            index.create(bind=engine)
+            created.append(index.name)
+    return created
+
+
+def schema_version(engine: Engine) -> int:
+    """读取库中记录的结构版本号；库是空的（还没有计数表）时返回 0。"""
+    try:
+        with engine.connect() as conn:
+            value = conn.execute(
+                select(models.DashboardCounter.value).where(models.DashboardCounter.name == VERSION_ROW)
+            ).scalar()
+    except (OperationalError, ProgrammingError):
+        return 0
+    return int(value or 0)
+
+
+def upgrade(engine: Engine, merge_duplicates: bool = False) -> dict:
+    Base.metadata.create_all(bind=engine)
+    merged = ensure_grade_unique_index(engine, merge_duplicates=merge_duplicates)
+    created = ensure_indexes(engine)
+    with Session(bind=engine) as db:
+        ensure_permissions_seed(db)
+        row = db.get(models.DashboardCounter, VERSION_ROW)
+        if row is None:
+            db.add(models.DashboardCounter(name=VERSION_ROW, value=SCHEMA_VERSION, updated_at=datetime.utcnow()))
+        else:
+            row.value = SCHEMA_VERSION
+            row.updated_at = datetime.utcnow()
+        db.commit()
+    return {"version": SCHEMA_VERSION, "duplicate_grades_merged": merged, "indexes_created": created}
+
+
+def ensure_schema(engine: Engine) -> bool:
+    """结构已是当前版本返回 False；否则升级并返回 True。
+
+    启动时调用，不合并重复成绩：有重复时 ``DuplicateGradesError`` 让启动失败。
+    """
+    if schema_version(engine) >= SCHEMA_VERSION:
+        return False
+    try:
+        upgrade(engine)
+    except DuplicateGradesError:
+        raise
+    except Exception:
+        # 多个 worker 同时启动时可能与别的进程撞车：对方已升级完成就不算失败
+        if schema_version(engine) >= SCHEMA_VERSION:
+            return False
+        raise
+    return True
+
+
+if __name__ == "__main__":
+    from app.db import engine
+
+    before = schema_version(engine)
+    result = upgrade(engine, merge_duplicates=True)
+    print(f"schema version: {before} -> {result['version']}")
+    merged = result["duplicate_grades_merged"]
+    print(f"duplicate grade keys merged: {len(merged)}")
+    for item in merged:
+        print(
+            f"  student_id={item['student_id']} course_id={item['course_id']}:"
+            f" kept {item['kept']}, removed {', '.join(map(str, item['removed']))}"
+        )
+    created = result["indexes_created"]
+    print(f"indexes created: {', '.join(created) if created else '(none)'}")
@@ -6,8 +6,10 @@ from sqlalchemy import (
     Time,
     DECIMAL,
     ForeignKey,
+    Index,
     Integer,
     String,
+    UniqueConstraint,
     text,
 )
 from sqlalchemy.orm import relationship
@@ -230,6 +232,7 @@ class Teacher(Base):
 
 class Student(Base):
     __tablename__ = "students"
+    __table_args__ = (Index("ix_students_class", "class_id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True)
@@ -249,6 +252,11 @@ class Student(Base):
 
 class Course(Base):
     __tablename__ = "courses"
+    __table_args__ = (
+        Index("ix_courses_teacher", "teacher_id"),
+        Index("ix_courses_term", "term_id"),
+        Index("ix_courses_class", "class_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), nullable=False, unique=True)
@@ -272,6 +280,7 @@ class Course(Base):
 
 class StudentStatusLog(Base):
     __tablename__ = "student_status_logs"
+    __table_args__ = (Index("ix_student_status_logs_student", "student_id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
@@ -312,6 +321,15 @@ class TrainingPlanItem(Base):
 
 class ScheduleEntry(Base):
     __tablename__ = "schedule_entries"
+    # 按 班级/教师/教室 + 星期 + 节次：既服务冲突检测（维度 IN + weekday），也让单人课表按序读取免排序；
+    # (weekday, start_slot) 兜底带 location 或无维度的冲突查询
+    __table_args__ = (
+        Index("ix_schedule_entries_class_slot", "class_id", "weekday", "start_slot"),
+        Index("ix_schedule_entries_teacher_slot", "teacher_id", "weekday", "start_slot"),
+        Index("ix_schedule_entries_room_slot", "room_id", "weekday", "start_slot"),
+        Index("ix_schedule_entries_weekday_slot", "weekday", "start_slot"),
+        Index("ix_schedule_entries_course", "course_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
@@ -332,6 +350,11 @@ class ScheduleEntry(Base):
 
 class Grade(Base):
     __tablename__ = "grades"
+    __table_args__ = (
+        UniqueConstraint("student_id", "course_id", name="uq_grades_student_course"),
+        Index("ix_grades_course_status", "course_id", "status"),
+        Index("ix_grades_status", "status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
@@ -351,6 +374,7 @@ class Grade(Base):
 
 class GradeAudit(Base):
     __tablename__ = "grade_audits"
+    __table_args__ = (Index("ix_grade_audits_grade", "grade_id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     grade_id = Column(Integer, ForeignKey("grades.id"), nullable=False)
@@ -364,6 +388,12 @@ class GradeAudit(Base):
 
 class Exam(Base):
     __tablename__ = "exams"
+    __table_args__ = (
+        Index("ix_exams_date", "exam_date"),
+        Index("ix_exams_term_date", "term_id", "exam_date"),
+        Index("ix_exams_course", "course_id"),
+        Index("ix_exams_class", "class_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
@@ -382,3 +412,13 @@ class Exam(Base):
     term = relationship("Term", backref="exams")
     class_info = relationship("Class", backref="exams")
     room = relationship("Room", back_populates="exams")
+
+
+class DashboardCounter(Base):
+    __tablename__ = "dashboard_counters"
+
+    # 基础计数（students/teachers/...）或按日期分桶的考试数（exams_on:YYYY-MM-DD）
+    name = Column(String(100), primary_key=True)
+    value = Column(Integer, nullable=False, server_default=text("0"))
+    reconciled_at = Column(DateTime)
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
@@ -0,0 +1,84 @@
+"""Keyset (cursor) pagination for list endpoints.
+
+响应体仍是列表，分页元数据放在响应头中，便于现有前端无改动接入：
+
+- ``X-Next-Cursor``：下一页游标（没有更多数据时不返回）
+- ``X-Total-Count``：满足筛选条件的总数（仅在 ``with_total=true`` 时计算）
+
+游标是排序键取值的 base64url(JSON)，排序键最后一列必须唯一（通常是 id）。
+
+不带 ``limit`` 也不带 ``cursor`` 时与旧接口一致，返回全部结果（不截断，也没有游标头）；
+只带 ``cursor`` 时按 ``PAGE_SIZE_DEFAULT`` 取一页。
+"""
+
+import base64
+import json
+import os
+from typing import Optional, Sequence
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query as ORMQuery
+
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+MAX_PAGE_SIZE = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+
+class PageParams:
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; omit for all rows"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from X-Next-Cursor"),
+        with_total: bool = Query(False, description="Also return X-Total-Count"),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.with_total = with_total
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps(list(values), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _after(keys: Sequence, values: Sequence):
+    # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...，各数据库都能走索引前缀
+    clauses = []
+    for i, key in enumerate(keys):
+        prefix = [keys[j] == values[j] for j in range(i)]
+        clauses.append(and_(*prefix, key > values[i]))
+    return or_(*clauses)
+
+
+def paginate(query: ORMQuery, keys: Sequence, page: PageParams, response: Response) -> list:
+    """按 ``keys`` 升序取一页，并把 next cursor / total 写入响应头。"""
+    if page.with_total:
+        response.headers[TOTAL_COUNT_HEADER] = str(query.order_by(None).count())
+    if page.cursor:
+        query = query.filter(_after(keys, decode_cursor(page.cursor, len(keys))))
+    query = query.order_by(None).order_by(*keys)
+    limit = page.limit or (DEFAULT_PAGE_SIZE if page.cursor else None)
+    if limit is None:
+        return query.all()
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            [getattr(last, key.key) for key in keys]
+        )
+    return rows
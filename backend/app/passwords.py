@@ -0,0 +1,164 @@
+"""Password hashing backed by a bounded process pool.
+
+存储格式::
+
+    scrypt$<n>$<r>$<p>$<salt hex>$<hash hex>
+    pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>
+
+不带上述前缀的旧数据视为明文，登录成功后由 ``needs_rehash`` 触发惰性升级。
+KDF 计算放到独立进程里执行，不占用请求线程的 GIL；``PASSWORD_HASH_WORKERS=0``
+时退化为进程内计算（便于调试）。
+"""
+
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, List, Optional
+
+SCRYPT = "scrypt"
+PBKDF2 = "pbkdf2_sha256"
+
+ALGORITHM = os.getenv("PASSWORD_HASH_ALGO", SCRYPT)
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2**14)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "600000"))
+WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+BATCH_CHUNKSIZE = int(os.getenv("PASSWORD_HASH_CHUNKSIZE", "32"))
+
+
+def _current_params() -> tuple:
+    if ALGORITHM == PBKDF2:
+        return (PBKDF2, PBKDF2_ITERATIONS)
+    return (SCRYPT, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def _derive(password: str, salt: bytes, params: tuple) -> bytes:
+    if params[0] == PBKDF2:
+        return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, params[1])
+    _, n, r, p = params
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=n * r * 256, dklen=32
+    )
+
+
+def _parse(stored: str) -> Optional[tuple]:
+    parts = stored.split("$")
+    try:
+        if parts[0] == SCRYPT and len(parts) == 6:
+            return (SCRYPT, int(parts[1]), int(parts[2]), int(parts[3])), parts[4], parts[5]
+        if parts[0] == PBKDF2 and len(parts) == 4:
+            return (PBKDF2, int(parts[1])), parts[2], parts[3]
+    except ValueError:
+        return None
+    return None
+
+
+def hash_password(password: str, params: Optional[tuple] = None) -> str:
+    """Hash in the calling process; the pool workers run this function."""
+    params = params or _current_params()
+    salt = secrets.token_bytes(16)
+    digest = _derive(password, salt, params)
+    head = "$".join(str(v) for v in params)
+    return f"{head}${salt.hex()}${digest.hex()}"
+
+
+# 用户不存在时用它走一遍同参数的 KDF，让响应时间与密码错误时一致（不泄露用户名是否存在）；
+# 摘要全零，任何密码都校验不通过
+DUMMY_HASH = "$".join([*(str(v) for v in _current_params()), "00" * 16, "00" * 32])
+
+
+def verify_password(password: str, stored: Optional[str]) -> bool:
+    if not stored:
+        return False
+    parsed = _parse(stored)
+    if parsed is None:
+        # 旧版明文
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8"))
+    params, salt_hex, digest_hex = parsed
+    try:
+        digest = _derive(password, bytes.fromhex(salt_hex), params)
+        return hmac.compare_digest(digest.hex(), digest_hex)
+    except ValueError:
+        return False
+
+
+def is_hashed(stored: Optional[str]) -> bool:
+    return bool(stored) and _parse(stored) is not None
+
+
+def needs_rehash(stored: Optional[str]) -> bool:
+    parsed = _parse(stored) if stored else None
+    return parsed is None or parsed[0] != _current_params()
+
+
+def _hash_with(args: tuple) -> str:
+    password, params = args
+    return hash_password(password, params)
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = WORKERS, chunksize: int = BATCH_CHUNKSIZE):
+        self.workers = workers
+        self.chunksize = chunksize
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> Optional[Executor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn：避免在多线程的 uvicorn 进程里 fork
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._pool
+
+    def hash(self, password: str) -> str:
+        pool = self._executor()
+        if pool is None:
+            return hash_password(password)
+        return pool.submit(hash_password, password, _current_params()).result()
+
+    def hash_many(self, passwords: Iterable[str]) -> List[str]:
+        params = _current_params()
+        items = [(pw, params) for pw in passwords]
+        pool = self._executor()
+        if pool is None or len(items) <= 1:
+            return [_hash_with(item) for item in items]
+        return list(pool.map(_hash_with, items, chunksize=self.chunksize))
+
+    def verify(self, password: str, stored: Optional[str]) -> bool:
+        pool = self._executor()
+        if pool is None or not is_hashed(stored):
+            return verify_password(password, stored)
+        return pool.submit(verify_password, password, stored).result()
+
+    async def verify_async(self, password: str, stored: Optional[str]) -> bool:
+        pool = self._executor()
+        if pool is None or not is_hashed(stored):
+            return verify_password(password, stored)
+        return await asyncio.wrap_future(pool.submit(verify_password, password, stored))
+
+    async def hash_async(self, password: str) -> str:
+        pool = self._executor()
+        if pool is None:
+            return hash_password(password)
+        return await asyncio.wrap_future(pool.submit(hash_password, password, _current_params()))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,77 @@
+"""Integer bit assignment for role and permission codes.
+
+每个权限码 / 角色码分配一个固定的 bit，Principal 上携带预先计算好的掩码，
+require_roles / require_permissions 只需一次按位与。bit 只追加不回收，
+因此已缓存的掩码在 rebuild 之后依旧有效。
+"""
+
+import threading
+from typing import Iterable
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.seed import DEFAULT_PERMISSIONS
+
+DEFAULT_ROLES = ["ADMIN", "TEACHER", "STUDENT"]
+
+
+class _BitTable:
+    def __init__(self):
+        self._bits: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bit(self, code: str) -> int:
+        bit = self._bits.get(code)
+        if bit is None:
+            with self._lock:
+                bit = self._bits.get(code)
+                if bit is None:
+                    bit = 1 << len(self._bits)
+                    self._bits[code] = bit
+        return bit
+
+    def mask(self, codes: Iterable[str]) -> int:
+        mask = 0
+        for code in codes:
+            mask |= self.bit(code)
+        return mask
+
+    def codes(self, mask: int) -> set[str]:
+        return {code for code, bit in self._bits.items() if mask & bit}
+
+    def __len__(self):
+        return len(self._bits)
+
+
+class PermissionRegistry:
+    def __init__(self):
+        self.roles = _BitTable()
+        self.permissions = _BitTable()
+        self.version = 0
+        self.register(DEFAULT_ROLES, [p["code"] for p in DEFAULT_PERMISSIONS])
+
+    def register(self, role_codes: Iterable[str] = (), permission_codes: Iterable[str] = ()):
+        self.roles.mask(role_codes)
+        self.permissions.mask(permission_codes)
+
+    def rebuild(self, db: Session) -> None:
+        # 从库中补登记新出现的角色/权限码（已有 bit 保持不变）
+        role_codes = [code for (code,) in db.query(models.Role.code).order_by(models.Role.id)]
+        perm_codes = [
+            code for (code,) in db.query(models.Permission.code).order_by(models.Permission.code)
+        ]
+        self.register(role_codes, perm_codes)
+        self.version += 1
+
+    def role_mask(self, codes: Iterable[str]) -> int:
+        return self.roles.mask(codes)
+
+    def permission_mask(self, codes: Iterable[str]) -> int:
+        return self.permissions.mask(codes)
+
+    def stats(self) -> dict:
+        return {"roles": len(self.roles), "permissions": len(self.permissions), "version": self.version}
+
+
+permission_registry = PermissionRegistry()
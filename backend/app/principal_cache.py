@@ -0,0 +1,208 @@
+"""Token -> principal snapshot cache used by ``get_current_user``.
+
+缓存的是与 Session 脱离的只读快照（用户、角色码、权限码、学员/班级、教师 id），
+角色/权限/密码/学籍变更时由对应接口显式失效。快照同时携带角色/权限位掩码，
+见 ``app.permission_registry``。
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app import models
+from app.permission_registry import permission_registry
+
+
+@dataclass(frozen=True)
+class RoleRef:
+    id: int
+    code: str
+    name: str
+
+
+@dataclass(frozen=True)
+class ClassRef:
+    id: int
+    code: str
+    name: str
+    major_id: Optional[int] = None
+    term_id: Optional[int] = None
+    grade_year: Optional[int] = None
+    advisor_name: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class StudentRef:
+    id: int
+    student_no: str
+    class_id: Optional[int] = None
+    status: Optional[str] = None
+    class_info: Optional[ClassRef] = None
+
+
+@dataclass(frozen=True)
+class TeacherRef:
+    id: int
+    user_id: int
+    major_id: Optional[int] = None
+    title: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    full_name: str
+    email: Optional[str]
+    org_unit_id: Optional[int]
+    active: bool
+    roles: tuple[RoleRef, ...] = ()
+    role_codes: frozenset = field(default_factory=frozenset)
+    permission_codes: frozenset = field(default_factory=frozenset)
+    role_mask: int = 0
+    permission_mask: int = 0
+    student: Optional[StudentRef] = None
+    teacher: Optional[TeacherRef] = None
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        student = None
+        if user.student:
+            cls_obj = user.student.class_info
+            student = StudentRef(
+                id=user.student.id,
+                student_no=user.student.student_no,
+                class_id=user.student.class_id,
+                status=user.student.status,
+                class_info=ClassRef(
+                    id=cls_obj.id,
+                    code=cls_obj.code,
+                    name=cls_obj.name,
+                    major_id=cls_obj.major_id,
+                    term_id=cls_obj.term_id,
+                    grade_year=cls_obj.grade_year,
+                    advisor_name=cls_obj.advisor_name,
+                )
+                if cls_obj
+                else None,
+            )
+        teacher = None
+        if user.teacher:
+            teacher = TeacherRef(
+                id=user.teacher.id,
+                user_id=user.teacher.user_id,
+                major_id=user.teacher.major_id,
+                title=user.teacher.title,
+            )
+        roles = tuple(RoleRef(id=r.id, code=r.code, name=r.name) for r in user.roles)
+        role_codes = frozenset(r.code for r in roles)
+        perms = frozenset(p.code for r in user.roles for p in r.permissions)
+        return cls(
+            id=user.id,
+            username=user.username,
+            full_name=user.full_name,
+            email=user.email,
+            org_unit_id=user.org_unit_id,
+            active=bool(user.active),
+            roles=roles,
+            role_codes=role_codes,
+            permission_codes=perms,
+            role_mask=permission_registry.role_mask(role_codes),
+            permission_mask=permission_registry.permission_mask(perms),
+            student=student,
+            teacher=teacher,
+        )
+
+
+class PrincipalCache:
+    """Bounded LRU with per-entry TTL; ``ttl <= 0`` disables caching."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[float, Principal]]" = OrderedDict()
+        self._tokens_by_user: dict[int, set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, principal = entry
+            if expires_at <= now:
+                self._drop(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return principal
+
+    def put(self, token: str, principal: Principal) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if token in self._entries:
+                self._drop(token)
+            self._entries[token] = (time.monotonic() + self.ttl, principal)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._drop(token)
+            self.invalidations += 1
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, token: str) -> None:
+        _, principal = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(principal.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[principal.id]
+
+
+principal_cache = PrincipalCache(
+    max_size=int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "60")),
+)
@@ -0,0 +1,143 @@
+"""Versioned reference data (terms, majors, orgs, classes, rooms, teachers, permissions, roles).
+
+每张基础表在 ``dashboard_counters`` 里有一行版本号（``refdata:<table>``），
+由对应的增删改接口在同一事务内递增。列表接口的响应体按
+(接口, 查询参数, 相关表版本) 预先序列化缓存，ETag 由同一组值哈希得到：
+
+- 缓存命中时不访问数据库（版本号本身在进程内缓存 ``REFDATA_VERSION_TTL`` 秒）；
+- 请求带 ``If-None-Match`` 且匹配时直接返回 304。
+
+本进程的写操作会立即让本地版本号失效；其它 worker 的写入最多延迟
+``REFDATA_VERSION_TTL`` 秒可见。
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+from app import counters
+from app.http_cache import cached_response
+from app.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+
+REFDATA_CACHE_SIZE = int(os.getenv("REFDATA_CACHE_SIZE", "512"))
+REFDATA_VERSION_TTL = float(os.getenv("REFDATA_VERSION_TTL", "2"))
+PREFIX = "refdata:"
+
+TERMS = "terms"
+MAJORS = "majors"
+ORGS = "orgs"
+CLASSES = "classes"
+ROOMS = "rooms"
+TEACHERS = "teachers"
+PERMISSIONS = "permissions"
+ROLES = "roles"
+TABLES = (TERMS, MAJORS, ORGS, CLASSES, ROOMS, TEACHERS, PERMISSIONS, ROLES)
+
+_PASSTHROUGH_HEADERS = (NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER)
+
+
+class _Body:
+    __slots__ = ("etag", "body", "headers")
+
+    def __init__(self, etag: str, body: bytes, headers: Dict[str, str]):
+        self.etag = etag
+        self.body = body
+        self.headers = headers
+
+
+class ReferenceDataCache:
+    def __init__(self, max_size: int = REFDATA_CACHE_SIZE, version_ttl: float = REFDATA_VERSION_TTL):
+        self.max_size = max_size
+        self.version_ttl = version_ttl
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._versions_at = 0.0
+        self._bodies: "OrderedDict[tuple, _Body]" = OrderedDict()
+        self._adapters: Dict[Any, TypeAdapter] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    # -- 版本号 -------------------------------------------------------------
+    def versions(self, db: Session, tables: Sequence[str]) -> tuple:
+        with self._lock:
+            fresh = time.monotonic() - self._versions_at < self.version_ttl
+            if fresh and all(t in self._versions for t in tables):
+                return tuple(self._versions[t] for t in tables)
+        # 一次取回全部基础表版本
+        values = counters.read_many(db, [PREFIX + t for t in TABLES])
+        with self._lock:
+            self._versions = {t: values[PREFIX + t] for t in TABLES}
+            self._versions_at = time.monotonic()
+            return tuple(self._versions[t] for t in tables)
+
+    def bump(self, db: Session, *tables: str) -> None:
+        """在写事务中调用；本地版本号同时失效，下次读取回源。"""
+        for table in tables:
+            counters.bump(db, PREFIX + table)
+        with self._lock:
+            self._versions_at = 0.0
+
+    # -- 响应 ---------------------------------------------------------------
+    def _adapter(self, schema) -> TypeAdapter:
+        adapter = self._adapters.get(schema)
+        if adapter is None:
+            adapter = self._adapters[schema] = TypeAdapter(schema)
+        return adapter
+
+    def respond(
+        self,
+        request: Request,
+        db: Session,
+        endpoint: str,
+        tables: Sequence[str],
+        schema,
+        build: Callable[[Response], Any],
+        params: Optional[dict] = None,
+    ) -> Response:
+        """``build`` 在未命中时执行查询，可在传入的 Response 上设置分页头。"""
+        params = tuple(sorted((k, str(v)) for k, v in (params or {}).items() if v is not None))
+        key = (endpoint, params, self.versions(db, tables))
+        with self._lock:
+            cached = self._bodies.get(key)
+            if cached is not None:
+                self._bodies.move_to_end(key)
+                self.hits += 1
+        if cached is None:
+            scratch = Response()
+            adapter = self._adapter(schema)
+            body = adapter.dump_json(adapter.validate_python(build(scratch), from_attributes=True))
+            digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:24]
+            headers = {h: scratch.headers[h] for h in _PASSTHROUGH_HEADERS if h in scratch.headers}
+            cached = _Body(f'"{digest}"', body, headers)
+            with self._lock:
+                self._bodies[key] = cached
+                while len(self._bodies) > self.max_size:
+                    self._bodies.popitem(last=False)
+                self.misses += 1
+        response = cached_response(request, cached.body, cached.etag, headers=cached.headers)
+        if response.status_code == 304:
+            with self._lock:
+                self.not_modified += 1
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._bodies),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "versions": dict(self._versions),
+            }
+
+
+refdata_cache = ReferenceDataCache()
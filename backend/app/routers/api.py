@@ -1,12 +1,42 @@
-﻿from typing import List, Optional
-
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import or_
+﻿import json
+import time
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import false, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, selectinload
 
-from app import models, schemas
+from app import (
+    analytics,
+    counters,
+    exam_allocation,
+    exports,
+    grade_upsert,
+    importer,
+    models,
+    refdata,
+    schemas,
+    timetable_grid,
+    timetable_solver,
+)
+from app.ai_cache import ai_cache
+from app.ai_client import ai_client
 from app.ai_client import chat as ai_chat
-from app.db import get_db
+from app.db import get_db, get_read_db
+from app.http_cache import cached_response
+from app.metrics import metrics
+from app.pagination import PageParams, paginate
+from app.passwords import password_hasher
+from app.permission_registry import permission_registry
+from app.principal_cache import Principal, principal_cache
+from app.refdata import refdata_cache
+from app.schedule_index import REVISION_COUNTER, SCHEDULE_INDEX_ENABLED, schedule_index
+from app.schedule_index import check_batch as check_schedule_batch
+from app.slow_query import slow_queries
+from app.timetable_grid import timetable_grids
 from app.routers.auth import (
     get_current_user,
     get_permission_codes,
@@ -43,7 +73,7 @@ ROLE_MENUS = {
 
 
 @router.get("/menus", response_model=schemas.MenuResponse)
-def read_menus(current_user: models.User = Depends(get_current_user)):
+def read_menus(current_user: Principal = Depends(get_current_user)):
     role_codes = get_role_codes(current_user)
     menus: list[schemas.MenuItem] = []
     for code in role_codes:
@@ -54,22 +84,36 @@ def read_menus(current_user: models.User = Depends(get_current_user)):
 
 @router.get("/permissions", response_model=List[schemas.PermissionOut])
 def list_permissions(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_permissions(["permission:read"])),
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_permissions(["permission:read"])),
 ):
-    return db.query(models.Permission).order_by(models.Permission.code).all()
+    return refdata_cache.respond(
+        request,
+        db,
+        "permissions",
+        [refdata.PERMISSIONS],
+        List[schemas.PermissionOut],
+        lambda _: db.query(models.Permission).order_by(models.Permission.code).all(),
+    )
 
 
 @router.get("/roles", response_model=List[schemas.RoleWithPermissions])
 def list_roles(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_permissions(["role:read"])),
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_permissions(["role:read"])),
 ):
-    return (
-        db.query(models.Role)
+    return refdata_cache.respond(
+        request,
+        db,
+        "roles",
+        [refdata.ROLES, refdata.PERMISSIONS],
+        List[schemas.RoleWithPermissions],
+        lambda _: db.query(models.Role)
         .options(selectinload(models.Role.permissions))
         .order_by(models.Role.id)
-        .all()
+        .all(),
     )
 
 
@@ -78,7 +122,7 @@ def update_role_permissions(
     role_id: int,
     payload: schemas.RolePermissionUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_permissions(["permission:assign", "role:write"])),
+    current_user: Principal = Depends(require_permissions(["permission:assign", "role:write"])),
 ):
     role = db.get(models.Role, role_id)
     if not role:
@@ -91,7 +135,10 @@ def update_role_permissions(
         else []
     )
     role.permissions = perms
+    refdata_cache.bump(db, refdata.ROLES)
     db.commit()
+    permission_registry.rebuild(db)
+    principal_cache.invalidate_all()
     db.refresh(role)
     db.refresh(role, attribute_names=["permissions"])
     return role
@@ -102,8 +149,10 @@ def list_users(
     q: Optional[str] = Query(None, description="Search by username/full_name"),
     role_code: Optional[str] = None,
     active: Optional[bool] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_permissions(["user:read"])),
+    response: Response = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_permissions(["user:read"])),
 ):
     query = db.query(models.User).options(selectinload(models.User.roles))
     if q:
@@ -118,17 +167,34 @@ def list_users(
         query = query.join(models.User.roles).filter(models.Role.code == role_code)
     if active is not None:
         query = query.filter(models.User.active == active)
-    return query.all()
+    return paginate(query, [models.User.id], page, response)
 
 
 @router.post("/users", response_model=schemas.UserDetailOut, status_code=status.HTTP_201_CREATED)
-def create_user(
+async def create_user(
     payload: schemas.UserCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_permissions(["user:write"])),
+    current_user: Principal = Depends(require_permissions(["user:write"])),
 ):
-    if db.query(models.User).filter(models.User.username == payload.username).first():
+    # 先查重再算哈希，会被拒绝的请求不做 KDF；查完结束事务，哈希期间不占 SQLite 写通道
+    if await run_in_threadpool(_username_taken, db, payload.username):
         raise HTTPException(status_code=400, detail="Username already exists")
+    password_hash = await password_hasher.hash_async(payload.password)
+    try:
+        return await run_in_threadpool(_insert_user, db, payload, password_hash)
+    except IntegrityError:
+        # 哈希期间被别的请求抢先建了同名用户
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(status_code=400, detail="Username already exists")
+
+
+def _username_taken(db: Session, username: str) -> bool:
+    taken = db.query(models.User.id).filter(models.User.username == username).first() is not None
+    db.rollback()
+    return taken
+
+
+def _insert_user(db: Session, payload: schemas.UserCreate, password_hash: str) -> models.User:
     roles: list[models.Role] = []
     if payload.role_codes:
         roles = (
@@ -136,13 +202,14 @@ def create_user(
         )
     user = models.User(
         username=payload.username,
-        password_hash=payload.password,
+        password_hash=password_hash,
         full_name=payload.full_name,
         email=payload.email,
         org_unit_id=payload.org_unit_id,
         roles=roles,
     )
     db.add(user)
+    refdata_cache.bump(db, refdata.TEACHERS)
     db.commit()
     db.refresh(user)
     db.refresh(user, attribute_names=["roles"])
@@ -154,7 +221,7 @@ def update_user_roles(
     user_id: int,
     payload: schemas.UserRoleUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_permissions(["user:write"])),
+    current_user: Principal = Depends(require_permissions(["user:write"])),
 ):
     user = db.get(models.User, user_id)
     if not user:
@@ -166,105 +233,103 @@ def update_user_roles(
     )
     user.roles = roles
     db.commit()
+    principal_cache.invalidate_user(user.id)
     db.refresh(user)
     db.refresh(user, attribute_names=["roles"])
     return user
 
 
 @router.post("/users/{user_id}/reset-password")
-def reset_user_password(
+async def reset_user_password(
     user_id: int,
     payload: schemas.PasswordResetRequest,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_permissions(["user:write"])),
+    current_user: Principal = Depends(require_permissions(["user:write"])),
 ):
-    user = db.get(models.User, user_id)
-    if not user:
+    if not await run_in_threadpool(_user_exists, db, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    password_hash = await password_hasher.hash_async(payload.password)
+    if not await run_in_threadpool(_store_user_password, db, user_id, password_hash):
         raise HTTPException(status_code=404, detail="User not found")
-    user.password_hash = payload.password
+    principal_cache.invalidate_user(user_id)
+    return {"success": True}
+
+
+def _user_exists(db: Session, user_id: int) -> bool:
+    exists = db.query(models.User.id).filter(models.User.id == user_id).first() is not None
+    db.rollback()
+    return exists
+
+
+def _store_user_password(db: Session, user_id: int, password_hash: str) -> bool:
+    updated = db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.password_hash: password_hash}, synchronize_session=False
+    )
     db.commit()
+    return bool(updated)
+
+
+@router.get("/admin/slow-queries")
+def list_slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
+):
+    # 最近的慢查询（新的在前），含执行计划；SQL 已归一化，参数只有类型
+    return {"stats": slow_queries.stats(), "records": slow_queries.records(limit)}
+
+
+@router.delete("/admin/slow-queries")
+def clear_slow_queries(current_user: Principal = Depends(require_roles(["ADMIN"]))):
+    slow_queries.clear()
     return {"success": True}
 
 
+@router.get("/admin/n-plus-one")
+def n_plus_one_stats(current_user: Principal = Depends(require_roles(["ADMIN"]))):
+    # 样例里带原始 SQL，只对管理员开放
+    return metrics.n_plus_one_stats()
+
+
 def _course_risk_snapshot(db: Session, class_keyword: Optional[str] = None, limit: int = 5):
     # 按课程统计挂科风险（不及格率）
-    results = []
-    course_query = (
-        db.query(models.Course, models.Class, models.Term)
-        .join(models.Class, models.Course.class_id == models.Class.id)
-        .join(models.Term, models.Course.term_id == models.Term.id)
+    return analytics.course_risk(db, class_keyword=class_keyword, limit=limit)
+
+
+@router.get("/analytics/course-risk", response_model=List[schemas.CourseRiskOut])
+def course_risk(
+    term_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    major_id: Optional[int] = None,
+    class_keyword: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_roles(["ADMIN", "TEACHER"])),
+):
+    return analytics.course_risk(
+        db,
+        term_id=term_id,
+        class_id=class_id,
+        major_id=major_id,
+        class_keyword=class_keyword,
+        limit=limit,
     )
-    if class_keyword:
-        like_pattern = f"%{class_keyword}%"
-        course_query = course_query.filter(models.Class.name.like(like_pattern) | models.Class.code.like(like_pattern))
-    for course, cls, term in course_query.all():
-        grades = (
-            db.query(models.Grade)
-            .filter(models.Grade.course_id == course.id)
-            .all()
-        )
-        total = len(grades)
-        if total == 0:
-            continue
-        fail_cnt = 0
-        scores = []
-        for g in grades:
-            score = None
-            if g.total_score is not None:
-                score = float(g.total_score)
-            elif g.final_score is not None:
-                score = float(g.final_score)
-            if score is not None:
-                scores.append(score)
-                if score < 60:
-                    fail_cnt += 1
-        avg_score = round(sum(scores) / len(scores), 2) if scores else None
-        risk = round(fail_cnt / total * 100, 2)
-        results.append(
-            {
-                "course": course.name,
-                "course_code": course.code,
-                "class": cls.name,
-                "term": term.name if term else None,
-                "avg_score": avg_score,
-                "fail_ratio": risk,
-                "fail_count": fail_cnt,
-                "total": total,
-            }
-        )
-    return sorted(results, key=lambda x: x["fail_ratio"], reverse=True)[:limit]
 
 
 def _weekly_teaching_snapshot(db: Session):
     # 简单统计：课程数、班级数、教师数、即将到来的考试数（14天内）、已发布成绩数
-    from datetime import date, timedelta
-
-    today = date.today()
-    in_two_weeks = today + timedelta(days=14)
-    exams = (
-        db.query(models.Exam)
-        .filter(models.Exam.exam_date != None)  # noqa: E711
-        .filter(models.Exam.exam_date >= today)
-        .filter(models.Exam.exam_date <= in_two_weeks)
-        .count()
-    )
-    published_grades = db.query(models.Grade).filter(models.Grade.status == "published").count()
+    snapshot = counters.snapshot(db)
     return {
-        "courses": db.query(models.Course).count(),
-        "classes": db.query(models.Class).count(),
-        "teachers": db.query(models.Teacher).count(),
-        "students": db.query(models.Student).count(),
-        "upcoming_exams_14d": exams,
-        "published_grades": published_grades,
+        "courses": snapshot[counters.COURSES],
+        "classes": snapshot[counters.CLASSES],
+        "teachers": snapshot[counters.TEACHERS],
+        "students": snapshot[counters.STUDENTS],
+        "upcoming_exams_14d": counters.upcoming_exams(db, days=14),
+        "published_grades": snapshot[counters.PUBLISHED_GRADES],
     }
 
 
-@router.post("/ai/assistant", response_model=schemas.AIResponse)
-def ai_assistant(
-    payload: schemas.AIRequest,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
-):
+def _assistant_messages(db: Session, current_user: Principal, payload: schemas.AIRequest) -> tuple[list[dict], bool]:
+    """返回 (messages, 上下文快照是否来自缓存)。"""
     role_codes = get_role_codes(current_user)
     perms = list(get_permission_codes(current_user))
 
@@ -276,12 +341,21 @@ def ai_assistant(
     if "TEACHER" in role_codes and current_user.teacher:
         context_parts.append("教师身份: 可查看自己课程数据")
 
+    context_cached = False
     if payload.task == "risk_courses":
         class_kw = payload.params.get("class_keyword") if payload.params else None
-        risk_data = _course_risk_snapshot(db, class_keyword=class_kw)
+        risk_data, context_cached = ai_cache.context(
+            db,
+            payload.task,
+            {"class_keyword": class_kw},
+            lambda: _course_risk_snapshot(db, class_keyword=class_kw),
+            bypass=payload.no_cache,
+        )
         context_parts.append(f"挂科风险最高课程（按不及格率排序，最多5条）: {risk_data}")
     elif payload.task == "weekly_report":
-        snapshot = _weekly_teaching_snapshot(db)
+        snapshot, context_cached = ai_cache.context(
+            db, payload.task, None, lambda: _weekly_teaching_snapshot(db), bypass=payload.no_cache
+        )
         context_parts.append(f"教学运行概况: {snapshot}")
 
     system_prompt = (
@@ -294,37 +368,115 @@ def ai_assistant(
         {"role": "system", "content": combined_context},
         {"role": "user", "content": payload.prompt},
     ]
-    answer = ai_chat(messages)
-    return schemas.AIResponse(answer=answer, used_prompt=payload.prompt)
+    return messages, context_cached
+
+
+@router.post("/ai/assistant", response_model=schemas.AIResponse)
+async def ai_assistant(
+    payload: schemas.AIRequest,
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    # 查库部分放到线程池，等待模型期间不占用 worker
+    messages, context_cached = await run_in_threadpool(_assistant_messages, db, current_user, payload)
+    cache_key = ai_cache.answer_key(messages, ai_client.model_id())
+    answer = ai_cache.get_answer(cache_key, bypass=payload.no_cache)
+    cached = answer is not None
+    if not cached:
+        answer = await ai_chat(messages)
+        ai_cache.put_answer(cache_key, answer)
+    return schemas.AIResponse(
+        answer=answer, used_prompt=payload.prompt, cached=cached, context_cached=context_cached
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post("/ai/assistant/stream")
+async def ai_assistant_stream(
+    payload: schemas.AIRequest,
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """SSE 版本：context → delta* → done（或 error）。客户端断开时取消上游请求。
+
+    答案缓存命中时只发一个 delta；只有完整收到的答案才写入缓存。
+    """
+    started = time.perf_counter()
+    messages, context_cached = await run_in_threadpool(_assistant_messages, db, current_user, payload)
+    cache_key = ai_cache.answer_key(messages, ai_client.model_id())
+    cached_answer = ai_cache.get_answer(cache_key, bypass=payload.no_cache)
+
+    async def events():
+        yield _sse(
+            "context",
+            {"task": payload.task, "summary": messages[1]["content"], "context_cached": context_cached},
+        )
+        first_token_ms = None
+        parts = []
+        if cached_answer is not None:
+            first_token_ms = int((time.perf_counter() - started) * 1000)
+            parts.append(cached_answer)
+            yield _sse("delta", {"content": cached_answer})
+        else:
+            upstream = ai_client.stream(messages)
+            try:
+                async for delta in upstream:
+                    if first_token_ms is None:
+                        first_token_ms = int((time.perf_counter() - started) * 1000)
+                    parts.append(delta)
+                    yield _sse("delta", {"content": delta})
+                    if await request.is_disconnected():
+                        return
+            except HTTPException as exc:
+                yield _sse("error", {"status": exc.status_code, "detail": exc.detail})
+                return
+            finally:
+                await upstream.aclose()
+            ai_cache.put_answer(cache_key, "".join(parts))
+        yield _sse(
+            "done",
+            {
+                "ttft_ms": first_token_ms,
+                "duration_ms": int((time.perf_counter() - started) * 1000),
+                "chars": sum(len(p) for p in parts),
+                "cached": cached_answer is not None,
+            },
+        )
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/home")
 def read_home(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     role_codes = get_role_codes(current_user)
-    counters = {
-        "students": db.query(models.Student).count(),
-        "teachers": db.query(models.Teacher).count(),
-        "courses": db.query(models.Course).count(),
-        "classes": db.query(models.Class).count(),
+    snapshot = counters.snapshot(db)
+    payload = {
+        "roles": list(role_codes),
+        "counters": {
+            name: snapshot[name]
+            for name in (counters.STUDENTS, counters.TEACHERS, counters.COURSES, counters.CLASSES)
+        },
+        "counters_reconciled_at": snapshot["reconciled_at"],
     }
-    payload = {"roles": list(role_codes), "counters": counters}
 
-    schedule_preview: list[models.ScheduleEntry] = []
-    if "STUDENT" in role_codes and current_user.student:
-        schedule_preview = get_schedule_for_student(db, current_user.student.class_id)[:4]
-    elif "TEACHER" in role_codes and current_user.teacher:
-        schedule_preview = get_schedule_for_teacher(db, current_user.teacher.id)[:4]
-    payload["schedule_preview"] = [
-        schemas.ScheduleEntryOut.model_validate(item) for item in schedule_preview
-    ]
+    grid_key = _timetable_owner(current_user, role_codes)
+    payload["schedule_preview"] = timetable_grids.get(db, *grid_key).preview if grid_key else []
 
     if "STUDENT" in role_codes and current_user.student:
         grades = (
             db.query(models.Grade)
-            .options(selectinload(models.Grade.course), selectinload(models.Grade.term))
+            .options(*GRADE_OUT_LOADERS)
             .filter(models.Grade.student_id == current_user.student.id)
             .order_by(models.Grade.created_at.desc())
             .limit(5)
@@ -338,8 +490,10 @@ def read_home(
 def list_students(
     q: Optional[str] = Query(None, description="Search by student_no/name"),
     class_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN", "TEACHER"])),
+    response: Response = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_roles(["ADMIN", "TEACHER"])),
 ):
     query = (
         db.query(models.Student)
@@ -360,19 +514,37 @@ def list_students(
         )
     if class_id:
         query = query.filter(models.Student.class_id == class_id)
-    return query.all()
+    return paginate(query, [models.Student.id], page, response)
 
 
 @router.post("/students", response_model=schemas.StudentOut, status_code=status.HTTP_201_CREATED)
-def create_student(
+async def create_student(
     payload: schemas.StudentCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
-    if db.query(models.User).filter(models.User.username == payload.username).first():
-        raise HTTPException(status_code=400, detail="Username already exists")
-    if db.query(models.Student).filter(models.Student.student_no == payload.student_no).first():
-        raise HTTPException(status_code=400, detail="Student number already exists")
+    await run_in_threadpool(_check_new_student, db, payload)
+    password_hash = await password_hasher.hash_async(payload.password)
+    try:
+        return await run_in_threadpool(_insert_student, db, payload, password_hash)
+    except IntegrityError:
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(status_code=400, detail="Username or student number already exists")
+
+
+def _check_new_student(db: Session, payload: schemas.StudentCreate) -> None:
+    try:
+        if db.query(models.User).filter(models.User.username == payload.username).first():
+            raise HTTPException(status_code=400, detail="Username already exists")
+        if db.query(models.Student).filter(models.Student.student_no == payload.student_no).first():
+            raise HTTPException(status_code=400, detail="Student number already exists")
+        if not db.get(models.Class, payload.class_id):
+            raise HTTPException(status_code=404, detail="Class not found")
+    finally:
+        db.rollback()
+
+
+def _insert_student(db: Session, payload: schemas.StudentCreate, password_hash: str) -> models.Student:
     class_info = db.get(models.Class, payload.class_id)
     if not class_info:
         raise HTTPException(status_code=404, detail="Class not found")
@@ -381,9 +553,10 @@ def create_student(
         student_role = models.Role(code="STUDENT", name="Student")
         db.add(student_role)
         db.flush()
+        refdata_cache.bump(db, refdata.ROLES)
     user = models.User(
         username=payload.username,
-        password_hash=payload.password,
+        password_hash=password_hash,
         full_name=payload.full_name,
         email=payload.email,
         roles=[student_role],
@@ -391,61 +564,59 @@ def create_student(
     )
     student = models.Student(user=user, class_info=class_info, student_no=payload.student_no)
     db.add(student)
+    counters.bump(db, counters.STUDENTS)
     db.commit()
-    db.refresh(student)
-    return student
+    # 响应在事件循环里序列化，嵌套字段在这里一次加载好
+    return (
+        db.query(models.Student)
+        .options(
+            selectinload(models.Student.user),
+            selectinload(models.Student.class_info),
+            selectinload(models.Student.status_logs),
+        )
+        .filter(models.Student.id == student.id)
+        .one()
+    )
 
 
-@router.post("/students/import")
+@router.post("/students/import", response_model=schemas.StudentImportResult)
 def import_students(
     payload: schemas.StudentImport,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
-    created = 0
-    skipped = 0
-    for item in payload.students:
-        if db.query(models.User).filter(models.User.username == item.username).first():
-            skipped += 1
-            continue
-        class_info = db.get(models.Class, item.class_id)
-        if not class_info:
-            skipped += 1
-            continue
-        student_role = db.query(models.Role).filter(models.Role.code == "STUDENT").first()
-        if not student_role:
-            student_role = models.Role(code="STUDENT", name="Student")
-            db.add(student_role)
-            db.flush()
-        user = models.User(
-            username=item.username,
-            password_hash=item.password,
-            full_name=item.full_name,
-            email=item.email,
-            roles=[student_role],
-            org_unit=class_info.major.org_unit if class_info.major else None,
-        )
-        student = models.Student(user=user, class_info=class_info, student_no=item.student_no)
-        db.add(student)
-        created += 1
-    db.commit()
-    return {"created": created, "skipped": skipped}
+    return importer.import_students(db, payload.students, chunk_size=payload.chunk_size)
 
 
 @router.get("/students/export", response_model=List[schemas.StudentOut])
 def export_students(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    q: Optional[str] = Query(None, description="Search by student_no/name"),
+    class_id: Optional[int] = None,
+    format: str = Query("json", pattern="^(json|csv|ndjson)$"),
+    columns: Optional[str] = Query(None, description="Comma-separated columns for csv/ndjson"),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
-    return (
-        db.query(models.Student)
-        .options(
+    if format == "json":
+        query = db.query(models.Student).options(
             selectinload(models.Student.user),
             selectinload(models.Student.class_info),
             selectinload(models.Student.status_logs),
         )
-        .all()
-    )
+        if q:
+            like_pattern = f"%{q}%"
+            query = query.join(models.User).filter(
+                or_(
+                    models.Student.student_no.like(like_pattern),
+                    models.User.full_name.like(like_pattern),
+                )
+            )
+        if class_id:
+            query = query.filter(models.Student.class_id == class_id)
+        return query.all()
+    names = exports.pick_columns(exports.STUDENT_COLUMNS, columns)
+    stmt = exports.student_select(names, q=q, class_id=class_id)
+    return exports.stream(db.get_bind(), stmt, names, format, "students")
 
 
 @router.put("/students/{student_id}", response_model=schemas.StudentOut)
@@ -453,7 +624,7 @@ def update_student(
     student_id: int,
     payload: schemas.StudentUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN", "TEACHER"])),
+    current_user: Principal = Depends(require_roles(["ADMIN", "TEACHER"])),
 ):
     student = (
         db.query(models.Student)
@@ -481,30 +652,43 @@ def update_student(
     if payload.status_note is not None:
         student.status_note = payload.status_note
     db.commit()
+    principal_cache.invalidate_user(student.user_id)
     db.refresh(student)
     return student
 
 
 @router.get("/classes", response_model=List[schemas.ClassOut])
 def list_classes(
+    request: Request,
     term_id: Optional[int] = None,
     major_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    query = db.query(models.Class)
-    if term_id:
-        query = query.filter(models.Class.term_id == term_id)
-    if major_id:
-        query = query.filter(models.Class.major_id == major_id)
-    return query.all()
+    def build(_):
+        query = db.query(models.Class)
+        if term_id:
+            query = query.filter(models.Class.term_id == term_id)
+        if major_id:
+            query = query.filter(models.Class.major_id == major_id)
+        return query.all()
+
+    return refdata_cache.respond(
+        request,
+        db,
+        "classes",
+        [refdata.CLASSES],
+        List[schemas.ClassOut],
+        build,
+        {"term_id": term_id, "major_id": major_id},
+    )
 
 
 @router.post("/classes", response_model=schemas.ClassOut)
 def create_class(
     payload: schemas.ClassCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     if db.query(models.Class).filter(models.Class.code == payload.code).first():
         raise HTTPException(status_code=400, detail="Class code already exists")
@@ -517,6 +701,8 @@ def create_class(
         advisor_name=payload.advisor_name,
     )
     db.add(class_obj)
+    counters.bump(db, counters.CLASSES)
+    refdata_cache.bump(db, refdata.CLASSES)
     db.commit()
     db.refresh(class_obj)
     return class_obj
@@ -527,44 +713,64 @@ def update_class(
     class_id: int,
     payload: schemas.ClassUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     class_obj = db.get(models.Class, class_id)
     if not class_obj:
         raise HTTPException(status_code=404, detail="Class not found")
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(class_obj, field, value)
+    timetable_grids.touch_all(db)
+    refdata_cache.bump(db, refdata.CLASSES)
+    # 学生的缓存身份里带着班级快照（ClassRef），改名/改代码后要一并失效
+    user_ids = [
+        uid for (uid,) in db.query(models.Student.user_id).filter(models.Student.class_id == class_id)
+    ]
     db.commit()
+    for user_id in user_ids:
+        principal_cache.invalidate_user(user_id)
     db.refresh(class_obj)
     return class_obj
 
 
 @router.get("/majors", response_model=List[schemas.MajorOut])
 def list_majors(
+    request: Request,
     active: Optional[bool] = None,
     level: Optional[str] = None,
     degree: Optional[str] = None,
     parent_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    query = db.query(models.Major)
-    if active is not None:
-        query = query.filter(models.Major.active == active)
-    if level:
-        query = query.filter(models.Major.level == level)
-    if degree:
-        query = query.filter(models.Major.degree == degree)
-    if parent_id is not None:
-        query = query.filter(models.Major.parent_id == parent_id)
-    return query.all()
+    def build(_):
+        query = db.query(models.Major)
+        if active is not None:
+            query = query.filter(models.Major.active == active)
+        if level:
+            query = query.filter(models.Major.level == level)
+        if degree:
+            query = query.filter(models.Major.degree == degree)
+        if parent_id is not None:
+            query = query.filter(models.Major.parent_id == parent_id)
+        return query.all()
+
+    return refdata_cache.respond(
+        request,
+        db,
+        "majors",
+        [refdata.MAJORS],
+        List[schemas.MajorOut],
+        build,
+        {"active": active, "level": level, "degree": degree, "parent_id": parent_id},
+    )
 
 
 @router.post("/majors", response_model=schemas.MajorOut, status_code=status.HTTP_201_CREATED)
 def create_major(
     payload: schemas.MajorCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     if db.query(models.Major).filter(models.Major.code == payload.code).first():
         raise HTTPException(status_code=400, detail="Major code already exists")
@@ -580,6 +786,7 @@ def create_major(
             raise HTTPException(status_code=404, detail="Parent major not found")
     major = models.Major(**payload.dict())
     db.add(major)
+    refdata_cache.bump(db, refdata.MAJORS)
     db.commit()
     db.refresh(major)
     return major
@@ -590,7 +797,7 @@ def update_major(
     major_id: int,
     payload: schemas.MajorUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     major = db.get(models.Major, major_id)
     if not major:
@@ -619,6 +826,7 @@ def update_major(
                 raise HTTPException(status_code=404, detail="Parent major not found")
     for field, value in data.items():
         setattr(major, field, value)
+    refdata_cache.bump(db, refdata.MAJORS)
     db.commit()
     db.refresh(major)
     return major
@@ -626,20 +834,24 @@ def update_major(
 
 @router.get("/orgs", response_model=List[schemas.OrgUnitOut])
 def list_orgs(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    return db.query(models.OrgUnit).all()
+    return refdata_cache.respond(
+        request, db, "orgs", [refdata.ORGS], List[schemas.OrgUnitOut], lambda _: db.query(models.OrgUnit).all()
+    )
 
 
 @router.post("/orgs", response_model=schemas.OrgUnitOut)
 def create_org(
     payload: schemas.OrgUnitCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     org = models.OrgUnit(name=payload.name, unit_type=payload.unit_type, parent_id=payload.parent_id)
     db.add(org)
+    refdata_cache.bump(db, refdata.ORGS)
     db.commit()
     db.refresh(org)
     return org
@@ -650,13 +862,14 @@ def update_org(
     org_id: int,
     payload: schemas.OrgUnitUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     org = db.get(models.OrgUnit, org_id)
     if not org:
         raise HTTPException(status_code=404, detail="Org not found")
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(org, field, value)
+    refdata_cache.bump(db, refdata.ORGS)
     db.commit()
     db.refresh(org)
     return org
@@ -664,17 +877,25 @@ def update_org(
 
 @router.get("/terms", response_model=List[schemas.TermOut])
 def list_terms(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    return db.query(models.Term).order_by(models.Term.start_date).all()
+    return refdata_cache.respond(
+        request,
+        db,
+        "terms",
+        [refdata.TERMS],
+        List[schemas.TermOut],
+        lambda _: db.query(models.Term).order_by(models.Term.start_date).all(),
+    )
 
 
 @router.post("/terms", response_model=schemas.TermOut, status_code=status.HTTP_201_CREATED)
 def create_term(
     payload: schemas.TermCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     if db.query(models.Term).filter(models.Term.name == payload.name).first():
         raise HTTPException(status_code=400, detail="Term name already exists")
@@ -682,6 +903,7 @@ def create_term(
     if term.is_current:
         db.query(models.Term).update({models.Term.is_current: False})
     db.add(term)
+    refdata_cache.bump(db, refdata.TERMS)
     db.commit()
     db.refresh(term)
     return term
@@ -692,7 +914,7 @@ def update_term(
     term_id: int,
     payload: schemas.TermUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     term = db.get(models.Term, term_id)
     if not term:
@@ -710,6 +932,7 @@ def update_term(
         setattr(term, k, v)
     if data.get("is_current"):
         db.query(models.Term).filter(models.Term.id != term_id).update({models.Term.is_current: False})
+    refdata_cache.bump(db, refdata.TERMS)
     db.commit()
     db.refresh(term)
     return term
@@ -719,8 +942,10 @@ def update_term(
 def list_courses(
     term_id: Optional[int] = None,
     mine: Optional[bool] = False,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    response: Response = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     query = db.query(models.Course)
     if term_id:
@@ -730,31 +955,38 @@ def list_courses(
         teacher = db.query(models.Teacher).filter(models.Teacher.user_id == current_user.id).first()
         if teacher:
             query = query.filter(models.Course.teacher_id == teacher.id)
-    return query.all()
+    return paginate(query, [models.Course.id], page, response)
 
 
 @router.get("/teachers", response_model=List[schemas.TeacherOut])
 def list_teachers(
+    request: Request,
     major_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    query = db.query(models.Teacher).options(selectinload(models.Teacher.user))
-    if major_id:
-        query = query.filter(models.Teacher.major_id == major_id)
-    return query.all()
+    def build(_):
+        query = db.query(models.Teacher).options(selectinload(models.Teacher.user))
+        if major_id:
+            query = query.filter(models.Teacher.major_id == major_id)
+        return query.all()
+
+    return refdata_cache.respond(
+        request, db, "teachers", [refdata.TEACHERS], List[schemas.TeacherOut], build, {"major_id": major_id}
+    )
 
 
 @router.post("/courses", response_model=schemas.CourseOut)
 def create_course(
     payload: schemas.CourseCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     if db.query(models.Course).filter(models.Course.code == payload.code).first():
         raise HTTPException(status_code=400, detail="Course code already exists")
     course = models.Course(**payload.dict())
     db.add(course)
+    counters.bump(db, counters.COURSES)
     db.commit()
     db.refresh(course)
     return course
@@ -765,13 +997,14 @@ def update_course(
     course_id: int,
     payload: schemas.CourseUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     course = db.get(models.Course, course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(course, field, value)
+    timetable_grids.touch_all(db)
     db.commit()
     db.refresh(course)
     return course
@@ -781,8 +1014,8 @@ def update_course(
 def list_training_plans(
     major_id: Optional[int] = None,
     entry_year: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     query = db.query(models.TrainingPlan).options(
         selectinload(models.TrainingPlan.items).selectinload(models.TrainingPlanItem.course)
@@ -798,7 +1031,7 @@ def list_training_plans(
 def create_training_plan(
     payload: schemas.TrainingPlanCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     plan = models.TrainingPlan(
         name=payload.name,
@@ -827,7 +1060,7 @@ def clone_training_plan(
     entry_year: int,
     name: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     plan = (
         db.query(models.TrainingPlan)
@@ -858,43 +1091,25 @@ def clone_training_plan(
     return new_plan
 
 
-def get_schedule_for_student(db: Session, class_id: int):
-    return (
-        db.query(models.ScheduleEntry)
-        .options(
-            selectinload(models.ScheduleEntry.course),
-            selectinload(models.ScheduleEntry.class_info),
-        )
-        .filter(models.ScheduleEntry.class_id == class_id)
-        .order_by(models.ScheduleEntry.weekday, models.ScheduleEntry.start_slot)
-        .all()
-    )
-
-
-def get_schedule_for_teacher(db: Session, teacher_id: int):
-    return (
-        db.query(models.ScheduleEntry)
-        .options(
-            selectinload(models.ScheduleEntry.course),
-            selectinload(models.ScheduleEntry.class_info),
-        )
-        .filter(models.ScheduleEntry.teacher_id == teacher_id)
-        .order_by(models.ScheduleEntry.weekday, models.ScheduleEntry.start_slot)
-        .all()
-    )
+def _timetable_owner(current_user: Principal, role_codes) -> Optional[tuple]:
+    if "STUDENT" in role_codes and current_user.student:
+        return timetable_grid.CLASS, current_user.student.class_id
+    if "TEACHER" in role_codes and current_user.teacher:
+        return timetable_grid.TEACHER, current_user.teacher.id
+    return None
 
 
 @router.get("/schedule/my", response_model=List[schemas.ScheduleEntryOut])
 def my_schedule(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    role_codes = get_role_codes(current_user)
-    if "STUDENT" in role_codes and current_user.student:
-        return get_schedule_for_student(db, current_user.student.class_id)
-    if "TEACHER" in role_codes and current_user.teacher:
-        return get_schedule_for_teacher(db, current_user.teacher.id)
-    raise HTTPException(status_code=403, detail="No schedule available")
+    grid_key = _timetable_owner(current_user, get_role_codes(current_user))
+    if grid_key is None:
+        raise HTTPException(status_code=403, detail="No schedule available")
+    grid = timetable_grids.get(db, *grid_key)
+    return cached_response(request, grid.body, grid.etag)
 
 
 @router.get("/schedule", response_model=List[schemas.ScheduleEntryOut])
@@ -902,8 +1117,10 @@ def schedule_admin(
     class_id: Optional[int] = None,
     teacher_id: Optional[int] = None,
     room_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    response: Response = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     query = (
         db.query(models.ScheduleEntry)
@@ -920,7 +1137,8 @@ def schedule_admin(
         query = query.filter(models.ScheduleEntry.teacher_id == teacher_id)
     if room_id:
         query = query.filter(models.ScheduleEntry.room_id == room_id)
-    return query.all()
+    keys = [models.ScheduleEntry.weekday, models.ScheduleEntry.start_slot, models.ScheduleEntry.id]
+    return paginate(query, keys, page, response)
 
 
 def find_schedule_conflicts(
@@ -954,13 +1172,43 @@ def find_schedule_conflicts(
     return query.all()
 
 
+def detect_schedule_conflicts(db: Session, **kwargs):
+    # 默认走内存位图索引；SCHEDULE_INDEX_ENABLED=0 时退回 SQL 查询
+    if SCHEDULE_INDEX_ENABLED:
+        return schedule_index.find_conflicts(db, **kwargs)
+    return find_schedule_conflicts(db, **kwargs)
+
+
+def _conflict_detail(conflicts) -> list[dict]:
+    return [
+        {
+            "id": c.id,
+            "course": c.course_id,
+            "class": c.class_id,
+            "teacher": c.teacher_id,
+            "weekday": c.weekday,
+            "slot": f"{c.start_slot}-{c.end_slot}",
+            "location": c.location,
+        }
+        for c in conflicts
+    ]
+
+
+@router.get("/schedule/index/check")
+def check_schedule_index(
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
+):
+    return schedule_index.self_check(db)
+
+
 @router.post("/schedule", response_model=schemas.ScheduleEntryOut)
 def create_schedule_entry(
     payload: schemas.ScheduleCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
-    conflicts = find_schedule_conflicts(
+    conflicts = detect_schedule_conflicts(
         db,
         weekday=payload.weekday,
         start_slot=payload.start_slot,
@@ -972,32 +1220,125 @@ def create_schedule_entry(
         exclude_id=None,
     )
     if conflicts:
-        detail = [
-            {
-                "id": c.id,
-                "course": c.course_id,
-                "class": c.class_id,
-                "teacher": c.teacher_id,
-                "weekday": c.weekday,
-                "slot": f"{c.start_slot}-{c.end_slot}",
-                "location": c.location,
-            }
-            for c in conflicts
-        ]
+        detail = _conflict_detail(conflicts)
         raise HTTPException(status_code=400, detail={"message": "Schedule conflict", "conflicts": detail})
     entry = models.ScheduleEntry(**payload.dict())
     db.add(entry)
+    db.flush()
+    timetable_grids.touch(db, [entry.class_id], [entry.teacher_id])
+    revision = schedule_index.bump_revision(db)
     db.commit()
     db.refresh(entry)
+    schedule_index.apply_upsert([entry], revision)
     return entry
 
 
+def _commit_schedule_items(db: Session, items, deleted_ids=()) -> list:
+    """冲突检测通过后在一个事务里删除 ``deleted_ids`` 并写入 ``items``。"""
+    touched = [(item.class_id, item.teacher_id) for item in items]
+    if deleted_ids:
+        touched += db.query(models.ScheduleEntry.class_id, models.ScheduleEntry.teacher_id).filter(
+            models.ScheduleEntry.id.in_(deleted_ids)
+        ).all()
+        db.query(models.ScheduleEntry).filter(models.ScheduleEntry.id.in_(deleted_ids)).delete(
+            synchronize_session=False
+        )
+        db.flush()
+    problems = check_schedule_batch(db, items)
+    if problems:
+        db.rollback()
+        detail = [
+            {
+                "item": p["item"],
+                "conflicts": _conflict_detail(p["existing"]),
+                "batch_conflicts": p["batch"],
+            }
+            for p in problems
+        ]
+        raise HTTPException(status_code=400, detail={"message": "Schedule conflict", "items": detail})
+    entries = [models.ScheduleEntry(**item.dict()) for item in items]
+    db.add_all(entries)
+    db.flush()
+    timetable_grids.touch(db, [c for c, _ in touched], [t for _, t in touched])
+    revision = schedule_index.bump_revision(db)
+    db.commit()
+    for entry in entries:
+        db.refresh(entry)
+    schedule_index.apply_changes(entries, deleted_ids, revision)
+    return entries
+
+
+@router.post("/schedule/batch", response_model=List[schemas.ScheduleEntryOut])
+def create_schedule_batch(
+    payload: schemas.ScheduleBatchCreate,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
+):
+    return _commit_schedule_items(db, payload.items)
+
+
+@router.post("/schedule/solve", response_model=schemas.TimetablePlan)
+def solve_timetable(
+    payload: schemas.TimetableSolveRequest,
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
+):
+    """自动排课预览：不写库，返回方案、无法排入的课程和质量评分。"""
+    if not db.get(models.Term, payload.term_id):
+        raise HTTPException(status_code=404, detail="Term not found")
+    started = time.perf_counter()
+    revision = counters.read(db, REVISION_COUNTER)
+    problem, replaced_ids = timetable_solver.build_problem(
+        db,
+        payload.term_id,
+        replace_existing=payload.replace_existing,
+        room_type_rules=payload.room_type_rules,
+        weekdays=payload.weekdays,
+        slots_per_day=payload.slots_per_day,
+    )
+    room_names = dict(db.query(models.Room.id, models.Room.name).all())
+    restarts = payload.restarts or max(1, timetable_solver.SOLVER_WORKERS)
+    solution = timetable_solver.timetable_solver.solve(
+        problem, payload.time_budget_seconds, restarts=restarts, seed=payload.seed
+    )
+    plan = timetable_solver.describe(problem, solution, room_names)
+    return schemas.TimetablePlan(
+        term_id=payload.term_id,
+        revision=revision,
+        replace_existing=payload.replace_existing,
+        replaced_entry_ids=replaced_ids,
+        restarts=restarts,
+        elapsed_ms=int((time.perf_counter() - started) * 1000),
+        **plan,
+    )
+
+
+@router.post("/schedule/solve/commit", response_model=List[schemas.ScheduleEntryOut])
+def commit_timetable(
+    payload: schemas.TimetableCommit,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
+):
+    """确认自动排课方案：课表在预览之后有变动则拒绝，需重新求解。"""
+    if counters.read(db, REVISION_COUNTER) != payload.revision:
+        raise HTTPException(status_code=409, detail="Schedule changed since preview, please solve again")
+    deleted_ids = []
+    if payload.replace_existing:
+        deleted_ids = [
+            entry_id
+            for (entry_id,) in db.query(models.ScheduleEntry.id)
+            .join(models.Course, models.Course.id == models.ScheduleEntry.course_id)
+            .filter(models.Course.term_id == payload.term_id, models.Course.active == True)  # noqa: E712
+        ]
+    return _commit_schedule_items(db, payload.entries, deleted_ids)
+
+
 @router.put("/schedule/{entry_id}", response_model=schemas.ScheduleEntryOut)
 def update_schedule_entry(
     entry_id: int,
     payload: schemas.ScheduleUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     entry = db.get(models.ScheduleEntry, entry_id)
     if not entry:
@@ -1006,10 +1347,12 @@ def update_schedule_entry(
     new_weekday = data.get("weekday", entry.weekday)
     new_start_slot = data.get("start_slot", entry.start_slot)
     new_end_slot = data.get("end_slot", entry.end_slot)
+    if new_end_slot < new_start_slot:
+        raise HTTPException(status_code=400, detail="end_slot must be >= start_slot")
     new_class_id = data.get("class_id", entry.class_id)
     new_teacher_id = data.get("teacher_id", entry.teacher_id)
     new_location = data.get("location", entry.location)
-    conflicts = find_schedule_conflicts(
+    conflicts = detect_schedule_conflicts(
         db,
         weekday=new_weekday,
         start_slot=new_start_slot,
@@ -1021,23 +1364,16 @@ def update_schedule_entry(
         exclude_id=entry_id,
     )
     if conflicts:
-        detail = [
-            {
-                "id": c.id,
-                "course": c.course_id,
-                "class": c.class_id,
-                "teacher": c.teacher_id,
-                "weekday": c.weekday,
-                "slot": f"{c.start_slot}-{c.end_slot}",
-                "location": c.location,
-            }
-            for c in conflicts
-        ]
+        detail = _conflict_detail(conflicts)
         raise HTTPException(status_code=400, detail={"message": "Schedule conflict", "conflicts": detail})
+    previous = (entry.class_id, entry.teacher_id)
     for key, value in data.items():
         setattr(entry, key, value)
+    timetable_grids.touch(db, [previous[0], entry.class_id], [previous[1], entry.teacher_id])
+    revision = schedule_index.bump_revision(db)
     db.commit()
     db.refresh(entry)
+    schedule_index.apply_upsert([entry], revision)
     return entry
 
 
@@ -1045,42 +1381,66 @@ def update_schedule_entry(
 def delete_schedule_entry(
     entry_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     entry = db.get(models.ScheduleEntry, entry_id)
     if not entry:
         raise HTTPException(status_code=404, detail="Schedule entry not found")
     db.delete(entry)
+    timetable_grids.touch(db, [entry.class_id], [entry.teacher_id])
+    revision = schedule_index.bump_revision(db)
     db.commit()
+    schedule_index.apply_delete([entry_id], revision)
     return {"success": True}
 
 
 @router.get("/rooms", response_model=List[schemas.RoomOut])
 def list_rooms(
+    request: Request,
     q: Optional[str] = None,
     room_type: Optional[str] = None,
     active: Optional[bool] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
-    query = db.query(models.Room)
-    if q:
-        query = query.filter(models.Room.name.ilike(f"%{q}%") | models.Room.code.ilike(f"%{q}%"))
-    if room_type:
-        query = query.filter(models.Room.room_type == room_type)
-    if active is not None:
-        query = query.filter(models.Room.active == active)
-    return query.order_by(models.Room.name).all()
+    def build(response: Response):
+        query = db.query(models.Room)
+        if q:
+            query = query.filter(models.Room.name.ilike(f"%{q}%") | models.Room.code.ilike(f"%{q}%"))
+        if room_type:
+            query = query.filter(models.Room.room_type == room_type)
+        if active is not None:
+            query = query.filter(models.Room.active == active)
+        return paginate(query, [models.Room.name, models.Room.id], page, response)
+
+    return refdata_cache.respond(
+        request,
+        db,
+        "rooms",
+        [refdata.ROOMS],
+        List[schemas.RoomOut],
+        build,
+        {
+            "q": q,
+            "room_type": room_type,
+            "active": active,
+            "limit": page.limit,
+            "cursor": page.cursor,
+            "with_total": page.with_total,
+        },
+    )
 
 
 @router.post("/rooms", response_model=schemas.RoomOut)
 def create_room(
     payload: schemas.RoomCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     room = models.Room(**payload.dict())
     db.add(room)
+    refdata_cache.bump(db, refdata.ROOMS)
     db.commit()
     db.refresh(room)
     return room
@@ -1091,13 +1451,15 @@ def update_room(
     room_id: int,
     payload: schemas.RoomUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     room = db.get(models.Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     for k, v in payload.dict(exclude_unset=True).items():
         setattr(room, k, v)
+    timetable_grids.touch_all(db)
+    refdata_cache.bump(db, refdata.ROOMS)
     db.commit()
     db.refresh(room)
     return room
@@ -1107,12 +1469,14 @@ def update_room(
 def delete_room(
     room_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     room = db.get(models.Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     db.delete(room)
+    timetable_grids.touch_all(db)
+    refdata_cache.bump(db, refdata.ROOMS)
     db.commit()
     return {"success": True}
 
@@ -1120,15 +1484,15 @@ def delete_room(
 @router.get("/grades/my", response_model=List[schemas.GradeOut])
 def my_grades(
     term_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["STUDENT"])),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_roles(["STUDENT"])),
 ):
     student = current_user.student
     if not student:
         raise HTTPException(status_code=404, detail="Student info not found")
     query = (
         db.query(models.Grade)
-        .options(selectinload(models.Grade.course), selectinload(models.Grade.term))
+        .options(*GRADE_OUT_LOADERS)
         .filter(models.Grade.student_id == student.id)
     )
     if term_id:
@@ -1140,7 +1504,7 @@ def my_grades(
 def upsert_grade(
     payload: schemas.GradeCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["TEACHER"])),
+    current_user: Principal = Depends(require_roles(["TEACHER"])),
 ):
     student = db.get(models.Student, payload.student_id)
     if not student:
@@ -1148,33 +1512,24 @@ def upsert_grade(
     course = db.get(models.Course, payload.course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
-    grade = (
-        db.query(models.Grade)
-        .filter(
-            models.Grade.student_id == payload.student_id,
-            models.Grade.course_id == payload.course_id,
-        )
-        .first()
+    key_filter = (
+        models.Grade.student_id == payload.student_id,
+        models.Grade.course_id == payload.course_id,
     )
-    if not grade:
-        grade = models.Grade(
-            student_id=payload.student_id, course_id=payload.course_id, term_id=payload.term_id
-        )
-        db.add(grade)
-    grade.usual_score = payload.usual_score
-    grade.final_score = payload.final_score
-    grade.total_score = round(payload.usual_score * 0.4 + payload.final_score * 0.6, 2)
-    grade.status = payload.status or "draft"
+    previous_status = db.query(models.Grade.status).filter(*key_filter).scalar()
+    grade_upsert.bulk_upsert(db, [payload])
+    published_delta = ((payload.status or "draft") == "published") - (previous_status == "published")
+    counters.bump(db, counters.PUBLISHED_GRADES, published_delta)
+    ai_cache.touch(db)
     db.commit()
-    db.refresh(grade)
-    return grade
+    return db.query(models.Grade).options(*GRADE_OUT_LOADERS).filter(*key_filter).one()
 
 
 @router.post("/grades/submit")
 def submit_grade(
     payload: schemas.GradeSubmitRequest,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["TEACHER"])),
+    current_user: Principal = Depends(require_roles(["TEACHER"])),
 ):
     grade = db.get(models.Grade, payload.grade_id)
     if not grade:
@@ -1186,6 +1541,7 @@ def submit_grade(
         grade=grade, action="submit", actor=current_user.full_name, comment=payload.comment
     )
     db.add(audit)
+    ai_cache.touch(db)
     db.commit()
     return {"status": grade.status}
 
@@ -1194,7 +1550,7 @@ def submit_grade(
 def review_grade(
     payload: schemas.GradeReviewRequest,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     grade = db.get(models.Grade, payload.grade_id)
     if not grade:
@@ -1205,6 +1561,7 @@ def review_grade(
         grade.status = "published"
         grade.reviewer = payload.reviewer or current_user.full_name
         action = "publish"
+        counters.bump(db, counters.PUBLISHED_GRADES)
     else:
         grade.status = "rejected"
         action = "reject"
@@ -1215,6 +1572,7 @@ def review_grade(
         comment=payload.comment,
     )
     db.add(audit)
+    ai_cache.touch(db)
     db.commit()
     return {"status": grade.status}
 
@@ -1223,12 +1581,15 @@ def review_grade(
 def publish_grades(
     payload: schemas.GradePublishRequest,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     grades = db.query(models.Grade).filter(models.Grade.course_id == payload.course_id).all()
+    newly_published = sum(1 for g in grades if g.status != "published")
     for g in grades:
         g.status = "published"
         g.reviewer = payload.reviewer or current_user.full_name
+    counters.bump(db, counters.PUBLISHED_GRADES, newly_published)
+    ai_cache.touch(db)
     db.commit()
     return {"published": len(grades)}
 
@@ -1239,24 +1600,56 @@ def list_grades(
     class_id: Optional[int] = None,
     status_filter: Optional[str] = Query(None, description="draft/submitted/published/rejected"),
     mine: Optional[bool] = False,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN", "TEACHER"])),
+    response: Response = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_roles(["ADMIN", "TEACHER"])),
 ):
-    query = db.query(models.Grade).options(
-        selectinload(models.Grade.course),
-        selectinload(models.Grade.term),
-        selectinload(models.Grade.student).selectinload(models.Student.user),
-        selectinload(models.Grade.student).selectinload(models.Student.class_info),
-    )
+    query = _grades_query(db, current_user, course_id, class_id, status_filter, mine)
+    if query is None:
+        return []
+    return paginate(query, [models.Grade.id], page, response)
+
+
+def _grade_teacher_scope(db: Session, current_user: Principal, mine: Optional[bool]):
+    # 非管理员教师只能看自己课程的成绩；返回 (是否可能有结果, 限定的 teacher_id)
     role_codes = get_role_codes(current_user)
     if "TEACHER" in role_codes and "ADMIN" not in role_codes:
         mine = True
     if mine and "TEACHER" in role_codes:
         teacher = db.query(models.Teacher).filter(models.Teacher.user_id == current_user.id).first()
         if not teacher:
-            return []
+            return False, None
+        return True, teacher.id
+    return True, None
+
+
+# GradeOut 嵌套 course / term / student（含 user、class_info、status_logs），一次性预加载
+GRADE_OUT_LOADERS = (
+    selectinload(models.Grade.course),
+    selectinload(models.Grade.term),
+    selectinload(models.Grade.student).selectinload(models.Student.user),
+    selectinload(models.Grade.student).selectinload(models.Student.class_info),
+    selectinload(models.Grade.student).selectinload(models.Student.status_logs),
+)
+
+
+def _grades_query(
+    db: Session,
+    current_user: Principal,
+    course_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    status_filter: Optional[str] = None,
+    mine: Optional[bool] = False,
+):
+    # 返回 None 表示教师身份但无教师档案（结果必为空）
+    visible, teacher_id = _grade_teacher_scope(db, current_user, mine)
+    if not visible:
+        return None
+    query = db.query(models.Grade).options(*GRADE_OUT_LOADERS)
+    if teacher_id:
         query = query.join(models.Course, models.Course.id == models.Grade.course_id).filter(
-            models.Course.teacher_id == teacher.id
+            models.Course.teacher_id == teacher_id
         )
     if course_id:
         query = query.filter(models.Grade.course_id == course_id)
@@ -1264,37 +1657,18 @@ def list_grades(
         query = query.join(models.Student).filter(models.Student.class_id == class_id)
     if status_filter:
         query = query.filter(models.Grade.status == status_filter)
-    return query.all()
+    return query
 
 
 @router.post("/grades/import")
 def import_grades(
     payload: schemas.GradeImport,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN", "TEACHER"])),
+    current_user: Principal = Depends(require_roles(["ADMIN", "TEACHER"])),
 ):
-    inserted = 0
-    updated = 0
-    for item in payload.grades:
-        grade = (
-            db.query(models.Grade)
-            .filter(models.Grade.student_id == item.student_id, models.Grade.course_id == item.course_id)
-            .first()
-        )
-        if not grade:
-            grade = models.Grade(
-                student_id=item.student_id,
-                course_id=item.course_id,
-                term_id=item.term_id,
-            )
-            db.add(grade)
-            inserted += 1
-        else:
-            updated += 1
-        grade.usual_score = item.usual_score
-        grade.final_score = item.final_score
-        grade.total_score = round(item.usual_score * 0.4 + item.final_score * 0.6, 2)
-        grade.status = item.status or "draft"
+    inserted, updated = grade_upsert.bulk_upsert(db, payload.grades, chunk_size=payload.chunk_size)
+    counters.refresh(db, [counters.PUBLISHED_GRADES])
+    ai_cache.touch(db)
     db.commit()
     return {"inserted": inserted, "updated": updated}
 
@@ -1303,17 +1677,22 @@ def import_grades(
 def export_grades(
     course_id: Optional[int] = None,
     class_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN", "TEACHER"])),
+    status_filter: Optional[str] = Query(None, description="draft/submitted/published/rejected"),
+    mine: Optional[bool] = False,
+    format: str = Query("json", pattern="^(json|csv|ndjson)$"),
+    columns: Optional[str] = Query(None, description="Comma-separated columns for csv/ndjson"),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_roles(["ADMIN", "TEACHER"])),
 ):
-    return list_grades(
-        course_id=course_id,
-        class_id=class_id,
-        status_filter=None,
-        mine=False,
-        db=db,
-        current_user=current_user,
-    )
+    if format == "json":
+        query = _grades_query(db, current_user, course_id, class_id, status_filter, mine)
+        return query.order_by(models.Grade.id).all() if query is not None else []
+    names = exports.pick_columns(exports.GRADE_COLUMNS, columns)
+    visible, teacher_id = _grade_teacher_scope(db, current_user, mine)
+    stmt = exports.grade_select(names, course_id, class_id, status_filter, teacher_id)
+    if not visible:
+        stmt = stmt.where(false())
+    return exports.stream(db.get_bind(), stmt, names, format, "grades")
 
 
 @router.get("/exams", response_model=List[schemas.ExamOut])
@@ -1321,8 +1700,21 @@ def list_exams(
     course_id: Optional[int] = None,
     class_id: Optional[int] = None,
     term_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    response: Response = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    query = _exams_query(db, current_user, course_id, class_id, term_id)
+    return paginate(query, [models.Exam.id], page, response)
+
+
+def _exams_query(
+    db: Session,
+    current_user: Principal,
+    course_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    term_id: Optional[int] = None,
 ):
     query = db.query(models.Exam).options(
         selectinload(models.Exam.course),
@@ -1342,22 +1734,97 @@ def list_exams(
         query = query.filter(models.Exam.class_id == class_id)
     if term_id:
         query = query.filter(models.Exam.term_id == term_id)
-    return query.all()
+    return query
 
 
 @router.get("/exams/my", response_model=List[schemas.ExamOut])
 def my_exams(
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    return _exams_query(db, current_user).order_by(models.Exam.id).all()
+
+
+def _allocation_context(db: Session, term_id: int, **kwargs):
+    if not db.get(models.Term, term_id):
+        raise HTTPException(status_code=404, detail="Term not found")
+    return exam_allocation.build_context(db, term_id, **kwargs)
+
+
+@router.post("/exams/allocate", response_model=schemas.ExamAllocationPlan)
+def allocate_exams(
+    payload: schemas.ExamAllocateRequest,
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
+):
+    """批量分配考场与监考（预览，不写库）。"""
+    options = {}
+    if payload.invigilators_per_exam is not None:
+        options["per_exam"] = payload.invigilators_per_exam
+    if payload.students_per_invigilator is not None:
+        options["students_per_invigilator"] = payload.students_per_invigilator
+    context = _allocation_context(
+        db,
+        payload.term_id,
+        exam_ids=payload.exam_ids,
+        teacher_ids=payload.teacher_ids,
+        keep_existing=payload.keep_existing,
+        **options,
+    )
+    return schemas.ExamAllocationPlan(term_id=payload.term_id, **exam_allocation.allocate(context))
+
+
+@router.post("/exams/allocate/commit", response_model=List[schemas.ExamOut])
+def commit_exam_allocation(
+    payload: schemas.ExamAllocationCommit,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
-    return list_exams(db=db, current_user=current_user)
+    """写入分配方案；写入前按当前库中的占用重新校验容量和冲突。"""
+    exam_ids = [item.exam_id for item in payload.assignments]
+    context = _allocation_context(db, payload.term_id, exam_ids=exam_ids, per_exam=0)
+    slots = {slot.exam_id: slot for slot in context.slots}
+    problems = []
+    for item in payload.assignments:
+        slot = slots.get(item.exam_id)
+        if slot is None:
+            problems.append({"exam_id": item.exam_id, "errors": ["exam not found in term"]})
+            continue
+        room = context.rooms.get(item.room_id) if item.room_id else None
+        errors = []
+        if item.room_id and room is None:
+            errors.append(f"room {item.room_id} not found or inactive")
+        unknown = [t for t in item.invigilator_ids if t not in context.teacher_names]
+        if unknown:
+            errors.append(f"unknown invigilators {unknown}")
+        errors += context.allocator.check(
+            slot, item.room_id if room else None, item.invigilator_ids, room.capacity if room else None
+        )
+        if errors:
+            problems.append({"exam_id": item.exam_id, "errors": errors})
+        else:
+            context.allocator.commit(slot, item.room_id, item.invigilator_ids)
+    if problems:
+        raise HTTPException(status_code=400, detail={"message": "Exam allocation conflict", "items": problems})
+    exams = {e.id: e for e in db.query(models.Exam).filter(models.Exam.id.in_(exam_ids))}
+    for item in payload.assignments:
+        exam = exams[item.exam_id]
+        exam.room_id = item.room_id
+        if item.room_id:
+            exam.location = context.rooms[item.room_id].name
+        exam.invigilators = exam_allocation.INVIGILATOR_SEPARATOR.join(
+            context.teacher_names[t] for t in item.invigilator_ids
+        )
+    ai_cache.touch(db)
+    db.commit()
+    return _exams_query(db, current_user).filter(models.Exam.id.in_(exam_ids)).order_by(models.Exam.id).all()
 
 
 @router.post("/exams", response_model=schemas.ExamOut)
 def create_exam(
     payload: schemas.ExamCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_roles(["ADMIN"])),
+    current_user: Principal = Depends(require_roles(["ADMIN"])),
 ):
     course = db.get(models.Course, payload.course_id)
     if not course:
@@ -1366,6 +1833,8 @@ def create_exam(
     if not exam.term_id:
         exam.term_id = course.term_id
     db.add(exam)
+    counters.bump(db, counters.exam_bucket(payload.exam_date))
+    ai_cache.touch(db)
     db.commit()
     db.refresh(exam)
     return exam
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, selectinload
 
 from app import models, schemas
 from app.db import get_db
+from app.passwords import DUMMY_HASH, needs_rehash, password_hasher
+from app.permission_registry import permission_registry
+from app.principal_cache import Principal, principal_cache
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -20,12 +24,15 @@ def parse_token(raw_token: str) -> str:
 def get_current_user(
     db: Session = Depends(get_db),
     authorization: str = Header(None, alias="Authorization"),
-):
+) -> Principal:
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing bearer token"
         )
     token = authorization.split(" ", 1)[1].strip()
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
     username = parse_token(token)
     user = (
         db.query(models.User)
@@ -40,25 +47,26 @@ def get_current_user(
     )
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    principal = Principal.from_user(user)
+    # 结束这次只读事务：SQLite 下主库事务占用写通道，不能拖到整个请求结束
+    db.rollback()
+    principal_cache.put(token, principal)
+    return principal
 
 
-def get_role_codes(user: models.User) -> set:
-    return {role.code for role in user.roles}
+def get_role_codes(user: Principal) -> set:
+    return set(user.role_codes)
 
 
-def get_permission_codes(user: models.User) -> set:
-    perms = set()
-    for role in user.roles:
-        for perm in role.permissions:
-            perms.add(perm.code)
-    return perms
+def get_permission_codes(user: Principal) -> set:
+    return set(user.permission_codes)
 
 
 def require_roles(allowed_roles: list[str]):
-    def wrapper(current_user: models.User = Depends(get_current_user)):
-        role_codes = get_role_codes(current_user)
-        if allowed_roles and role_codes.isdisjoint(set(allowed_roles)):
+    required_mask = permission_registry.role_mask(allowed_roles)
+
+    def wrapper(current_user: Principal = Depends(get_current_user)):
+        if required_mask and not current_user.role_mask & required_mask:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Role not allowed. Need one of {allowed_roles}",
@@ -69,12 +77,13 @@ def require_roles(allowed_roles: list[str]):
 
 
 def require_permissions(allowed_permissions: list[str]):
-    def wrapper(current_user: models.User = Depends(get_current_user)):
-        role_codes = get_role_codes(current_user)
-        if "ADMIN" in role_codes:
+    admin_mask = permission_registry.role_mask(["ADMIN"])
+    required_mask = permission_registry.permission_mask(allowed_permissions)
+
+    def wrapper(current_user: Principal = Depends(get_current_user)):
+        if current_user.role_mask & admin_mask:
             return current_user
-        user_perms = get_permission_codes(current_user)
-        if allowed_permissions and user_perms.isdisjoint(set(allowed_permissions)):
+        if required_mask and not current_user.permission_mask & required_mask:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Permission not allowed. Need one of {allowed_permissions}",
@@ -84,30 +93,49 @@ def require_permissions(allowed_permissions: list[str]):
     return wrapper
 
 
-@router.post("/login", response_model=schemas.LoginResponse)
-def login(payload: schemas.LoginRequest, db: Session = Depends(get_db)):
-    user = (
+def _load_login_user(db: Session, username: str):
+    return (
         db.query(models.User)
         .options(
             selectinload(models.User.roles),
             selectinload(models.User.student).selectinload(models.Student.class_info),
             selectinload(models.User.teacher),
         )
-        .filter(
-            models.User.username == payload.username,
-            models.User.password_hash == payload.password,
-        )
+        .filter(models.User.username == username)
         .first()
     )
+
+
+def _store_password_hash(db: Session, user: models.User, password_hash: str) -> None:
+    user.password_hash = password_hash
+    db.commit()
+
+
+@router.post("/login", response_model=schemas.LoginResponse)
+async def login(payload: schemas.LoginRequest, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(_load_login_user, db, payload.username)
     if not user:
+        # 与密码错误走同样的哈希计算再返回，避免按响应时间枚举用户名
+        await run_in_threadpool(db.rollback)
+        await password_hasher.verify_async(payload.password, DUMMY_HASH)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-
+    password_hash = user.password_hash
     roles = [role.code for role in user.roles]
     token = create_token(user.username)
-    return schemas.LoginResponse(access_token=token, user=user, roles=roles)
+    response = schemas.LoginResponse(access_token=token, user=user, roles=roles)
+    # 校验密码前结束读事务，SQLite 写通道不在哈希计算期间被占用
+    await run_in_threadpool(db.rollback)
+    if not await password_hasher.verify_async(payload.password, password_hash):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+
+    if needs_rehash(password_hash):
+        # 旧明文或参数过期的哈希：登录成功后惰性升级
+        new_hash = await password_hasher.hash_async(payload.password)
+        await run_in_threadpool(_store_password_hash, db, user, new_hash)
+    return response
 
 
 @router.get("/me", response_model=schemas.MeResponse)
-def read_me(current_user: models.User = Depends(get_current_user)):
+def read_me(current_user: Principal = Depends(get_current_user)):
     roles = [role.code for role in current_user.roles]
     return schemas.MeResponse(user=current_user, roles=roles)
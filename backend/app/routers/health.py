@@ -1,4 +1,13 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.ai_cache import ai_cache
+from app.ai_client import ai_client
+from app.db import pool_status
+from app.metrics import metrics
+from app.principal_cache import principal_cache
+from app.refdata import refdata_cache
+from app.timetable_grid import timetable_grids
 
 router = APIRouter(tags=["health"])
 
@@ -7,3 +16,37 @@ router = APIRouter(tags=["health"])
 def health_check():
     return {"status": "ok"}
 
+
+@router.get("/health/principal-cache")
+def principal_cache_stats():
+    return principal_cache.stats()
+
+
+@router.get("/health/timetable-grids")
+def timetable_grid_stats():
+    return timetable_grids.stats()
+
+
+@router.get("/health/refdata-cache")
+def refdata_cache_stats():
+    return refdata_cache.stats()
+
+
+@router.get("/health/ai-client")
+def ai_client_stats():
+    return ai_client.stats()
+
+
+@router.get("/health/ai-cache")
+def ai_cache_stats():
+    return ai_cache.stats()
+
+
+@router.get("/health/db-pool")
+def db_pool_stats():
+    return pool_status()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,330 @@
+"""In-memory slot-bitmap index for schedule conflict detection.
+
+按星期维护 class_id / teacher_id / room_id / location 各自占用的节次位图，
+冲突检测只需几次整数按位与，命中后再在该键下的少量条目里定位具体冲突。
+
+多 worker 部署时各进程各有一份索引：每次排课写事务都会递增 ``schedule_revision``
+计数（与写入同事务提交），检测前先比对版本号，不一致则从库中重建，保证不会漏判。
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app import counters, models
+from app.schemas import MAX_SLOT
+
+REVISION_COUNTER = "schedule_revision"
+SCHEDULE_INDEX_ENABLED = os.getenv("SCHEDULE_INDEX_ENABLED", "1") not in ("0", "false", "False")
+
+# 条目未指定任何维度时，SQL 版本会与同日所有重叠条目冲突，用 "*" 维度模拟
+_ALL = ("*", None)
+
+
+@dataclass(frozen=True)
+class IndexedEntry:
+    id: int
+    course_id: int
+    class_id: Optional[int]
+    teacher_id: Optional[int]
+    room_id: Optional[int]
+    weekday: int
+    start_slot: int
+    end_slot: int
+    location: Optional[str]
+
+    @classmethod
+    def from_model(cls, entry: models.ScheduleEntry) -> "IndexedEntry":
+        return cls(
+            id=entry.id,
+            course_id=entry.course_id,
+            class_id=entry.class_id,
+            teacher_id=entry.teacher_id,
+            room_id=entry.room_id,
+            weekday=entry.weekday,
+            start_slot=entry.start_slot,
+            end_slot=entry.end_slot,
+            location=entry.location,
+        )
+
+    @property
+    def mask(self) -> int:
+        return slot_mask(self.start_slot, self.end_slot)
+
+    def keys(self) -> list[tuple]:
+        return [_ALL] + _dimension_keys(self.class_id, self.teacher_id, self.room_id, self.location)
+
+
+def slot_mask(start_slot: int, end_slot: int) -> int:
+    """节次区间的位图（第 n 节对应第 n 位）。
+
+    接口已校验范围；库里的历史脏数据不抛异常：起止颠倒按区间处理，超出
+    ``1..MAX_SLOT`` 的部分截掉，完全越界时返回 0。
+    """
+    low, high = sorted((start_slot, end_slot))
+    low, high = max(low, 1), min(high, MAX_SLOT)
+    if high < low:
+        return 0
+    return ((1 << (high - low + 1)) - 1) << low
+
+
+def _dimension_keys(class_id, teacher_id, room_id, location) -> list[tuple]:
+    keys = []
+    if class_id:
+        keys.append(("class", class_id))
+    if teacher_id:
+        keys.append(("teacher", teacher_id))
+    if room_id:
+        keys.append(("room", room_id))
+    if location:
+        keys.append(("location", location))
+    return keys
+
+
+class ScheduleConflictIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries: dict[int, IndexedEntry] = {}
+        # weekday -> key -> (聚合位图, {entry_id: 位图})
+        self._days: dict[int, dict[tuple, list]] = {}
+        self.revision: Optional[int] = None
+        self.reloads = 0
+
+    # -- 构建 ---------------------------------------------------------------
+    def _insert(self, entry: IndexedEntry) -> None:
+        self._entries[entry.id] = entry
+        day = self._days.setdefault(entry.weekday, {})
+        mask = entry.mask
+        for key in entry.keys():
+            slot = day.setdefault(key, [0, {}])
+            slot[0] |= mask
+            slot[1][entry.id] = mask
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        day = self._days.get(entry.weekday, {})
+        for key in entry.keys():
+            slot = day.get(key)
+            if not slot:
+                continue
+            slot[1].pop(entry_id, None)
+            if slot[1]:
+                aggregate = 0
+                for mask in slot[1].values():
+                    aggregate |= mask
+                slot[0] = aggregate
+            else:
+                del day[key]
+
+    @staticmethod
+    def _load(db: Session) -> list[IndexedEntry]:
+        rows = db.query(
+            models.ScheduleEntry.id,
+            models.ScheduleEntry.course_id,
+            models.ScheduleEntry.class_id,
+            models.ScheduleEntry.teacher_id,
+            models.ScheduleEntry.room_id,
+            models.ScheduleEntry.weekday,
+            models.ScheduleEntry.start_slot,
+            models.ScheduleEntry.end_slot,
+            models.ScheduleEntry.location,
+        )
+        return [IndexedEntry(*row) for row in rows]
+
+    def reload(self, db: Session) -> None:
+        # 先读版本号再读数据：数据只会比版本号新，下次检测时最多多重建一次
+        revision = counters.read(db, REVISION_COUNTER)
+        entries = self._load(db)
+        with self._lock:
+            self._entries = {}
+            self._days = {}
+            for entry in entries:
+                self._insert(entry)
+            self.revision = revision
+            self.reloads += 1
+
+    def ensure_fresh(self, db: Session) -> None:
+        current = counters.read(db, REVISION_COUNTER)
+        if current != self.revision:
+            self.reload(db)
+
+    # -- 写路径 -------------------------------------------------------------
+    @staticmethod
+    def bump_revision(db: Session) -> int:
+        """在排课写事务中调用，返回本事务提交后的版本号。"""
+        counters.bump(db, REVISION_COUNTER)
+        return counters.read(db, REVISION_COUNTER)
+
+    def _advance(self, revision: int) -> bool:
+        if self.revision is not None and self.revision == revision - 1:
+            self.revision = revision
+            return True
+        # 期间有其它进程写入，交给下一次 ensure_fresh 重建
+        self.revision = None
+        return False
+
+    def apply_upsert(self, entries: Iterable[models.ScheduleEntry], revision: int) -> None:
+        """提交成功后把新增/修改的条目同步进索引。"""
+        self.apply_changes(entries, (), revision)
+
+    def apply_delete(self, entry_ids: Iterable[int], revision: int) -> None:
+        self.apply_changes((), entry_ids, revision)
+
+    def apply_changes(
+        self, entries: Iterable[models.ScheduleEntry], deleted_ids: Iterable[int], revision: int
+    ) -> None:
+        """同一事务里既有删除又有新增时（如整学期重排）一次性同步。"""
+        with self._lock:
+            if self._advance(revision):
+                for entry_id in deleted_ids:
+                    self._remove(entry_id)
+                for entry in entries:
+                    self._remove(entry.id)
+                    self._insert(IndexedEntry.from_model(entry))
+
+    # -- 查询 ---------------------------------------------------------------
+    def conflicts(
+        self,
+        weekday: int,
+        start_slot: int,
+        end_slot: int,
+        class_id: Optional[int] = None,
+        teacher_id: Optional[int] = None,
+        location: Optional[str] = None,
+        exclude_id: Optional[int] = None,
+        room_id: Optional[int] = None,
+    ) -> list[IndexedEntry]:
+        mask = slot_mask(start_slot, end_slot)
+        keys = _dimension_keys(class_id, teacher_id, room_id, location) or [_ALL]
+        hits: set[int] = set()
+        with self._lock:
+            day = self._days.get(weekday)
+            if not day or not mask:
+                return []
+            for key in keys:
+                slot = day.get(key)
+                if not slot or not slot[0] & mask:
+                    continue
+                hits.update(eid for eid, m in slot[1].items() if m & mask and eid != exclude_id)
+            return sorted((self._entries[eid] for eid in hits), key=lambda e: e.id)
+
+    def find_conflicts(self, db: Session, **kwargs) -> list[IndexedEntry]:
+        self.ensure_fresh(db)
+        return self.conflicts(**kwargs)
+
+    # -- 自检 ---------------------------------------------------------------
+    def self_check(self, db: Session) -> dict:
+        """与数据库逐条比对；不一致时重建并报告差异。"""
+        self.ensure_fresh(db)
+        db_entries = {e.id: e for e in self._load(db)}
+        with self._lock:
+            mem_entries = dict(self._entries)
+            mem_masks = {
+                (weekday, key): slot[0] for weekday, day in self._days.items() for key, slot in day.items()
+            }
+        missing = sorted(set(db_entries) - set(mem_entries))
+        extra = sorted(set(mem_entries) - set(db_entries))
+        changed = sorted(i for i in set(db_entries) & set(mem_entries) if db_entries[i] != mem_entries[i])
+        expected_masks: dict[tuple, int] = {}
+        for entry in db_entries.values():
+            for key in entry.keys():
+                expected_masks[(entry.weekday, key)] = expected_masks.get((entry.weekday, key), 0) | entry.mask
+        bad_masks = len(set(expected_masks.items()) ^ set(mem_masks.items()))
+        consistent = not (missing or extra or changed or bad_masks)
+        if not consistent:
+            self.reload(db)
+        return {
+            "consistent": consistent,
+            "entries": len(db_entries),
+            "revision": self.revision,
+            "missing": missing[:50],
+            "extra": extra[:50],
+            "changed": changed[:50],
+            "mismatched_bitmaps": bad_masks,
+            "reloads": self.reloads,
+        }
+
+
+schedule_index = ScheduleConflictIndex()
+
+
+def _batch_candidates(db: Session, weekday: int, items: list) -> list[IndexedEntry]:
+    # 每个星期一条范围查询：节次区间取并集，维度取 IN 列表
+    query = db.query(
+        models.ScheduleEntry.id,
+        models.ScheduleEntry.course_id,
+        models.ScheduleEntry.class_id,
+        models.ScheduleEntry.teacher_id,
+        models.ScheduleEntry.room_id,
+        models.ScheduleEntry.weekday,
+        models.ScheduleEntry.start_slot,
+        models.ScheduleEntry.end_slot,
+        models.ScheduleEntry.location,
+    ).filter(
+        models.ScheduleEntry.weekday == weekday,
+        models.ScheduleEntry.start_slot <= max(i.end_slot for i in items),
+        models.ScheduleEntry.end_slot >= min(i.start_slot for i in items),
+    )
+    if all(_dimension_keys(i.class_id, i.teacher_id, i.room_id, i.location) for i in items):
+        filters = []
+        for column, attr in (
+            (models.ScheduleEntry.class_id, "class_id"),
+            (models.ScheduleEntry.teacher_id, "teacher_id"),
+            (models.ScheduleEntry.room_id, "room_id"),
+            (models.ScheduleEntry.location, "location"),
+        ):
+            values = {getattr(i, attr) for i in items if getattr(i, attr)}
+            if values:
+                filters.append(column.in_(values))
+        query = query.filter(or_(*filters))
+    return [IndexedEntry(*row) for row in query]
+
+
+def check_batch(db: Session, items: list) -> list[dict]:
+    """检测一批待排课条目与现有课表、以及批内彼此之间的冲突。
+
+    返回每个有冲突条目的 ``{"item", "existing", "batch"}``；空列表表示整批可写入。
+    """
+    by_day: dict[int, list[tuple[int, object]]] = {}
+    for pos, item in enumerate(items):
+        by_day.setdefault(item.weekday, []).append((pos, item))
+    problems = []
+    for weekday, day_items in sorted(by_day.items()):
+        local = ScheduleConflictIndex()
+        for entry in _batch_candidates(db, weekday, [item for _, item in day_items]):
+            local._insert(entry)
+        for pos, item in day_items:
+            hits = local.conflicts(
+                weekday=weekday,
+                start_slot=item.start_slot,
+                end_slot=item.end_slot,
+                class_id=item.class_id,
+                teacher_id=item.teacher_id,
+                location=item.location,
+                room_id=item.room_id,
+            )
+            existing = [h for h in hits if h.id > 0]
+            batch = [-h.id - 1 for h in hits if h.id < 0]
+            if existing or batch:
+                problems.append({"item": pos, "existing": existing, "batch": batch})
+            # 批内条目用负 id 暂存，-1 对应第 0 条
+            local._insert(
+                IndexedEntry(
+                    id=-pos - 1,
+                    course_id=item.course_id,
+                    class_id=item.class_id,
+                    teacher_id=item.teacher_id,
+                    room_id=item.room_id,
+                    weekday=weekday,
+                    start_slot=item.start_slot,
+                    end_slot=item.end_slot,
+                    location=item.location,
+                )
+            )
+    return sorted(problems, key=lambda p: p["item"])
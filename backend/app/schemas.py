@@ -1,7 +1,7 @@
-from datetime import date, time
-from typing import List, Optional
+from datetime import date, datetime, time
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 class ORMModel(BaseModel):
@@ -179,7 +179,7 @@ class MeResponse(ORMModel):
 class StudentStatusLogOut(ORMModel):
     status: str
     reason: Optional[str] = None
-    created_at: Optional[str] = None
+    created_at: Optional[datetime] = None
 
 
 class StudentOut(ORMModel):
@@ -215,6 +215,20 @@ class StudentUpdate(BaseModel):
 
 class StudentImport(BaseModel):
     students: List[StudentCreate]
+    chunk_size: Optional[int] = Field(None, ge=1, le=5000)
+
+
+class ImportRowError(BaseModel):
+    row: int
+    username: Optional[str] = None
+    student_no: Optional[str] = None
+    errors: List[str]
+
+
+class StudentImportResult(BaseModel):
+    created: int
+    skipped: int
+    errors: List[ImportRowError] = Field(default_factory=list)
 
 
 class CourseOut(ORMModel):
@@ -296,27 +310,99 @@ class ScheduleEntryOut(ORMModel):
     room: Optional["RoomOut"] = None
 
 
+# 每天最多节次（冲突索引按节次做位图）
+MAX_SLOT = 16
+
+
 class ScheduleCreate(BaseModel):
     course_id: int
     class_id: Optional[int] = None
     teacher_id: Optional[int] = None
     room_id: Optional[int] = None
-    weekday: int
-    start_slot: int
-    end_slot: int
+    weekday: int = Field(..., ge=1, le=7)
+    start_slot: int = Field(..., ge=1, le=MAX_SLOT)
+    end_slot: int = Field(..., ge=1, le=MAX_SLOT)
     location: Optional[str] = None
 
+    @model_validator(mode="after")
+    def _check_slots(self):
+        if self.end_slot < self.start_slot:
+            raise ValueError("end_slot must be >= start_slot")
+        return self
+
+
+class ScheduleBatchCreate(BaseModel):
+    items: List[ScheduleCreate] = Field(..., min_length=1, max_length=2000)
+
+
+class TimetableSolveRequest(BaseModel):
+    term_id: int
+    time_budget_seconds: float = Field(5.0, gt=0, le=120)
+    restarts: Optional[int] = Field(None, ge=1, le=64)
+    seed: Optional[int] = None
+    replace_existing: bool = False
+    weekdays: Optional[List[int]] = None
+    slots_per_day: Optional[int] = Field(None, ge=1, le=16)
+    # 课程类型 -> 允许使用的教室类型，例如 {"实践": ["实训室", "操场"]}
+    room_type_rules: Dict[str, List[str]] = Field(default_factory=dict)
+
+
+class TimetableUnplaced(BaseModel):
+    course_id: int
+    course_code: str
+    course_name: str
+    class_id: Optional[int] = None
+    required_hours: int
+    placed_hours: int
+    reason: str
+
+
+class TimetableQuality(BaseModel):
+    score: float
+    placed_sessions: int
+    total_sessions: int
+    same_day_repeats: int
+    avg_seat_waste: float
+    soft_cost: float
+    iterations: int
+
+
+class TimetablePlan(BaseModel):
+    term_id: int
+    revision: int
+    replace_existing: bool
+    replaced_entry_ids: List[int] = Field(default_factory=list)
+    entries: List[ScheduleCreate] = Field(default_factory=list)
+    unplaced: List[TimetableUnplaced] = Field(default_factory=list)
+    quality: TimetableQuality
+    restarts: int
+    elapsed_ms: int
+
+
+class TimetableCommit(BaseModel):
+    term_id: int
+    revision: int
+    replace_existing: bool = False
+    entries: List[ScheduleCreate] = Field(..., min_length=1, max_length=5000)
+
 
 class ScheduleUpdate(BaseModel):
     course_id: Optional[int] = None
     class_id: Optional[int] = None
     teacher_id: Optional[int] = None
     room_id: Optional[int] = None
-    weekday: Optional[int] = None
-    start_slot: Optional[int] = None
-    end_slot: Optional[int] = None
+    weekday: Optional[int] = Field(None, ge=1, le=7)
+    start_slot: Optional[int] = Field(None, ge=1, le=MAX_SLOT)
+    end_slot: Optional[int] = Field(None, ge=1, le=MAX_SLOT)
     location: Optional[str] = None
 
+    @model_validator(mode="after")
+    def _check_slots(self):
+        # 只给了一端时在接口里与原值合并后再校验
+        if self.start_slot is not None and self.end_slot is not None and self.end_slot < self.start_slot:
+            raise ValueError("end_slot must be >= start_slot")
+        return self
+
 
 class RoomOut(ORMModel):
     id: int
@@ -374,6 +460,7 @@ class GradeImportItem(BaseModel):
 
 class GradeImport(BaseModel):
     grades: List[GradeImportItem]
+    chunk_size: Optional[int] = Field(None, ge=1, le=2000)
 
 
 class GradeCreate(BaseModel):
@@ -406,7 +493,7 @@ class GradeAuditOut(ORMModel):
     action: str
     actor: Optional[str] = None
     comment: Optional[str] = None
-    created_at: Optional[str] = None
+    created_at: Optional[datetime] = None
 
 
 class MenuItem(BaseModel):
@@ -449,12 +536,85 @@ class ExamCreate(BaseModel):
     invigilators: Optional[str] = None
 
 
+class ExamAllocateRequest(BaseModel):
+    term_id: int
+    exam_ids: Optional[List[int]] = None
+    # 可参与监考的教师，默认全部在职教师
+    teacher_ids: Optional[List[int]] = None
+    keep_existing: bool = False
+    invigilators_per_exam: Optional[int] = Field(None, ge=0, le=10)
+    students_per_invigilator: Optional[int] = Field(None, ge=1)
+
+
+class ExamAssignmentOut(BaseModel):
+    exam_id: int
+    course_id: int
+    course_name: str
+    class_id: Optional[int] = None
+    exam_date: Optional[date] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    students: int
+    room_id: Optional[int] = None
+    room_name: Optional[str] = None
+    capacity: Optional[int] = None
+    invigilator_ids: List[int] = Field(default_factory=list)
+    invigilators: str = ""
+
+
+class ExamUnallocatedOut(BaseModel):
+    exam_id: int
+    course_id: int
+    course_name: str
+    class_id: Optional[int] = None
+    exam_date: Optional[date] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    students: int
+    reason: str
+
+
+class ExamAllocationPlan(BaseModel):
+    term_id: int
+    assignments: List[ExamAssignmentOut] = Field(default_factory=list)
+    unallocated: List[ExamUnallocatedOut] = Field(default_factory=list)
+    class_clashes: List[Dict[str, int]] = Field(default_factory=list)
+    stats: Dict[str, int] = Field(default_factory=dict)
+
+
+class ExamAssignmentItem(BaseModel):
+    exam_id: int
+    room_id: Optional[int] = None
+    invigilator_ids: List[int] = Field(default_factory=list)
+
+
+class ExamAllocationCommit(BaseModel):
+    term_id: int
+    assignments: List[ExamAssignmentItem] = Field(..., min_length=1, max_length=5000)
+
+
+class CourseRiskOut(BaseModel):
+    course: str
+    course_code: str
+    class_name: str = Field(alias="class")
+    term: Optional[str] = None
+    avg_score: Optional[float] = None
+    fail_ratio: float
+    fail_count: int
+    total: int
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
 class AIRequest(BaseModel):
     prompt: str
     task: Optional[str] = None  # e.g., risk_courses, weekly_report
     params: dict = Field(default_factory=dict)
+    no_cache: bool = False  # 跳过上下文 / 答案缓存
 
 
 class AIResponse(BaseModel):
     answer: str
     used_prompt: str
+    cached: bool = False
+    context_cached: bool = False
@@ -2,7 +2,8 @@ from datetime import date
 from decimal import Decimal
 
 from app import models
-from app.db import Base, SessionLocal, engine
+from app.db import SessionLocal, engine
+from app.passwords import hash_password
 
 
 DEFAULT_PERMISSIONS = [
@@ -37,8 +38,7 @@ def ensure_permissions_seed(db: SessionLocal):
 
 
 def init_db_with_sample_data():
-    """Create tables and seed a handful of demo records for P0/P1 MVP."""
-    Base.metadata.create_all(bind=engine)
+    """Seed a handful of demo records for P0/P1 MVP (库里已有用户时跳过)."""
     db = SessionLocal()
     try:
         ensure_permissions_seed(db)
@@ -105,7 +105,7 @@ def init_db_with_sample_data():
         # Users
         admin_user = models.User(
             username="admin",
-            password_hash="admin123",
+            password_hash=hash_password("admin123"),
             full_name="教务管理员",
             email="admin@academy.local",
             roles=[admin_role],
@@ -113,7 +113,7 @@ def init_db_with_sample_data():
         )
         teacher_user = models.User(
             username="teacher1",
-            password_hash="teacher123",
+            password_hash=hash_password("teacher123"),
             full_name="李教官",
             email="teacher1@academy.local",
             roles=[teacher_role],
@@ -121,7 +121,7 @@ def init_db_with_sample_data():
         )
         student_user = models.User(
             username="student1",
-            password_hash="student123",
+            password_hash=hash_password("student123"),
             full_name="王新生",
             email="student1@academy.local",
             roles=[student_role],
@@ -129,7 +129,7 @@ def init_db_with_sample_data():
         )
         student_user2 = models.User(
             username="student2",
-            password_hash="student123",
+            password_hash=hash_password("student123"),
             full_name="赵同学",
             email="student2@academy.local",
             roles=[student_role],
@@ -264,3 +264,14 @@ def init_db_with_sample_data():
         db.commit()
     finally:
         db.close()
+
+
+if __name__ == "__main__":
+    # python -m app.seed：升级库结构并导入演示账号与基础数据
+    from app.migrations import ensure_schema
+
+    ensure_schema(engine)
+    with SessionLocal() as db:
+        had_users = db.query(models.User).count() > 0
+    init_db_with_sample_data()
+    print("demo data already present, skipped" if had_users else "demo data imported")
@@ -0,0 +1,236 @@
+"""Slow query log with automatic EXPLAIN capture.
+
+引擎上挂 ``before/after_cursor_execute``，耗时超过 ``SLOW_QUERY_MS`` 的语句记录：
+
+- 归一化 SQL（压缩空白、IN 列表与字面量替换为 ``?``）和绑定参数的形状（只记类型，不记值）；
+- 耗时、引擎（primary / read）、当前路由（``MetricsMiddleware`` 提供）和调用位置；
+- 执行计划：SQLite ``EXPLAIN QUERY PLAN``，MySQL / PostgreSQL ``EXPLAIN``。
+
+EXPLAIN 在后台单线程里用独立的原始连接执行（不走会话事务，也不占 SQLite 写通道），
+不增加请求本身的延迟；积压超过 ``SLOW_QUERY_EXPLAIN_QUEUE`` 时跳过。
+记录保存在有界环形缓冲里，由 ``/api/admin/slow-queries`` 查看；设置 ``SLOW_QUERY_LOG_FILE``
+时另以 JSON 行追加到按大小轮转的本地文件。``SLOW_QUERY_MS=0`` 关闭。
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") not in ("0", "false", "False", "")
+SLOW_QUERY_EXPLAIN_QUEUE = int(os.getenv("SLOW_QUERY_EXPLAIN_QUEUE", "32"))
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", "200"))
+SLOW_QUERY_LOG_FILE = os.getenv("SLOW_QUERY_LOG_FILE") or None
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "5"))
+
+_STARTED = "slow_query_started"
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# 调用位置跳过这些基础设施模块
+_SKIP_FILES = {os.path.join(_APP_DIR, name) for name in ("db.py", "slow_query.py", "metrics.py", "sqlite_profile.py")}
+_EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+
+_IN_LIST = re.compile(r"\bIN\s*\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)", re.I)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(statement: str) -> str:
+    sql = " ".join(statement.split())
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _IN_LIST.sub("IN (?...)", sql)
+
+
+def parameter_shape(parameters, executemany: bool = False):
+    """绑定参数只保留类型，例如 ``["int", "str"]`` / ``{"name": "str"}``。"""
+    if executemany:
+        rows = list(parameters or ())
+        return {"rows": len(rows), "row": parameter_shape(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None if parameters is None else type(parameters).__name__
+
+
+def _caller(depth: int = 3) -> Optional[str]:
+    """最内层的几个应用栈帧，如 ``app/pagination.py:paginate:70 < app/routers/api.py:list_grades:1530``。"""
+    frames = []
+    frame = sys._getframe(2)
+    while frame is not None and len(frames) < depth:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_APP_DIR) and filename not in _SKIP_FILES:
+            relative = os.path.relpath(filename, os.path.dirname(_APP_DIR))
+            frames.append(f"{relative}:{frame.f_code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return " < ".join(frames) or None
+
+
+def _current_route() -> Optional[str]:
+    from app.metrics import current_route
+
+    return current_route()
+
+
+class SlowQueryLog:
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_QUERY_MS,
+        explain: bool = SLOW_QUERY_EXPLAIN,
+        buffer_size: int = SLOW_QUERY_BUFFER,
+        log_file: Optional[str] = SLOW_QUERY_LOG_FILE,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self._lock = threading.Lock()
+        self._records: deque = deque(maxlen=buffer_size)
+        self._engines: dict[int, str] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self.recorded = 0
+        self.explained = 0
+        self.explain_failed = 0
+        self.explain_skipped = 0
+        self._file_logger: Optional[logging.Logger] = None
+        if log_file:
+            logger = logging.getLogger("app.slow_query")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(
+                log_file, maxBytes=SLOW_QUERY_LOG_MAX_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            self._file_logger = logger
+        self.log_file = log_file
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def instrument(self, engine: Engine, name: str) -> None:
+        if not self.enabled or id(engine) in self._engines:
+            return
+        self._engines[id(engine)] = name
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info[_STARTED] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop(_STARTED, None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms < self.threshold_ms:
+            return
+        record = {
+            "at": datetime.utcnow().isoformat(timespec="milliseconds"),
+            "duration_ms": round(elapsed_ms, 3),
+            "engine": self._engines.get(id(conn.engine), "primary"),
+            "route": _current_route(),
+            "caller": _caller(),
+            "sql": normalize_sql(statement),
+            "parameters": parameter_shape(parameters, executemany),
+            "explain": None,
+        }
+        with self._lock:
+            self._records.append(record)
+            self.recorded += 1
+        if not self.explain or not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            self._write(record)
+            return
+        explain_params = parameters[0] if executemany and parameters else parameters
+        with self._lock:
+            if self._pending >= SLOW_QUERY_EXPLAIN_QUEUE:
+                self.explain_skipped += 1
+                skip = True
+            else:
+                self._pending += 1
+                skip = False
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        if skip:
+            record["explain"] = {"skipped": "explain queue full"}
+            self._write(record)
+            return
+        self._executor.submit(self._explain, conn.engine, statement, explain_params, record)
+
+    def _explain(self, engine: Engine, statement: str, parameters, record: dict) -> None:
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            raw = engine.raw_connection()
+            try:
+                cursor = raw.cursor()
+                cursor.execute(prefix + statement, parameters or ())
+                columns = [col[0] for col in cursor.description or ()]
+                plan = [dict(zip(columns, [str(v) if v is not None else None for v in row])) for row in cursor]
+                cursor.close()
+                raw.rollback()
+            finally:
+                raw.close()
+        except Exception as exc:  # noqa: BLE001 - 诊断信息，失败不影响业务
+            record["explain"] = {"error": f"{type(exc).__name__}: {exc}"}
+            with self._lock:
+                self.explain_failed += 1
+        else:
+            record["explain"] = plan
+            with self._lock:
+                self.explained += 1
+        finally:
+            with self._lock:
+                self._pending -= 1
+        self._write(record)
+
+    def _write(self, record: dict) -> None:
+        if self._file_logger is not None:
+            self._file_logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+    def records(self, limit: Optional[int] = None) -> list[dict]:
+        """最近的记录，新的在前。"""
+        with self._lock:
+            items = list(self._records)
+        items.reverse()
+        return items[:limit] if limit else items
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "threshold_ms": self.threshold_ms,
+                "explain": self.explain,
+                "buffered": len(self._records),
+                "buffer_size": self._records.maxlen,
+                "recorded": self.recorded,
+                "explained": self.explained,
+                "explain_failed": self.explain_failed,
+                "explain_skipped": self.explain_skipped,
+                "explain_pending": self._pending,
+                "log_file": self.log_file,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+slow_queries = SlowQueryLog()
@@ -0,0 +1,127 @@
+"""SQLite production profile: pragmas on connect and a single-writer lane.
+
+单机部署直接用 SQLite 文件时：
+
+- 每个新连接设置 WAL、``synchronous=NORMAL``、``mmap_size``、``cache_size``、
+  ``busy_timeout``（``SQLITE_*`` 环境变量可调）；WAL 下读不再被写阻塞。
+- 主库引擎（``get_db``，写接口）的事务先在进程内排队拿“写通道”，再以
+  ``BEGIN IMMEDIATE`` 开始，写事务之间串行等待而不是报 ``database is locked``；
+  多 worker 之间由 ``busy_timeout`` 排队。
+- 只读引擎（``get_read_db``）普通 ``BEGIN``，不占写通道。
+
+写通道在事务提交 / 回滚时释放，因此写接口里不要在持有事务时做耗时的非数据库操作。
+"""
+
+import os
+import threading
+import time
+
+from fastapi import HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "1") not in ("0", "false", "False", "")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # 负数单位为 KiB，即 64MB
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # 毫秒
+SQLITE_WRITE_LANE_TIMEOUT = float(os.getenv("SQLITE_WRITE_LANE_TIMEOUT", "30"))
+
+_LANE_KEY = "sqlite_write_lane"
+
+
+def pragmas() -> list[str]:
+    # busy_timeout 放在最前，切换 WAL 时如遇锁也会等待
+    return [
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}",
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+    ]
+
+
+class WriteLane:
+    def __init__(self, timeout: float = SQLITE_WRITE_LANE_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.transactions = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.hold_seconds_max = 0.0
+
+    def acquire(self) -> None:
+        started = time.perf_counter()
+        with self._stats_lock:
+            self.waiting += 1
+        acquired = self._lock.acquire(timeout=self.timeout)
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.waiting -= 1
+            if not acquired:
+                self.timeouts += 1
+            else:
+                self.transactions += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        if not acquired:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database is busy, please retry later"
+            )
+
+    def release(self, held: float) -> None:
+        with self._stats_lock:
+            self.hold_seconds_max = max(self.hold_seconds_max, held)
+        self._lock.release()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "transactions": self.transactions,
+                "waiting": self.waiting,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "hold_seconds_max": round(self.hold_seconds_max, 6),
+            }
+
+
+write_lane = WriteLane()
+
+
+def apply(engine: Engine, writer: bool, lane: WriteLane = write_lane) -> None:
+    """给 SQLite 引擎挂上 pragma；``writer`` 为真时事务走写通道并 ``BEGIN IMMEDIATE``。"""
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        # 关闭 pysqlite 自带的隐式事务，由下面的 begin 事件显式发出 BEGIN
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for statement in pragmas():
+            cursor.execute(statement)
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        if not writer:
+            conn.exec_driver_sql("BEGIN")
+            return
+        lane.acquire()
+        conn.info[_LANE_KEY] = time.perf_counter()
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        except Exception:
+            lane.release(time.perf_counter() - conn.info.pop(_LANE_KEY))
+            raise
+
+    def _on_end(conn):
+        started = conn.info.pop(_LANE_KEY, None)
+        if started is not None:
+            lane.release(time.perf_counter() - started)
+
+    if writer:
+        event.listen(engine, "commit", _on_end)
+        event.listen(engine, "rollback", _on_end)
@@ -0,0 +1,122 @@
+"""Materialized weekly timetables per class and per teacher.
+
+每个班级 / 教师的课表预先序列化成 JSON 字节（与 ``List[ScheduleEntryOut]``
+输出一致）并缓存在进程内，``/api/schedule/my`` 直接返回字节并带 ETag。
+
+失效靠 ``dashboard_counters`` 里的版本号：
+
+- ``timetable:class:<id>`` / ``timetable:teacher:<id>``：排课增删改时在同一事务内
+  对受影响的班级、教师递增（旧值和新值都算）；
+- ``timetable:epoch``：课程 / 班级 / 教室信息变更时递增，所有课表一起失效。
+
+读取时一次查询取回两个版本号，与缓存不一致才重建该键，多 worker 下同样成立。
+版本号只决定何时重建；ETag 取序列化结果的哈希，库恢复 / 重新初始化后版本号从头计数
+也不会与客户端缓存的旧 ETag 撞上。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, selectinload
+
+from app import counters, models, schemas
+
+TIMETABLE_GRID_CACHE_SIZE = int(os.getenv("TIMETABLE_GRID_CACHE_SIZE", "4096"))
+EPOCH = "timetable:epoch"
+PREVIEW_SIZE = 4
+
+CLASS = "class"
+TEACHER = "teacher"
+
+_ENTRIES = TypeAdapter(List[schemas.ScheduleEntryOut])
+
+
+def version_key(kind: str, owner_id: int) -> str:
+    return f"timetable:{kind}:{owner_id}"
+
+
+class Grid:
+    __slots__ = ("versions", "etag", "body", "preview")
+
+    def __init__(self, versions: tuple, etag: str, body: bytes, preview: list):
+        self.versions = versions
+        self.etag = etag
+        self.body = body
+        self.preview = preview
+
+
+def _load(db: Session, kind: str, owner_id: int) -> list[models.ScheduleEntry]:
+    column = models.ScheduleEntry.class_id if kind == CLASS else models.ScheduleEntry.teacher_id
+    return (
+        db.query(models.ScheduleEntry)
+        .options(
+            selectinload(models.ScheduleEntry.course),
+            selectinload(models.ScheduleEntry.class_info),
+            selectinload(models.ScheduleEntry.room),
+        )
+        .filter(column == owner_id)
+        .order_by(models.ScheduleEntry.weekday, models.ScheduleEntry.start_slot)
+        .all()
+    )
+
+
+class TimetableGridCache:
+    def __init__(self, max_size: int = TIMETABLE_GRID_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._grids: "OrderedDict[tuple, Grid]" = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, db: Session, kind: str, owner_id: int) -> Grid:
+        names = (version_key(kind, owner_id), EPOCH)
+        current = counters.read_many(db, names)
+        versions = (current[names[0]], current[EPOCH])
+        key = (kind, owner_id)
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is not None and grid.versions == versions:
+                self._grids.move_to_end(key)
+                self.hits += 1
+                return grid
+        grid = self._build(db, kind, owner_id, versions)
+        with self._lock:
+            self._grids[key] = grid
+            self._grids.move_to_end(key)
+            while len(self._grids) > self.max_size:
+                self._grids.popitem(last=False)
+            self.builds += 1
+        return grid
+
+    @staticmethod
+    def _build(db: Session, kind: str, owner_id: int, versions: tuple) -> Grid:
+        entries = _ENTRIES.validate_python(_load(db, kind, owner_id), from_attributes=True)
+        body = _ENTRIES.dump_json(entries)
+        etag = f'"tt-{hashlib.sha1(body).hexdigest()[:24]}"'
+        return Grid(versions, etag, body, json.loads(body)[:PREVIEW_SIZE])
+
+    # -- 写路径（在调用方事务内）--------------------------------------------
+    @staticmethod
+    def touch(
+        db: Session, class_ids: Iterable[Optional[int]] = (), teacher_ids: Iterable[Optional[int]] = ()
+    ) -> None:
+        for class_id in {c for c in class_ids if c}:
+            counters.bump(db, version_key(CLASS, class_id))
+        for teacher_id in {t for t in teacher_ids if t}:
+            counters.bump(db, version_key(TEACHER, teacher_id))
+
+    @staticmethod
+    def touch_all(db: Session) -> None:
+        counters.bump(db, EPOCH)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._grids), "max_size": self.max_size, "hits": self.hits, "builds": self.builds}
+
+
+timetable_grids = TimetableGridCache()
@@ -0,0 +1,546 @@
+"""Automatic timetable solver.
+
+输入：学期内课程的周学时（优先取培养方案 ``TrainingPlanItem.weekly_hours``）、
+任课教师、班级人数、可用教室（``capacity`` / ``room_type`` / ``active``），
+以及不参与求解的既有排课（视为固定占用）。
+
+求解分两步：
+
+1. 约束传播 + 构造：先按固定占用和教室容量/类型为每个课时块过滤出可行
+   (星期, 起始节次) 域，按域大小从小到大（MRV）贪心放置，教室取能容纳的最小空闲间；
+2. 局部搜索：在时间预算内对未放置的课时块做 min-conflicts 修复（带禁忌的挤出），
+   全部放置后再做同日重复 / 座位浪费等软约束的爬山优化。
+
+多次随机重启并行跑在 spawn 进程池里，取 (未放置数, 软代价) 最小的结果。
+结果只是预览，由调用方确认后写库。
+"""
+
+import math
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import models
+from app.schedule_index import slot_mask
+
+SOLVER_WORKERS = int(os.getenv("SOLVER_WORKERS", str(os.cpu_count() or 1)))
+SOLVER_WEEKDAYS = [int(d) for d in os.getenv("SOLVER_WEEKDAYS", "1,2,3,4,5").split(",") if d.strip()]
+SOLVER_SLOTS_PER_DAY = int(os.getenv("SOLVER_SLOTS_PER_DAY", "8"))
+# 课时块长度：4 学时的课拆成两次 2 节连上
+SOLVER_BLOCK = int(os.getenv("SOLVER_BLOCK", "2"))
+
+SAME_DAY_WEIGHT = 1.0
+WASTE_WEIGHT = 0.2
+TABU_TENURE = 10
+NOISE = 0.05
+
+NO_ROOM = "no suitable room (capacity / room type)"
+NO_SLOT = "no free slot for class / teacher / room"
+
+
+@dataclass
+class SolverCourse:
+    course_id: int
+    code: str
+    name: str
+    class_id: Optional[int]
+    teacher_id: Optional[int]
+    size: int
+    hours: int
+    # 按容量升序排列的可用教室
+    rooms: List[int] = field(default_factory=list)
+
+
+@dataclass
+class Problem:
+    weekdays: List[int]
+    slots_per_day: int
+    block: int
+    courses: List[SolverCourse]
+    room_capacity: Dict[int, int]
+    # (kind, id, weekday) -> 固定占用的节次位图；kind 为 class / teacher / room
+    fixed: Dict[tuple, int] = field(default_factory=dict)
+    requires_room: bool = True
+
+    def sessions(self) -> list[tuple[int, int]]:
+        """拆分出的课时块：(course 下标, 节数)。"""
+        result = []
+        for idx, course in enumerate(self.courses):
+            full, rest = divmod(course.hours, self.block)
+            result.extend((idx, self.block) for _ in range(full))
+            if rest:
+                result.append((idx, rest))
+        return result
+
+
+@dataclass
+class Solution:
+    assignment: list  # 每个课时块：(weekday, start_slot, end_slot, room_id) 或 None
+    unplaced: int
+    soft_cost: float
+    iterations: int
+    seed: int
+
+
+def _mask(start: int, length: int) -> int:
+    return ((1 << length) - 1) << start
+
+
+class _Search:
+    def __init__(self, problem: Problem, seed: int):
+        self.p = problem
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.sessions = problem.sessions()
+        self.course_sessions: dict[int, list[int]] = {}
+        for sid, (cidx, _) in enumerate(self.sessions):
+            self.course_sessions.setdefault(cidx, []).append(sid)
+        # (kind, id, weekday) -> {session: 位图}
+        self.occ: dict[tuple, dict[int, int]] = {}
+        self.assign: list = [None] * len(self.sessions)
+        self.tabu: dict[int, int] = {}
+        self.options = [self._domain(sid) for sid in range(len(self.sessions))]
+
+    # -- 约束传播：只看固定占用与教室条件 ----------------------------------
+    def _dims(self, sid: int) -> list[tuple]:
+        course = self.p.courses[self.sessions[sid][0]]
+        dims = []
+        if course.class_id:
+            dims.append(("class", course.class_id))
+        if course.teacher_id:
+            dims.append(("teacher", course.teacher_id))
+        return dims
+
+    def _domain(self, sid: int) -> list[tuple[int, int, int]]:
+        course = self.p.courses[self.sessions[sid][0]]
+        length = self.sessions[sid][1]
+        if self.p.requires_room and not course.rooms:
+            return []
+        dims = self._dims(sid)
+        options = []
+        for day in self.p.weekdays:
+            for start in range(1, self.p.slots_per_day - length + 2, self.p.block):
+                mask = _mask(start, length)
+                if any(self.p.fixed.get((kind, key, day), 0) & mask for kind, key in dims):
+                    continue
+                if self.p.requires_room and all(
+                    self.p.fixed.get(("room", room, day), 0) & mask for room in course.rooms
+                ):
+                    continue
+                options.append((day, start, mask))
+        return options
+
+    # -- 占用维护 -----------------------------------------------------------
+    def _blockers(self, key: tuple, mask: int) -> list[int]:
+        bucket = self.occ.get(key)
+        if not bucket:
+            return []
+        return [other for other, m in bucket.items() if m & mask]
+
+    def _room_choice(self, sid: int, day: int, mask: int) -> tuple[Optional[int], list[int]]:
+        """返回 (教室, 需挤出的课时块)；优先容量最小的空闲教室。"""
+        course = self.p.courses[self.sessions[sid][0]]
+        if not self.p.requires_room:
+            return None, []
+        best = None
+        for room in course.rooms:
+            if self.p.fixed.get(("room", room, day), 0) & mask:
+                continue
+            blockers = self._blockers(("room", room, day), mask)
+            if not blockers:
+                return room, []
+            if best is None or len(blockers) < len(best[1]):
+                best = (room, blockers)
+        return best if best else (None, [])
+
+    def _place(self, sid: int, day: int, start: int, mask: int, room: Optional[int]) -> None:
+        length = self.sessions[sid][1]
+        self.assign[sid] = (day, start, start + length - 1, room, mask)
+        for kind, key in self._dims(sid):
+            self.occ.setdefault((kind, key, day), {})[sid] = mask
+        if room is not None:
+            self.occ.setdefault(("room", room, day), {})[sid] = mask
+
+    def _unplace(self, sid: int) -> None:
+        day, _, _, room, _ = self.assign[sid]
+        keys = [(kind, key, day) for kind, key in self._dims(sid)]
+        if room is not None:
+            keys.append(("room", room, day))
+        for key in keys:
+            self.occ.get(key, {}).pop(sid, None)
+        self.assign[sid] = None
+
+    # -- 代价 ---------------------------------------------------------------
+    def _soft(self, sid: int, day: int, room: Optional[int]) -> float:
+        cidx = self.sessions[sid][0]
+        same_day = sum(
+            1
+            for other in self.course_sessions[cidx]
+            if other != sid and self.assign[other] and self.assign[other][0] == day
+        )
+        waste = 0.0
+        if room is not None:
+            capacity = self.p.room_capacity.get(room) or 0
+            size = self.p.courses[cidx].size
+            if capacity > 0:
+                waste = max(0, capacity - size) / capacity
+        return SAME_DAY_WEIGHT * same_day + WASTE_WEIGHT * waste
+
+    def soft_cost(self) -> float:
+        total = 0.0
+        for sid, slot in enumerate(self.assign):
+            if slot:
+                total += self._soft(sid, slot[0], slot[3])
+        return total
+
+    def _evaluate(self, sid: int, day: int, mask: int):
+        blockers = set()
+        for kind, key in self._dims(sid):
+            blockers.update(self._blockers((kind, key, day), mask))
+        room, room_blockers = self._room_choice(sid, day, mask)
+        if self.p.requires_room and room is None:
+            return None
+        blockers.update(room_blockers)
+        return room, blockers
+
+    # -- 构造 ---------------------------------------------------------------
+    def construct(self) -> None:
+        order = list(range(len(self.sessions)))
+        self.rng.shuffle(order)
+        order.sort(key=lambda sid: len(self.options[sid]))
+        for sid in order:
+            best = None
+            for day, start, mask in self.options[sid]:
+                evaluated = self._evaluate(sid, day, mask)
+                if evaluated is None or evaluated[1]:
+                    continue
+                cost = self._soft(sid, day, evaluated[0]) + self.rng.random() * 1e-3
+                if best is None or cost < best[0]:
+                    best = (cost, day, start, mask, evaluated[0])
+            if best:
+                self._place(sid, *best[1:])
+
+    # -- 局部搜索 -----------------------------------------------------------
+    def _repair(self, sid: int, iteration: int) -> None:
+        candidates = []
+        for day, start, mask in self.options[sid]:
+            evaluated = self._evaluate(sid, day, mask)
+            if evaluated is None:
+                continue
+            room, blockers = evaluated
+            if any(self.tabu.get(b, 0) > iteration for b in blockers):
+                continue
+            candidates.append((len(blockers), self._soft(sid, day, room), day, start, mask, room, blockers))
+        if not candidates:
+            return
+        if self.rng.random() < NOISE:
+            choice = self.rng.choice(candidates)
+        else:
+            least = min(c[:2] for c in candidates)
+            choice = self.rng.choice([c for c in candidates if c[:2] == least])
+        _, _, day, start, mask, room, blockers = choice
+        for other in blockers:
+            self._unplace(other)
+        self._place(sid, day, start, mask, room)
+        self.tabu[sid] = iteration + TABU_TENURE
+
+    def _improve(self, sid: int) -> None:
+        day, start, _, room, mask = self.assign[sid]
+        current = self._soft(sid, day, room)
+        self._unplace(sid)
+        new_day, new_start, new_mask = self.rng.choice(self.options[sid])
+        evaluated = self._evaluate(sid, new_day, new_mask)
+        if evaluated is not None and not evaluated[1]:
+            if self._soft(sid, new_day, evaluated[0]) <= current:
+                self._place(sid, new_day, new_start, new_mask, evaluated[0])
+                return
+        self._place(sid, day, start, mask, room)
+
+    def run(self, budget: float) -> Solution:
+        deadline = time.monotonic() + budget
+        self.construct()
+        placeable = [sid for sid in range(len(self.sessions)) if self.options[sid]]
+        best = self._snapshot(0)
+        iteration = 0
+        while placeable and time.monotonic() < deadline:
+            iteration += 1
+            unplaced = [sid for sid in placeable if self.assign[sid] is None]
+            if unplaced:
+                self._repair(self.rng.choice(unplaced), iteration)
+            else:
+                if best.soft_cost == 0:
+                    break
+                self._improve(self.rng.choice(placeable))
+            if iteration % 16 == 0 or not unplaced:
+                current = self._snapshot(iteration)
+                if (current.unplaced, current.soft_cost) < (best.unplaced, best.soft_cost):
+                    best = current
+        final = self._snapshot(iteration)
+        if (final.unplaced, final.soft_cost) < (best.unplaced, best.soft_cost):
+            best = final
+        best.iterations = iteration
+        return best
+
+    def _snapshot(self, iteration: int) -> Solution:
+        return Solution(
+            assignment=[slot[:4] if slot else None for slot in self.assign],
+            unplaced=sum(1 for slot in self.assign if slot is None),
+            soft_cost=round(self.soft_cost(), 4),
+            iterations=iteration,
+            seed=self.seed,
+        )
+
+
+def _solve_once(args: tuple) -> Solution:
+    problem, seed, budget = args
+    return _Search(problem, seed).run(budget)
+
+
+class TimetableSolver:
+    def __init__(self, workers: int = SOLVER_WORKERS):
+        self.workers = workers
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> Optional[Executor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._pool
+
+    def solve(
+        self, problem: Problem, budget: float, restarts: Optional[int] = None, seed: Optional[int] = None
+    ) -> Solution:
+        """并行多次重启，返回最优解。``budget`` 为总的墙钟时间预算（秒）。"""
+        pool = self._executor()
+        restarts = restarts or max(1, self.workers)
+        base = seed if seed is not None else random.randrange(1 << 30)
+        if pool is None:
+            per_run = budget / restarts
+            results = [_solve_once((problem, base + i, per_run)) for i in range(restarts)]
+        else:
+            waves = math.ceil(restarts / self.workers)
+            # 预留进程启动与结果回传的开销
+            per_run = max(0.05, budget * 0.9 / waves - 0.1)
+            results = list(pool.map(_solve_once, [(problem, base + i, per_run) for i in range(restarts)]))
+        return min(results, key=lambda s: (s.unplaced, s.soft_cost, s.seed))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+timetable_solver = TimetableSolver()
+
+
+# -- 从数据库构建问题 --------------------------------------------------------
+def _plan_hours(db: Session, course_ids: Sequence[int]) -> dict[int, tuple[int, Optional[int], Optional[int]]]:
+    rows = (
+        db.query(
+            models.TrainingPlanItem.course_id,
+            models.TrainingPlanItem.weekly_hours,
+            models.TrainingPlan.major_id,
+            models.TrainingPlan.entry_year,
+        )
+        .join(models.TrainingPlan, models.TrainingPlan.id == models.TrainingPlanItem.plan_id)
+        .filter(models.TrainingPlanItem.course_id.in_(course_ids))
+        .all()
+    )
+    result: dict[int, list] = {}
+    for course_id, hours, major_id, entry_year in rows:
+        result.setdefault(course_id, []).append((hours or 0, major_id, entry_year))
+    return result
+
+
+def build_problem(
+    db: Session,
+    term_id: int,
+    replace_existing: bool = False,
+    room_type_rules: Optional[Dict[str, List[str]]] = None,
+    weekdays: Optional[List[int]] = None,
+    slots_per_day: Optional[int] = None,
+) -> tuple[Problem, list[int]]:
+    """返回 (问题, 求解范围内既有排课 id)；后者在 replace_existing 时提交阶段删除。"""
+    courses = (
+        db.query(models.Course)
+        .filter(models.Course.term_id == term_id, models.Course.active == True)  # noqa: E712
+        .order_by(models.Course.id)
+        .all()
+    )
+    course_ids = [c.id for c in courses]
+    classes = {
+        c.id: c
+        for c in db.query(models.Class).filter(
+            models.Class.id.in_({c.class_id for c in courses if c.class_id})
+        )
+    }
+    sizes = dict(
+        db.query(models.Student.class_id, func.count(models.Student.id))
+        .filter(models.Student.class_id.in_(list(classes)))
+        .group_by(models.Student.class_id)
+        .all()
+    )
+    plan_hours = _plan_hours(db, course_ids) if course_ids else {}
+    rooms = (
+        db.query(models.Room)
+        .filter(models.Room.active == True)  # noqa: E712
+        .order_by(models.Room.capacity, models.Room.id)
+        .all()
+    )
+    room_labels = {}
+    for room in rooms:
+        room_labels[room.name] = room.id
+        room_labels[room.code] = room.id
+
+    entries = db.query(models.ScheduleEntry).all()
+    solving = set(course_ids)
+    fixed: dict[tuple, int] = {}
+    replaced_ids: list[int] = []
+    scheduled_hours: dict[int, int] = {}
+    for entry in entries:
+        if entry.course_id in solving:
+            if replace_existing:
+                replaced_ids.append(entry.id)
+                continue
+            scheduled_hours[entry.course_id] = (
+                scheduled_hours.get(entry.course_id, 0) + entry.end_slot - entry.start_slot + 1
+            )
+        mask = slot_mask(entry.start_slot, entry.end_slot)
+        room_id = entry.room_id or room_labels.get(entry.location)
+        for kind, key in (("class", entry.class_id), ("teacher", entry.teacher_id), ("room", room_id)):
+            if key:
+                fixed[(kind, key, entry.weekday)] = fixed.get((kind, key, entry.weekday), 0) | mask
+
+    rules = room_type_rules or {}
+    solver_courses = []
+    for course in courses:
+        klass = classes.get(course.class_id)
+        hours = course.weekly_hours or 0
+        candidates = plan_hours.get(course.id, [])
+        if klass is not None:
+            # 优先匹配同专业、同入学年级的培养方案
+            matched = [h for h, major, year in candidates if major == klass.major_id and year == klass.grade_year]
+            matched = matched or [h for h, major, _ in candidates if major == klass.major_id]
+        else:
+            matched = []
+        if matched or candidates:
+            hours = max(matched or [h for h, _, _ in candidates])
+        hours -= scheduled_hours.get(course.id, 0)
+        if hours <= 0:
+            continue
+        size = sizes.get(course.class_id, 0)
+        allowed_types = rules.get(course.course_type or "")
+        solver_courses.append(
+            SolverCourse(
+                course_id=course.id,
+                code=course.code,
+                name=course.name,
+                class_id=course.class_id,
+                teacher_id=course.teacher_id,
+                size=size,
+                hours=hours,
+                rooms=[
+                    r.id
+                    for r in rooms
+                    if (r.capacity is None or r.capacity >= size)
+                    and (not allowed_types or r.room_type in allowed_types)
+                ],
+            )
+        )
+    problem = Problem(
+        weekdays=weekdays or SOLVER_WEEKDAYS,
+        slots_per_day=slots_per_day or SOLVER_SLOTS_PER_DAY,
+        block=SOLVER_BLOCK,
+        courses=solver_courses,
+        room_capacity={r.id: r.capacity or 0 for r in rooms},
+        fixed=fixed,
+        requires_room=bool(rooms),
+    )
+    return problem, replaced_ids
+
+
+def describe(problem: Problem, solution: Solution, room_names: Dict[int, str]) -> dict:
+    """把解转换成待写入的排课条目、无法排入的课程和质量评分。"""
+    sessions = problem.sessions()
+    entries = []
+    placed_hours: dict[int, int] = {}
+    seat_waste = []
+    for (cidx, length), slot in zip(sessions, solution.assignment):
+        if slot is None:
+            continue
+        course = problem.courses[cidx]
+        day, start, end, room = slot
+        placed_hours[cidx] = placed_hours.get(cidx, 0) + length
+        capacity = problem.room_capacity.get(room) or 0
+        if capacity:
+            seat_waste.append(max(0, capacity - course.size) / capacity)
+        entries.append(
+            {
+                "course_id": course.course_id,
+                "class_id": course.class_id,
+                "teacher_id": course.teacher_id,
+                "room_id": room,
+                "weekday": day,
+                "start_slot": start,
+                "end_slot": end,
+                "location": room_names.get(room),
+            }
+        )
+    entries.sort(key=lambda e: (e["weekday"], e["start_slot"], e["course_id"]))
+
+    unplaced = []
+    for cidx, course in enumerate(problem.courses):
+        placed = placed_hours.get(cidx, 0)
+        if placed < course.hours:
+            unplaced.append(
+                {
+                    "course_id": course.course_id,
+                    "course_code": course.code,
+                    "course_name": course.name,
+                    "class_id": course.class_id,
+                    "required_hours": course.hours,
+                    "placed_hours": placed,
+                    "reason": NO_ROOM if problem.requires_room and not course.rooms else NO_SLOT,
+                }
+            )
+
+    total = len(sessions)
+    placed_sessions = total - solution.unplaced
+    same_day = 0
+    by_course_day: dict[tuple, int] = {}
+    for (cidx, _), slot in zip(sessions, solution.assignment):
+        if slot:
+            key = (cidx, slot[0])
+            same_day += 1 if by_course_day.get(key) else 0
+            by_course_day[key] = by_course_day.get(key, 0) + 1
+    avg_waste = sum(seat_waste) / len(seat_waste) if seat_waste else 0.0
+    # 满分 100：按放置率计分，再按同日重复与座位浪费扣分
+    score = 100.0 * placed_sessions / total if total else 100.0
+    if total:
+        score -= 10.0 * same_day / total + 10.0 * avg_waste
+    quality = {
+        "score": round(max(0.0, score), 2),
+        "placed_sessions": placed_sessions,
+        "total_sessions": total,
+        "same_day_repeats": same_day,
+        "avg_seat_waste": round(avg_waste, 4),
+        "soft_cost": solution.soft_cost,
+        "iterations": solution.iterations,
+    }
+    return {"entries": entries, "unplaced": unplaced, "quality": quality}
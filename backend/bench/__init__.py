@@ -0,0 +1 @@
+"""Benchmarks for the Police Academy backend (run with ``python -m bench.<name>``)."""
@@ -0,0 +1,76 @@
+"""Local OpenAI-compatible stub for exercising the AI assistant.
+
+    AI_STUB_LATENCY=2 uvicorn bench.ai_stub:app --port 9100
+    AI_BASE_URL=http://127.0.0.1:9100/v1 ARK_API_KEY=stub uvicorn app.main:app
+
+实现 ``POST /v1/chat/completions``（含 ``stream=true`` 的 SSE 分片），按
+``AI_STUB_LATENCY`` 秒延迟作答，``AI_STUB_FAIL_RATE`` 比例的请求返回 503，
+用于验证超时、重试与并发上限。
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY = float(os.getenv("AI_STUB_LATENCY", "0.5"))
+FAIL_RATE = float(os.getenv("AI_STUB_FAIL_RATE", "0"))
+CHUNKS = int(os.getenv("AI_STUB_CHUNKS", "8"))
+
+app = FastAPI(title="ai-stub")
+app.state.calls = 0
+
+
+def _answer(messages: list) -> str:
+    prompt = messages[-1]["content"] if messages else ""
+    return f"（stub）已收到：{prompt}"
+
+
+def _completion(model: str, content: str) -> dict:
+    return {
+        "id": f"stub-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def _chunk(model: str, delta: dict, finish_reason=None) -> str:
+    body = {
+        "id": "stub-stream",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    app.state.calls += 1
+    payload = await request.json()
+    model = payload.get("model", "stub")
+    if random.random() < FAIL_RATE:
+        return JSONResponse({"error": {"message": "stub overloaded"}}, status_code=503)
+    content = _answer(payload.get("messages", []))
+    if not payload.get("stream"):
+        await asyncio.sleep(LATENCY)
+        return _completion(model, content)
+
+    async def events():
+        step = max(1, len(content) // CHUNKS)
+        yield _chunk(model, {"role": "assistant", "content": ""})
+        for start in range(0, len(content), step):
+            await asyncio.sleep(LATENCY / CHUNKS)
+            yield _chunk(model, {"content": content[start : start + step]})
+        yield _chunk(model, {}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,64 @@
+"""Micro-benchmark: per-request authorization cost, ORM sets vs. precompiled masks.
+
+    python -m bench.authz [iterations]
+"""
+
+import sys
+import timeit
+
+from app import models
+from app.permission_registry import permission_registry
+from app.principal_cache import Principal
+from app.seed import DEFAULT_PERMISSIONS
+
+
+def _build_user(role_code: str, perm_codes: list[str]) -> models.User:
+    perms = [models.Permission(code=code, name=code) for code in perm_codes]
+    role = models.Role(id=1, code=role_code, name=role_code, permissions=perms)
+    return models.User(
+        id=1, username="bench", full_name="bench", active=True, roles=[role]
+    )
+
+
+def _legacy_check(user: models.User, allowed_roles: list[str], allowed_permissions: list[str]):
+    # 旧实现：每次从 ORM 集合重建 set 再求交
+    role_codes = {role.code for role in user.roles}
+    if allowed_roles and role_codes.isdisjoint(set(allowed_roles)):
+        return False
+    if "ADMIN" in role_codes:
+        return True
+    perms = set()
+    for role in user.roles:
+        for perm in role.permissions:
+            perms.add(perm.code)
+    return not (allowed_permissions and perms.isdisjoint(set(allowed_permissions)))
+
+
+def main(iterations: int = 200_000) -> None:
+    perm_codes = [p["code"] for p in DEFAULT_PERMISSIONS][:5]
+    allowed_roles = ["ADMIN", "TEACHER"]
+    allowed_perms = ["grade:review", "schedule:write"]
+    user = _build_user("TEACHER", perm_codes)
+    principal = Principal.from_user(user)
+    role_mask = permission_registry.role_mask(allowed_roles)
+    admin_mask = permission_registry.role_mask(["ADMIN"])
+    perm_mask = permission_registry.permission_mask(allowed_perms)
+
+    def masked():
+        if role_mask and not principal.role_mask & role_mask:
+            return False
+        if principal.role_mask & admin_mask:
+            return True
+        return not (perm_mask and not principal.permission_mask & perm_mask)
+
+    assert masked() == _legacy_check(user, allowed_roles, allowed_perms)
+    legacy = timeit.timeit(lambda: _legacy_check(user, allowed_roles, allowed_perms), number=iterations)
+    fast = timeit.timeit(masked, number=iterations)
+    print(f"iterations      : {iterations}")
+    print(f"legacy sets     : {legacy / iterations * 1e9:8.1f} ns/check")
+    print(f"bitmask         : {fast / iterations * 1e9:8.1f} ns/check")
+    print(f"speedup         : {legacy / fast:8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
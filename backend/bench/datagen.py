@@ -0,0 +1,312 @@
+"""Deterministic synthetic dataset for load tests.
+
+    python -m bench.datagen --database-url sqlite:///./load.db [--scale large] [--students N ...] [--seed 0]
+
+按规模参数批量写入（Core ``insert`` executemany，分块提交），同一 seed 每次生成的数据相同：
+
+- 用户：``admin1..`` / ``teacher1..`` / ``student1..``，密码统一为 ``BENCH_PASSWORD``（只算一次哈希）；
+- 两个学期、若干专业，班级平均分配学员，课程按班级轮转并分给教师，两个学期交替；
+- 成绩：每名学员先覆盖本班课程，再按 seed 抽取其他课程补足到目标条数；
+- 课表：按 (星期, 两节一块) 逐条找班级 / 教师 / 教室都空闲的格子，容量不够时才允许重叠；
+- 本学期每门课一场考试，日期分布在今天起 30 天内。
+
+目标库必须是空的（没有用户）；库结构先经 ``app.migrations.ensure_schema`` 升级。
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app import models
+from app.grade_upsert import total_score
+from app.migrations import ensure_schema
+from app.passwords import hash_password
+from app.seed import ensure_permissions_seed
+
+BENCH_PASSWORD = "bench123"
+CHUNK = 10_000
+WEEKDAYS = 5
+BLOCKS = ((1, 2), (3, 4), (5, 6), (7, 8), (9, 10), (11, 12))
+
+SCALES = {
+    "small": dict(
+        students=2_000, classes=50, teachers=120, courses=300, grades=40_000, schedule=1_000, rooms=100, admins=3
+    ),
+    "medium": dict(
+        students=8_000, classes=200, teachers=400, courses=1_200, grades=250_000, schedule=4_000, rooms=300, admins=5
+    ),
+    "large": dict(
+        students=20_000,
+        classes=500,
+        teachers=1_000,
+        courses=3_000,
+        grades=1_000_000,
+        schedule=60_000,
+        rooms=600,
+        admins=10,
+    ),
+}
+
+
+def _bulk(engine: Engine, model, rows: list[dict]) -> None:
+    for start in range(0, len(rows), CHUNK):
+        with engine.begin() as conn:
+            conn.execute(insert(model), rows[start : start + CHUNK])
+
+
+def _schedule(rng: random.Random, courses: list[dict], per_course: int, extra: int, rooms: int) -> list[dict]:
+    cells = [(day, block) for day in range(1, WEEKDAYS + 1) for block in BLOCKS]
+    busy_class, busy_teacher, busy_room = set(), set(), set()
+    rows = []
+    for index, course in enumerate(courses):
+        for _ in range(per_course + (1 if index < extra else 0)):
+            offset = rng.randrange(len(cells))
+            chosen = None
+            for step in range(len(cells)):
+                cell = cells[(offset + step) % len(cells)]
+                if (course["class_id"], cell) in busy_class or (course["teacher_id"], cell) in busy_teacher:
+                    continue
+                first = rng.randrange(rooms)
+                room_id = next(
+                    (r for r in (((first + k) % rooms) + 1 for k in range(rooms)) if (r, cell) not in busy_room), None
+                )
+                if room_id is not None:
+                    chosen = cell, room_id
+                    break
+            if chosen is None:
+                # 格子已满：允许重叠（相当于单双周轮换的历史数据）
+                chosen = cells[offset], rng.randint(1, rooms)
+            cell, room_id = chosen
+            busy_class.add((course["class_id"], cell))
+            busy_teacher.add((course["teacher_id"], cell))
+            busy_room.add((room_id, cell))
+            weekday, (start_slot, end_slot) = cell
+            rows.append(
+                {
+                    "id": len(rows) + 1,
+                    "course_id": course["id"],
+                    "class_id": course["class_id"],
+                    "teacher_id": course["teacher_id"],
+                    "room_id": room_id,
+                    "weekday": weekday,
+                    "start_slot": start_slot,
+                    "end_slot": end_slot,
+                }
+            )
+    return rows
+
+
+def generate(
+    engine: Engine,
+    seed: int = 0,
+    students: int = 2_000,
+    classes: int = 50,
+    teachers: int = 120,
+    courses: int = 300,
+    grades: int = 40_000,
+    schedule: int = 1_000,
+    rooms: int = 100,
+    admins: int = 3,
+    log=print,
+) -> dict:
+    """写入合成数据，返回各表行数。"""
+    ensure_schema(engine)
+    with Session(bind=engine) as db:
+        if db.scalar(select(func.count(models.User.id))):
+            raise SystemExit("target database already has users; use an empty database")
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    password_hash = hash_password(BENCH_PASSWORD)
+    today = date.today()
+
+    _bulk(
+        engine,
+        models.Role,
+        [
+            {"id": 1, "code": "ADMIN", "name": "教务管理员"},
+            {"id": 2, "code": "TEACHER", "name": "教师"},
+            {"id": 3, "code": "STUDENT", "name": "学员"},
+        ],
+    )
+    with Session(bind=engine) as db:
+        ensure_permissions_seed(db)
+    _bulk(engine, models.OrgUnit, [{"id": 1, "name": "警官学院", "unit_type": "ACADEMY"}])
+    _bulk(
+        engine,
+        models.Term,
+        [
+            {"id": 1, "name": "BENCH-1", "start_date": today - timedelta(days=60), "is_current": True},
+            {"id": 2, "name": "BENCH-2", "start_date": today + timedelta(days=120), "is_current": False},
+        ],
+    )
+    majors = max(1, classes // 25)
+    _bulk(
+        engine,
+        models.Major,
+        [{"id": i, "code": f"M{i:03d}", "name": f"专业{i}", "org_unit_id": 1} for i in range(1, majors + 1)],
+    )
+    _bulk(
+        engine,
+        models.Class,
+        [
+            {"id": i, "code": f"C{i:04d}", "name": f"{i}队", "major_id": (i - 1) % majors + 1, "term_id": 1}
+            for i in range(1, classes + 1)
+        ],
+    )
+    _bulk(
+        engine,
+        models.Room,
+        [
+            {"id": i, "code": f"R{i:04d}", "name": f"教室{i}", "capacity": rng.choice((40, 60, 120))}
+            for i in range(1, rooms + 1)
+        ],
+    )
+
+    # 用户 id：管理员 1..A，教师 A+1..A+T，学员其后
+    users, user_roles = [], []
+    for i in range(1, admins + 1):
+        users.append({"id": len(users) + 1, "username": f"admin{i}", "full_name": f"管理员{i}"})
+        user_roles.append({"user_id": len(users), "role_id": 1})
+    for i in range(1, teachers + 1):
+        users.append({"id": len(users) + 1, "username": f"teacher{i}", "full_name": f"教官{i}"})
+        user_roles.append({"user_id": len(users), "role_id": 2})
+    for i in range(1, students + 1):
+        users.append({"id": len(users) + 1, "username": f"student{i}", "full_name": f"学员{i}"})
+        user_roles.append({"user_id": len(users), "role_id": 3})
+    for row in users:
+        row.update(password_hash=password_hash, org_unit_id=1)
+    _bulk(engine, models.User, users)
+    _bulk(engine, models.UserRole, user_roles)
+    _bulk(
+        engine,
+        models.Teacher,
+        [
+            {"id": i, "user_id": admins + i, "major_id": (i - 1) % majors + 1, "title": "讲师"}
+            for i in range(1, teachers + 1)
+        ],
+    )
+    student_rows = [
+        {
+            "id": i,
+            "user_id": admins + teachers + i,
+            "class_id": (i - 1) % classes + 1,
+            "student_no": f"B{i:07d}",
+            "status": "active" if rng.random() < 0.97 else "leave",
+        }
+        for i in range(1, students + 1)
+    ]
+    _bulk(engine, models.Student, student_rows)
+    _bulk(
+        engine,
+        models.StudentStatusLog,
+        [{"student_id": row["id"], "status": row["status"]} for row in student_rows],
+    )
+
+    course_rows = [
+        {
+            "id": i,
+            "code": f"K{i:05d}",
+            "name": f"课程{i}",
+            "major_id": (i - 1) % majors + 1,
+            "teacher_id": rng.randint(1, teachers),
+            "term_id": 1 if i % 2 else 2,
+            "class_id": (i - 1) % classes + 1,
+            "credit": Decimal(rng.choice(("2.0", "3.0", "4.0"))),
+            "weekly_hours": rng.choice((2, 4)),
+        }
+        for i in range(1, courses + 1)
+    ]
+    _bulk(engine, models.Course, course_rows)
+
+    # 成绩：本班课程优先，不足部分在全部课程中抽取
+    by_class: dict[int, list[int]] = {}
+    for row in course_rows:
+        by_class.setdefault(row["class_id"], []).append(row["id"])
+    per_student, remainder = divmod(min(grades, students * courses), students)
+    grade_rows = []
+    for student in student_rows:
+        want = per_student + (1 if student["id"] <= remainder else 0)
+        picked = by_class.get(student["class_id"], [])[:want]
+        chosen = set(picked)
+        while len(picked) < want:
+            course_id = rng.randint(1, courses)
+            if course_id not in chosen:
+                chosen.add(course_id)
+                picked.append(course_id)
+        for course_id in picked:
+            usual, final = rng.randint(40, 100), rng.randint(30, 100)
+            roll = rng.random()
+            grade_rows.append(
+                {
+                    "student_id": student["id"],
+                    "course_id": course_id,
+                    "term_id": course_rows[course_id - 1]["term_id"],
+                    "usual_score": usual,
+                    "final_score": final,
+                    "total_score": total_score(usual, final),
+                    "status": "published" if roll < 0.7 else "submitted" if roll < 0.85 else "draft",
+                }
+            )
+    _bulk(engine, models.Grade, grade_rows)
+
+    per_course, extra = divmod(schedule, courses)
+    schedule_rows = _schedule(rng, course_rows, per_course, extra, rooms)
+    _bulk(engine, models.ScheduleEntry, schedule_rows)
+
+    _bulk(
+        engine,
+        models.Exam,
+        [
+            {
+                "course_id": row["id"],
+                "class_id": row["class_id"],
+                "term_id": 1,
+                "room_id": rng.randint(1, rooms),
+                "exam_date": today + timedelta(days=rng.randint(0, 30)),
+                "duration_minutes": rng.choice((90, 120)),
+            }
+            for row in course_rows
+            if row["term_id"] == 1
+        ],
+    )
+
+    counts = {
+        "users": len(users),
+        "students": students,
+        "teachers": teachers,
+        "classes": classes,
+        "courses": courses,
+        "grades": len(grade_rows),
+        "schedule_entries": len(schedule_rows),
+        "rooms": rooms,
+    }
+    log(f"generated {counts} in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name}", type=int)
+    args = parser.parse_args(argv)
+    params = {**SCALES[args.scale], **{k: v for k, v in vars(args).items() if k in SCALES["small"] and v}}
+    engine = create_engine(args.database_url)
+    try:
+        generate(engine, seed=args.seed, **params)
+    finally:
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
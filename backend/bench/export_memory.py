@@ -0,0 +1,124 @@
+"""Peak-memory benchmark for streaming grade exports.
+
+    python -m bench.export_memory [rows] [max_peak_mb]
+
+在临时 SQLite 库中写入 ``rows`` 条成绩（默认 100 万），随后在独立子进程中完整消费
+CSV 与 NDJSON 导出流，统计导出阶段的峰值 RSS 增量（无 ``resource`` 模块的平台退回
+tracemalloc），超过 ``max_peak_mb`` 时退出码非 0。
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from sqlalchemy import create_engine, insert
+
+from app import exports, models
+from app.db import Base
+
+CHUNK = 50_000
+
+
+def _populate(engine, rows: int, students: int = 20_000, courses: int = 3_000) -> None:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Term), [{"id": 1, "name": "bench-term"}])
+        conn.execute(insert(models.Class), [{"id": 1, "code": "B1", "name": "bench-class", "term_id": 1}])
+        conn.execute(
+            insert(models.User),
+            [{"id": i, "username": f"s{i}", "password_hash": "x", "full_name": f"学员{i}"} for i in range(1, students + 1)],
+        )
+        conn.execute(
+            insert(models.Student),
+            [{"id": i, "user_id": i, "class_id": 1, "student_no": f"N{i:06d}"} for i in range(1, students + 1)],
+        )
+        conn.execute(
+            insert(models.Course),
+            [{"id": i, "code": f"C{i}", "name": f"课程{i}", "term_id": 1, "class_id": 1} for i in range(1, courses + 1)],
+        )
+        for start in range(0, rows, CHUNK):
+            batch = []
+            for i in range(start, min(start + CHUNK, rows)):
+                batch.append(
+                    {
+                        "student_id": i % students + 1,
+                        "course_id": i // students % courses + 1,
+                        "term_id": 1,
+                        "usual_score": 60 + i % 40,
+                        "final_score": 50 + i % 50,
+                        "total_score": 55 + i % 45,
+                        "status": "published",
+                    }
+                )
+            conn.execute(insert(models.Grade), batch)
+
+
+def _rss_mb() -> float:
+    # Linux 上 ru_maxrss 单位为 KB，macOS 为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (peak if sys.platform == "darwin" else peak * 1024) / 1024 / 1024
+
+
+def _current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return _rss_mb()
+
+
+def _consume(url: str, fmt: str) -> tuple[int, float, float]:
+    engine = create_engine(url)
+    names = list(exports.GRADE_COLUMNS)
+    rows = exports.iter_rows(engine, exports.grade_select(names))
+    body = exports.iter_csv(rows, names) if fmt == "csv" else exports.iter_ndjson(rows, names)
+    if resource is None:
+        tracemalloc.start()
+    baseline = _current_rss_mb() if resource else 0.0
+    started = time.perf_counter()
+    total = 0
+    for chunk in body:
+        total += len(chunk)
+    elapsed = time.perf_counter() - started
+    if resource is None:
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    else:
+        peak = _rss_mb() - baseline
+    engine.dispose()
+    return total, elapsed, peak
+
+
+def main(rows: int = 1_000_000, max_peak_mb: float = 64.0) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'export.db')}"
+        engine = create_engine(url)
+        started = time.perf_counter()
+        _populate(engine, rows)
+        engine.dispose()
+        print(f"populated {rows} grades in {time.perf_counter() - started:.1f}s")
+        ok = True
+        ctx = multiprocessing.get_context("spawn")
+        for fmt in ("csv", "ndjson"):
+            # 每种格式用全新进程测量，避免写库阶段的内存峰值干扰
+            with ctx.Pool(1) as pool:
+                size, elapsed, peak = pool.apply(_consume, (url, fmt))
+            ok = ok and peak <= max_peak_mb
+            print(
+                f"{fmt:7s} {size / 1024 / 1024:8.1f} MB written  {elapsed:6.1f}s  "
+                f"peak +{peak:6.1f} MB (limit {max_peak_mb} MB)"
+            )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(main(int(args[0]) if args else 1_000_000, float(args[1]) if len(args) > 1 else 64.0))
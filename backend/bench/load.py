@@ -0,0 +1,422 @@
+"""End-to-end load test: mixed traffic against the real FastAPI app.
+
+    python -m bench.load [--scale small] [--users 8] [--duration 20] [--warmup 2] [--seed 0]
+                         [--database-url URL] [--out load-report.json] [--compare base.json]
+
+未给 ``--database-url`` 时在临时 SQLite 文件上用 ``bench.datagen`` 生成数据；给了 URL 且库里
+已有用户时直接复用（大规模数据先用 ``python -m bench.datagen`` 生成一次）。
+
+进程内通过 ``httpx.ASGITransport`` 调用 ``app.main:app``（含启动 / 关闭钩子），同步接口照常
+进线程池。每个虚拟用户按身份登录后循环执行加权的请求组合：
+
+- 学员：首页、我的课表、我的成绩、我的考试、重新登录；
+- 教师：首页、我的课表、按课程查成绩、批量导入成绩；
+- 管理员：首页、按班级查成绩、调整课表（移动到随机格子，冲突时 400）、批量导入学员。
+
+报告按接口统计次数、状态码、吞吐、p50/p95/p99 延迟和每请求 SQL 条数 / 耗时，写成键有序的
+JSON，便于版本间 diff；``--compare`` 打印与旧报告的 p95 对比。
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SQL_HEADER = "x-bench-sql"
+IMPORT_BATCH = 20
+STUDENT_IMPORT_BATCH = 5
+# 列表请求显式分页（不带 limit 时接口返回全部结果）
+PAGE_LIMIT = 100
+
+# 每个请求的 [语句数, 耗时秒]；asyncio 任务与线程池都会复制上下文
+_request_sql: contextvars.ContextVar = contextvars.ContextVar("bench_request_sql", default=None)
+
+PERSONAS = {
+    "STUDENT": (
+        ("GET /api/home", 4),
+        ("GET /api/schedule/my", 4),
+        ("GET /api/grades/my", 4),
+        ("GET /api/exams/my", 1),
+        ("POST /auth/login", 1),
+    ),
+    "TEACHER": (
+        ("GET /api/home", 3),
+        ("GET /api/schedule/my", 3),
+        ("GET /api/grades?course_id", 4),
+        ("POST /api/grades/import", 1),
+        ("POST /auth/login", 1),
+    ),
+    "ADMIN": (
+        ("GET /api/home", 2),
+        ("GET /api/grades?class_id", 3),
+        ("PUT /api/schedule/{id}", 2),
+        ("POST /api/students/import", 1),
+        ("POST /auth/login", 1),
+    ),
+}
+# 冲突等业务上预期的拒绝，不计为错误
+EXPECTED_STATUS = {"PUT /api/schedule/{id}": {400}}
+
+
+def _instrument(app, engines):
+    from sqlalchemy import event
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if _request_sql.get() is not None:
+            conn.info.setdefault("bench_started", []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        stats = _request_sql.get()
+        if stats is not None and conn.info.get("bench_started"):
+            stats[0] += 1
+            stats[1] += time.perf_counter() - conn.info["bench_started"].pop()
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before)
+        event.listen(engine, "after_cursor_execute", after)
+
+    async def wrapped(scope, receive, send):
+        if scope["type"] != "http":
+            return await app(scope, receive, send)
+        stats = [0, 0.0]
+        token = _request_sql.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                header = (SQL_HEADER.encode(), f"{stats[0]};{stats[1] * 1000:.3f}".encode())
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        try:
+            await app(scope, receive, send_with_stats)
+        finally:
+            _request_sql.reset(token)
+
+    return wrapped
+
+
+def _lookups(session_factory) -> dict:
+    from sqlalchemy import func, select
+
+    from app import models
+
+    with session_factory() as db:
+        courses = db.execute(
+            select(models.Course.id, models.Course.teacher_id, models.Course.class_id, models.Course.term_id)
+            .where(models.Course.teacher_id.is_not(None), models.Course.class_id.is_not(None))
+            .order_by(models.Course.id)
+        ).all()
+        teachers = dict(
+            db.execute(
+                select(models.Teacher.id, models.User.username)
+                .join(models.User, models.User.id == models.Teacher.user_id)
+                .where(models.Teacher.id.in_({c.teacher_id for c in courses}))
+            ).all()
+        )
+        admins = db.scalars(
+            select(models.User.username)
+            .join(models.UserRole, models.UserRole.user_id == models.User.id)
+            .join(models.Role, models.Role.id == models.UserRole.role_id)
+            .where(models.Role.code == "ADMIN")
+            .order_by(models.User.id)
+        ).all()
+        students = db.scalars(
+            select(models.User.username)
+            .join(models.Student, models.Student.user_id == models.User.id)
+            .order_by(models.Student.id)
+        ).all()
+        class_students: dict[int, list[int]] = {}
+        for student_id, class_id in db.execute(select(models.Student.id, models.Student.class_id)):
+            class_students.setdefault(class_id, []).append(student_id)
+        max_entry = db.scalar(select(func.max(models.ScheduleEntry.id))) or 0
+    teacher_courses: dict[str, list] = {}
+    for course in courses:
+        if course.teacher_id in teachers:
+            teacher_courses.setdefault(teachers[course.teacher_id], []).append(course)
+    return {
+        "admins": admins,
+        "teachers": sorted(teacher_courses),
+        "teacher_courses": teacher_courses,
+        "students": students,
+        "class_students": class_students,
+        "classes": sorted(class_students),
+        "max_entry": max_entry,
+    }
+
+
+class VirtualUser:
+    def __init__(self, index: int, persona: str, username: str, password: str, lookups: dict, seed: int, run_id: str):
+        self.index = index
+        self.persona = persona
+        self.username = username
+        self.password = password
+        self.lookups = lookups
+        self.rng = random.Random(seed * 1_000_003 + index)
+        self.run_id = run_id
+        self.headers: dict = {}
+        self.imported = 0
+        steps = PERSONAS[persona]
+        self.step_names = [name for name, _ in steps]
+        self.step_weights = [weight for _, weight in steps]
+
+    def request(self, step: str) -> tuple:
+        """返回 (method, url, json)。"""
+        rng, lookups = self.rng, self.lookups
+        if step == "POST /auth/login":
+            return "POST", "/auth/login", {"username": self.username, "password": self.password}
+        if step == "GET /api/grades?course_id":
+            course = rng.choice(lookups["teacher_courses"][self.username])
+            return "GET", f"/api/grades?course_id={course.id}&limit={PAGE_LIMIT}", None
+        if step == "GET /api/grades?class_id":
+            return "GET", f"/api/grades?class_id={rng.choice(lookups['classes'])}&limit={PAGE_LIMIT}", None
+        if step == "POST /api/grades/import":
+            course = rng.choice(lookups["teacher_courses"][self.username])
+            students = lookups["class_students"].get(course.class_id, [])
+            rows = [
+                {
+                    "student_id": student_id,
+                    "course_id": course.id,
+                    "term_id": course.term_id,
+                    "usual_score": rng.randint(40, 100),
+                    "final_score": rng.randint(30, 100),
+                }
+                for student_id in rng.sample(students, min(IMPORT_BATCH, len(students)))
+            ]
+            return "POST", "/api/grades/import", {"grades": rows}
+        if step == "PUT /api/schedule/{id}":
+            entry_id = rng.randint(1, max(1, lookups["max_entry"]))
+            start_slot = rng.choice((1, 3, 5, 7))
+            payload = {"weekday": rng.randint(1, 5), "start_slot": start_slot, "end_slot": start_slot + 1}
+            return "PUT", f"/api/schedule/{entry_id}", payload
+        if step == "POST /api/students/import":
+            rows = []
+            for _ in range(STUDENT_IMPORT_BATCH):
+                self.imported += 1
+                tag = f"{self.run_id}-{self.index}-{self.imported}"
+                rows.append(
+                    {
+                        "username": f"load-{tag}",
+                        "password": self.password,
+                        "full_name": f"压测{tag}",
+                        "student_no": f"L{tag}",
+                        "class_id": rng.choice(lookups["classes"]),
+                    }
+                )
+            return "POST", "/api/students/import", {"students": rows}
+        method, url = step.split(" ", 1)
+        return method, url, None
+
+    async def call(self, client, step: str) -> tuple:
+        method, url, payload = self.request(step)
+        started = time.perf_counter()
+        response = await client.request(method, url, json=payload, headers=self.headers)
+        elapsed = time.perf_counter() - started
+        if step == "POST /auth/login" and response.status_code == 200:
+            self.headers = {"Authorization": "Bearer " + response.json()["access_token"]}
+        count, db_ms = response.headers.get(SQL_HEADER, "0;0").split(";")
+        return step, response.status_code, elapsed, int(count), float(db_ms), started
+
+    async def run(self, client, deadline: float, samples: list) -> None:
+        sample = await self.call(client, "POST /auth/login")
+        if sample[1] != 200:
+            raise RuntimeError(f"login failed for {self.username}: {sample[1]}")
+        samples.append(sample)
+        while time.perf_counter() < deadline:
+            step = self.rng.choices(self.step_names, self.step_weights)[0]
+            samples.append(await self.call(client, step))
+
+
+def _personas(users: int, lookups: dict, seed: int) -> list[tuple]:
+    # 学员 : 教师 : 管理员 约 6 : 3 : 1
+    rng = random.Random(seed)
+    result = []
+    for index in range(users):
+        slot = index % 10
+        if slot == 9 and lookups["admins"]:
+            result.append(("ADMIN", lookups["admins"][index % len(lookups["admins"])]))
+        elif slot in (2, 5, 8) and lookups["teachers"]:
+            result.append(("TEACHER", rng.choice(lookups["teachers"])))
+        else:
+            result.append(("STUDENT", rng.choice(lookups["students"])))
+    return result
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _summarize(samples: list, seconds: float) -> dict:
+    endpoints: dict[str, list] = {}
+    for sample in samples:
+        endpoints.setdefault(sample[0], []).append(sample)
+    report = {}
+    for name, rows in sorted(endpoints.items()):
+        latencies = [row[2] * 1000 for row in rows]
+        statuses: dict[str, int] = {}
+        for row in rows:
+            statuses[str(row[1])] = statuses.get(str(row[1]), 0) + 1
+        expected = EXPECTED_STATUS.get(name, set())
+        report[name] = {
+            "count": len(rows),
+            "errors": sum(1 for row in rows if row[1] >= 400 and row[1] not in expected),
+            "status": statuses,
+            "throughput_rps": round(len(rows) / seconds, 3),
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies), 3),
+                "p50": round(_percentile(latencies, 0.50), 3),
+                "p95": round(_percentile(latencies, 0.95), 3),
+                "p99": round(_percentile(latencies, 0.99), 3),
+                "max": round(max(latencies), 3),
+            },
+            "sql": {
+                "statements_mean": round(sum(row[3] for row in rows) / len(rows), 3),
+                "statements_max": max(row[3] for row in rows),
+                "db_ms_mean": round(sum(row[4] for row in rows) / len(rows), 3),
+            },
+        }
+    return report
+
+
+def _git_revision() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return out.stdout.strip()
+
+
+def _print_report(report: dict) -> None:
+    print(f"{'endpoint':28} {'count':>6} {'err':>4} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'sql':>6}")
+    for name, row in report["endpoints"].items():
+        lat = row["latency_ms"]
+        print(
+            f"{name:28} {row['count']:6d} {row['errors']:4d} {row['throughput_rps']:7.1f} "
+            f"{lat['p50']:8.1f} {lat['p95']:8.1f} {lat['p99']:8.1f} {row['sql']['statements_mean']:6.1f}"
+        )
+    totals = report["totals"]
+    print(f"total {totals['requests']} requests, {totals['errors']} errors, {totals['throughput_rps']:.1f} req/s")
+
+
+def _print_compare(base: dict, report: dict) -> None:
+    print(f"{'endpoint':28} {'p95 base':>9} {'p95 now':>9} {'change':>8} {'sql base':>9} {'sql now':>8}")
+    for name, row in report["endpoints"].items():
+        old = base.get("endpoints", {}).get(name)
+        if not old:
+            continue
+        before, after = old["latency_ms"]["p95"], row["latency_ms"]["p95"]
+        change = f"{(after - before) / before * 100:+.0f}%" if before else "n/a"
+        print(
+            f"{name:28} {before:9.1f} {after:9.1f} {change:>8} "
+            f"{old['sql']['statements_mean']:9.1f} {row['sql']['statements_mean']:8.1f}"
+        )
+
+
+async def _drive(app, wrapped, users: list, seconds: float, warmup: float) -> tuple:
+    import httpx
+
+    samples: list = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=wrapped)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            started = time.perf_counter()
+            deadline = started + warmup + seconds
+            await asyncio.gather(*(user.run(client, deadline, samples) for user in users))
+            measured_from = started + warmup
+            elapsed = time.perf_counter() - measured_from
+    return [s for s in samples if s[5] >= measured_from], elapsed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url")
+    parser.add_argument("--scale", default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--out", default="load-report.json")
+    parser.add_argument("--compare")
+    args = parser.parse_args(argv)
+
+    tmp = None
+    url = args.database_url
+    if not url:
+        tmp = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmp.name, 'load.db')}"
+    # 应用的引擎在导入时读取 DATABASE_URL
+    os.environ["DATABASE_URL"] = url
+    from sqlalchemy import create_engine, func, select
+
+    from app import models
+    from bench import datagen
+
+    engine = create_engine(url)
+    try:
+        with engine.connect() as conn:
+            has_users = bool(conn.execute(select(func.count(models.User.id))).scalar())
+    except Exception:
+        has_users = False
+    if not has_users:
+        datagen.generate(engine, seed=args.seed, **datagen.SCALES[args.scale])
+    engine.dispose()
+
+    from app.db import SessionLocal, engine as app_engine, read_engine
+    from app.main import app
+
+    lookups = _lookups(SessionLocal)
+    run_id = datetime.utcnow().strftime("%H%M%S")
+    users = [
+        VirtualUser(i, persona, username, datagen.BENCH_PASSWORD, lookups, args.seed, run_id)
+        for i, (persona, username) in enumerate(_personas(args.users, lookups, args.seed))
+    ]
+    wrapped = _instrument(app, {app_engine, read_engine})
+    samples, elapsed = asyncio.run(_drive(app, wrapped, users, args.duration, args.warmup))
+
+    endpoints = _summarize(samples, elapsed)
+    report = {
+        "meta": {
+            "generated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "database": app_engine.url.get_backend_name(),
+            "scale": args.scale if not has_users else "existing",
+            "seed": args.seed,
+            "users": args.users,
+            "duration_seconds": round(elapsed, 3),
+            "warmup_seconds": args.warmup,
+        },
+        "totals": {
+            "requests": len(samples),
+            "errors": sum(row["errors"] for row in endpoints.values()),
+            "throughput_rps": round(len(samples) / elapsed, 3),
+        },
+        "endpoints": endpoints,
+    }
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2, sort_keys=True)
+        fh.write("\n")
+    _print_report(report)
+    print(f"report written to {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            _print_compare(json.load(fh), report)
+    if tmp is not None:
+        tmp.cleanup()
+    return 1 if report["totals"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""Query-plan regression check for the hot query paths.
+
+    python -m bench.query_plans [-v]
+
+在临时 SQLite 库里建表并写入少量样例行，依次执行下列热点查询的真实代码路径，
+捕获实际发出的 SELECT，逐条 ``EXPLAIN QUERY PLAN``。热点表上出现全表扫描
+（``SCAN <table>``，包括整棵索引的扫描）即判定为回归，退出码 1。
+个别批处理路径本来就要读全表（例如排课求解要载入全校课表占用），在用例里显式声明。
+``-v`` 打印每条语句的执行计划。
+"""
+
+import os
+import re
+import sys
+import tempfile
+from datetime import date, time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, selectinload
+
+from app import analytics, counters, exam_allocation, exports, models, schemas, timetable_grid, timetable_solver
+from app.db import Base
+from app.principal_cache import ClassRef, Principal, StudentRef, TeacherRef
+from app.routers.api import _exams_query, _grades_query, find_schedule_conflicts
+from app.schedule_index import _batch_candidates
+
+# 随业务数据增长的表；其余基础表（教室、学期、角色等）行数有限，不做要求
+HOT_TABLES = {
+    "grades",
+    "grade_audits",
+    "schedule_entries",
+    "courses",
+    "exams",
+    "students",
+    "student_status_logs",
+}
+SCAN = re.compile(r"^SCAN (\w+)")
+
+
+def _seed(db: Session) -> None:
+    term = models.Term(id=1, name="2024-2025-1", start_date=date(2024, 9, 1), is_current=True)
+    klass = models.Class(id=1, code="C1", name="一班", term_id=1)
+    t_user = models.User(id=1, username="t", full_name="教师", password_hash="x")
+    s_user = models.User(id=2, username="s", full_name="学生", password_hash="x")
+    teacher = models.Teacher(id=1, user_id=1)
+    student = models.Student(id=1, user_id=2, class_id=1, student_no="S1")
+    room = models.Room(id=1, code="R1", name="101", capacity=60)
+    course = models.Course(id=1, code="K1", name="课程", teacher_id=1, term_id=1, class_id=1)
+    db.add_all([term, klass, t_user, s_user, teacher, student, room, course])
+    db.flush()
+    db.add_all(
+        [
+            models.StudentStatusLog(student_id=1, status="active"),
+            models.ScheduleEntry(
+                course_id=1, class_id=1, teacher_id=1, room_id=1, weekday=1, start_slot=1, end_slot=2
+            ),
+            models.Grade(id=1, student_id=1, course_id=1, term_id=1, total_score=55, status="published"),
+            models.Exam(
+                course_id=1, class_id=1, term_id=1, exam_date=date.today(), start_time=time(9), duration_minutes=90
+            ),
+        ]
+    )
+    db.flush()
+    db.add(models.GradeAudit(grade_id=1, action="submit"))
+    db.commit()
+
+
+def _principal(user_id: int, role: str, **refs) -> Principal:
+    return Principal(
+        id=user_id,
+        username=role.lower(),
+        full_name=role,
+        email=None,
+        org_unit_id=None,
+        active=True,
+        role_codes=frozenset({role}),
+        **refs,
+    )
+
+
+ADMIN = _principal(99, "ADMIN")
+TEACHER = _principal(1, "TEACHER", teacher=TeacherRef(id=1, user_id=1))
+STUDENT = _principal(
+    2, "STUDENT", student=StudentRef(id=1, student_no="S1", class_id=1, class_info=ClassRef(1, "C1", "一班"))
+)
+
+BATCH = [
+    schemas.ScheduleCreate(course_id=1, class_id=1, teacher_id=1, room_id=1, weekday=1, start_slot=1, end_slot=2),
+    schemas.ScheduleCreate(course_id=1, class_id=2, teacher_id=2, weekday=1, start_slot=3, end_slot=4),
+]
+
+# (名称, 执行真实代码路径的函数, 允许全表扫描的表)
+CASES = [
+    ("timetable: class grid", lambda db: timetable_grid._load(db, timetable_grid.CLASS, 1), ()),
+    ("timetable: teacher grid", lambda db: timetable_grid._load(db, timetable_grid.TEACHER, 1), ()),
+    (
+        "schedule: conflict query",
+        lambda db: find_schedule_conflicts(db, 1, 1, 2, class_id=1, teacher_id=1, location="101", room_id=1),
+        (),
+    ),
+    ("schedule: batch candidates", lambda db: _batch_candidates(db, 1, BATCH), ()),
+    (
+        "schedule: list by room",
+        lambda db: db.query(models.ScheduleEntry)
+        .filter(models.ScheduleEntry.room_id == 1)
+        .order_by(models.ScheduleEntry.weekday, models.ScheduleEntry.start_slot)
+        .all(),
+        (),
+    ),
+    (
+        "grades: student latest",
+        lambda db: db.query(models.Grade)
+        .options(selectinload(models.Grade.course), selectinload(models.Grade.term), selectinload(models.Grade.audits))
+        .filter(models.Grade.student_id == 1)
+        .order_by(models.Grade.created_at.desc())
+        .limit(5)
+        .all(),
+        (),
+    ),
+    ("grades: teacher scope + course", lambda db: _grades_query(db, TEACHER, course_id=1).all(), ()),
+    ("grades: admin by class", lambda db: _grades_query(db, ADMIN, class_id=1).all(), ()),
+    ("grades: admin by status", lambda db: _grades_query(db, ADMIN, status_filter="submitted").all(), ()),
+    ("grades: publish by course", lambda db: db.query(models.Grade).filter(models.Grade.course_id == 1).all(), ()),
+    (
+        "grades: export by class",
+        lambda db: db.execute(exports.grade_select(list(exports.GRADE_COLUMNS), class_id=1)).all(),
+        (),
+    ),
+    ("analytics: course risk by term", lambda db: analytics.course_risk(db, term_id=1), ()),
+    ("analytics: course risk by class", lambda db: analytics.course_risk(db, class_id=1), ()),
+    ("exams: student", lambda db: _exams_query(db, STUDENT).all(), ()),
+    ("exams: teacher", lambda db: _exams_query(db, TEACHER).all(), ()),
+    ("exams: upcoming", lambda db: counters.upcoming_exams(db), ()),
+    (
+        "students: by class",
+        lambda db: db.query(models.Student)
+        .options(selectinload(models.Student.status_logs))
+        .filter(models.Student.class_id == 1)
+        .all(),
+        (),
+    ),
+    ("courses: by teacher", lambda db: db.query(models.Course).filter(models.Course.teacher_id == 1).all(), ()),
+    # 求解 / 监考分配需要全校的课表占用
+    ("solver: build problem", lambda db: timetable_solver.build_problem(db, 1), ("schedule_entries",)),
+    ("exams: allocation context", lambda db: exam_allocation.build_context(db, 1), ("schedule_entries",)),
+]
+
+
+def _full_scans(plan: list[str], allowed=()) -> list[str]:
+    return [
+        line
+        for line in plan
+        if (m := SCAN.match(line)) and m.group(1) in HOT_TABLES and m.group(1) not in allowed
+    ]
+
+
+def main(verbose: bool = False) -> int:
+    failures = 0
+    checked = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'plans.db')}")
+        Base.metadata.create_all(bind=engine)
+        with Session(bind=engine) as db:
+            _seed(db)
+        captured: list[tuple[str, object]] = []
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                captured.append((statement, parameters))
+
+        for name, run, allowed in CASES:
+            captured.clear()
+            with Session(bind=engine) as db:
+                run(db)
+                db.rollback()
+            statements = list(dict.fromkeys((s, tuple(p) if isinstance(p, list) else p) for s, p in captured))
+            with engine.connect() as conn:
+                event.remove(engine, "before_cursor_execute", _capture)
+                try:
+                    plans = [
+                        (s, [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + s, p)])
+                        for s, p in statements
+                    ]
+                finally:
+                    event.listen(engine, "before_cursor_execute", _capture)
+            scans = [line for _, plan in plans for line in _full_scans(plan, allowed)]
+            checked += len(plans)
+            failures += bool(scans)
+            print(f"{'FAIL' if scans else 'ok  '}  {name:<34} {len(plans)} stmt  {'; '.join(scans)}")
+            if verbose:
+                for statement, plan in plans:
+                    print("      " + " ".join(statement.split())[:160])
+                    for line in plan:
+                        print("        " + line)
+        engine.dispose()
+    print(f"{len(CASES)} cases, {checked} statements, {failures} with full scans on hot tables")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(verbose="-v" in sys.argv[1:]))
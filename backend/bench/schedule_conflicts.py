@@ -0,0 +1,88 @@
+"""Benchmark: SQL conflict query vs. in-memory slot-bitmap index.
+
+    python -m bench.schedule_conflicts [entries] [probes]
+
+在临时 SQLite 库中生成 ``entries`` 条排课（默认 5 万），对同一批随机探测分别走
+``find_schedule_conflicts``（SQL）与 ``schedule_index``，校验结果一致并输出耗时。
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app import models
+from app.db import Base
+from app.routers.api import find_schedule_conflicts
+from app.schedule_index import ScheduleConflictIndex
+
+CLASSES, TEACHERS, ROOMS, SLOTS = 500, 800, 300, 12
+
+
+def _entry(rng: random.Random) -> dict:
+    start = rng.randint(1, SLOTS - 1)
+    return {
+        "course_id": rng.randint(1, 3000),
+        "class_id": rng.randint(1, CLASSES),
+        "teacher_id": rng.randint(1, TEACHERS),
+        "room_id": rng.randint(1, ROOMS) if rng.random() < 0.8 else None,
+        "weekday": rng.randint(1, 7),
+        "start_slot": start,
+        "end_slot": min(SLOTS, start + rng.randint(0, 2)),
+        "location": f"场地{rng.randint(1, 200)}" if rng.random() < 0.3 else None,
+    }
+
+
+def main(entries: int = 50_000, probes: int = 2_000) -> int:
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'schedule.db')}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(insert(models.ScheduleEntry), [_entry(rng) for _ in range(entries)])
+        queries = []
+        for _ in range(probes):
+            e = _entry(rng)
+            queries.append(
+                dict(
+                    weekday=e["weekday"],
+                    start_slot=e["start_slot"],
+                    end_slot=e["end_slot"],
+                    class_id=e["class_id"],
+                    teacher_id=e["teacher_id"],
+                    location=e["location"],
+                    room_id=e["room_id"],
+                    exclude_id=rng.randint(1, entries) if rng.random() < 0.2 else None,
+                )
+            )
+        with Session(bind=engine) as db:
+            index = ScheduleConflictIndex()
+            started = time.perf_counter()
+            index.reload(db)
+            load = time.perf_counter() - started
+
+            started = time.perf_counter()
+            sql_results = [sorted(c.id for c in find_schedule_conflicts(db, **q)) for q in queries]
+            sql_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            idx_results = [[c.id for c in index.conflicts(**q)] for q in queries]
+            idx_time = time.perf_counter() - started
+
+            check = index.self_check(db)
+        engine.dispose()
+    mismatches = sum(1 for a, b in zip(sql_results, idx_results) if a != b)
+    print(f"entries {entries}, probes {probes}, index load {load * 1000:.0f} ms")
+    print(f"sql    : {sql_time / probes * 1e6:9.1f} us/check")
+    print(f"bitmap : {idx_time / probes * 1e6:9.1f} us/check  ({sql_time / idx_time:.0f}x)")
+    print(f"results identical: {mismatches == 0}  self-check consistent: {check['consistent']}")
+    return 0 if mismatches == 0 and check["consistent"] else 1
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(main(int(args[0]) if args else 50_000, int(args[1]) if len(args) > 1 else 2_000))
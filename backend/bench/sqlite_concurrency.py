@@ -0,0 +1,159 @@
+"""Benchmark: mixed read/write throughput on SQLite, default engine vs. ``sqlite_profile``.
+
+    python -m bench.sqlite_concurrency [seconds] [readers] [writers]
+
+同一份临时库上各跑一轮：
+
+- ``default``：与旧 ``app/db.py`` 相同的引擎（回滚日志模式，pysqlite 隐式事务），读写共用；
+- ``profile``：写引擎走 ``sqlite_profile`` 写通道 + ``BEGIN IMMEDIATE``，读引擎单独连接，WAL。
+
+写操作模拟录成绩：先查已有成绩，再插入 / 更新并递增计数；读操作模拟成绩列表（按课程联表查询）。
+输出每秒读写次数、延迟分位和 ``database is locked`` 之类的失败次数。
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, func, insert, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import models, sqlite_profile
+from app.db import Base
+
+STUDENTS, COURSES = 2000, 200
+
+
+def _seed(url: str) -> None:
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Term), [{"id": 1, "name": "T1"}])
+        conn.execute(insert(models.Class), [{"id": 1, "code": "C1", "name": "一班", "term_id": 1}])
+        conn.execute(
+            insert(models.User),
+            [{"id": i, "username": f"u{i}", "full_name": f"u{i}", "password_hash": "x"} for i in range(1, STUDENTS + 1)],
+        )
+        conn.execute(
+            insert(models.Student),
+            [{"id": i, "user_id": i, "class_id": 1, "student_no": f"S{i}"} for i in range(1, STUDENTS + 1)],
+        )
+        conn.execute(
+            insert(models.Course),
+            [{"id": i, "code": f"K{i}", "name": f"课程{i}", "term_id": 1, "class_id": 1} for i in range(1, COURSES + 1)],
+        )
+        conn.execute(
+            insert(models.Grade),
+            [
+                {"student_id": s, "course_id": c, "term_id": 1, "total_score": 60 + (s * c) % 40}
+                for c in range(1, COURSES + 1)
+                for s in range(1, 101)
+            ],
+        )
+        conn.execute(insert(models.DashboardCounter), [{"name": "published_grades", "value": 0}])
+    engine.dispose()
+
+
+def _write(db: Session, rng: random.Random) -> None:
+    student_id, course_id = rng.randint(1, STUDENTS), rng.randint(1, COURSES)
+    grade = (
+        db.query(models.Grade)
+        .filter(models.Grade.student_id == student_id, models.Grade.course_id == course_id)
+        .first()
+    )
+    score = rng.randint(30, 100)
+    if grade is None:
+        db.add(models.Grade(student_id=student_id, course_id=course_id, term_id=1, total_score=score))
+    else:
+        grade.total_score = score
+    db.execute(
+        update(models.DashboardCounter)
+        .where(models.DashboardCounter.name == "published_grades")
+        .values(value=models.DashboardCounter.value + 1, updated_at=datetime.utcnow())
+    )
+    db.commit()
+
+
+def _read(db: Session, rng: random.Random) -> None:
+    course_id = rng.randint(1, COURSES)
+    db.query(models.Grade, models.Student).join(models.Student).filter(models.Grade.course_id == course_id).all()
+    db.query(func.count(models.Grade.id)).filter(models.Grade.status == "published").scalar()
+
+
+def _run(write_factory, read_factory, seconds: float, readers: int, writers: int) -> dict:
+    stop = time.perf_counter() + seconds
+    lock = threading.Lock()
+    result = {"read": [], "write": [], "errors": 0}
+
+    def worker(kind: str, factory, seed: int):
+        rng = random.Random(seed)
+        op = _write if kind == "write" else _read
+        latencies = []
+        errors = 0
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                with factory() as db:
+                    op(db, rng)
+            except OperationalError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+        with lock:
+            result[kind] += latencies
+            result["errors"] += errors
+
+    threads = [threading.Thread(target=worker, args=("read", read_factory, i)) for i in range(readers)]
+    threads += [threading.Thread(target=worker, args=("write", write_factory, 100 + i)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return result
+
+
+def _pct(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+def main(seconds: float = 5.0, readers: int = 6, writers: int = 4) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        _seed(url)
+
+        # 旧配置：单引擎、默认日志模式
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+        factory = sessionmaker(bind=engine)
+        before = _run(factory, factory, seconds, readers, writers)
+        engine.dispose()
+
+        writer = create_engine(url, connect_args={"check_same_thread": False})
+        reader = create_engine(url, connect_args={"check_same_thread": False})
+        sqlite_profile.apply(writer, writer=True, lane=sqlite_profile.WriteLane())
+        sqlite_profile.apply(reader, writer=False)
+        after = _run(sessionmaker(bind=writer), sessionmaker(bind=reader), seconds, readers, writers)
+        writer.dispose()
+        reader.dispose()
+
+    print(f"{seconds:.0f}s per run, {readers} readers + {writers} writers")
+    print(f"{'':8} {'reads/s':>9} {'writes/s':>9} {'read p50/p95 ms':>17} {'write p50/p95 ms':>17} {'errors':>7}")
+    for name, r in (("default", before), ("profile", after)):
+        print(
+            f"{name:8} {len(r['read']) / seconds:9.0f} {len(r['write']) / seconds:9.0f} "
+            f"{_pct(r['read'], 0.5):8.1f}/{_pct(r['read'], 0.95):<8.1f} "
+            f"{_pct(r['write'], 0.5):8.1f}/{_pct(r['write'], 0.95):<8.1f} {r['errors']:7d}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(main(*(float(a) if i == 0 else int(a) for i, a in enumerate(args[:3]))))
@@ -0,0 +1,139 @@
+"""Benchmark: process cold start.
+
+    python -m bench.startup [runs]
+
+三项指标，均在子进程里测（模块级引擎读取 ``DATABASE_URL``，需要干净的进程）：
+
+- ``import app.main`` 耗时（取中位数）；
+- startup 钩子发出的 SQL 条数和耗时：空库 / 已是当前版本的库，对比旧的启动流程
+  （每次建表 + 补索引 + 演示数据 + 计数校准 + 排课索引 + 权限位表）；
+- 首个请求可用时间：启动 uvicorn，轮询 ``/health`` 直到返回 200。
+"""
+
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import app.main
+print(time.perf_counter() - started)
+"""
+
+# 旧版 startup() 的等价流程
+LEGACY_STARTUP = """
+def run_startup():
+    from app import counters
+    from app.db import SessionLocal, engine
+    from app.migrations import ensure_grade_unique_index, ensure_indexes
+    from app.permission_registry import permission_registry
+    from app.schedule_index import schedule_index
+    from app.seed import init_db_with_sample_data
+    from app.db import Base
+
+    Base.metadata.create_all(bind=engine)
+    init_db_with_sample_data()
+    ensure_grade_unique_index(engine)
+    ensure_indexes(engine)
+    with SessionLocal() as db:
+        permission_registry.rebuild(db)
+        counters.reconcile(db)
+        schedule_index.reload(db)
+"""
+
+CURRENT_STARTUP = """
+def run_startup():
+    from app.main import startup
+    startup()
+"""
+
+STARTUP_SNIPPET = """
+import json, time
+from sqlalchemy import event
+import app.main
+from app.db import engine
+statements = []
+event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+{run_startup}
+started = time.perf_counter()
+run_startup()
+print(json.dumps({{"seconds": time.perf_counter() - started, "statements": len(statements)}}))
+"""
+
+
+def _python(snippet: str, db_path: str) -> str:
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}"}
+    out = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=BACKEND, env=env, capture_output=True, text=True, check=True
+    )
+    return out.stdout.strip().splitlines()[-1]
+
+
+def _startup(flow: str, db_path: str) -> dict:
+    return json.loads(_python(STARTUP_SNIPPET.format(run_startup=flow), db_path))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _first_request(db_path: str, timeout: float = 60.0) -> float:
+    port = _free_port()
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}"}
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND,
+        env=env,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError("server did not answer /health")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main(runs: int = 5) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = os.path.join(tmp, "scratch.db")
+        imports = [float(_python(IMPORT_SNIPPET, scratch)) for _ in range(runs)]
+        print(f"import app.main: median {statistics.median(imports) * 1000:.0f} ms over {runs} runs")
+
+        print(f"{'startup':24} {'empty db':>20} {'current db':>20}")
+        for name, flow in (("legacy", LEGACY_STARTUP), ("schema-version gate", CURRENT_STARTUP)):
+            db_path = os.path.join(tmp, f"{name.split()[0]}.db")
+            cold = _startup(flow, db_path)
+            warm = _startup(flow, db_path)
+            print(
+                f"{name:24} {cold['statements']:6d} stmt {cold['seconds'] * 1000:7.0f} ms"
+                f" {warm['statements']:6d} stmt {warm['seconds'] * 1000:7.0f} ms"
+            )
+
+        # 已迁移的库上测首个请求（与生产发布流程一致）
+        served = os.path.join(tmp, "served.db")
+        _startup(CURRENT_STARTUP, served)
+        firsts = [_first_request(served) for _ in range(runs)]
+        print(f"time to first /health: median {statistics.median(firsts) * 1000:.0f} ms over {runs} runs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(a) for a in sys.argv[1:2])))